@@ -1,3 +1,5 @@
+import asyncio
+import concurrent.futures
 import enum
 import hashlib
 import logging
@@ -7,8 +9,10 @@ import passlib.context
 import starlette.authentication
 import starlette.requests
 
+import app.cache as cache
 import app.database as database
 import app.errors as errors
+import app.settings as settings
 
 
 logger = logging.getLogger(__name__)
@@ -20,16 +24,26 @@ logger = logging.getLogger(__name__)
 
 
 _CONTEXT = passlib.context.CryptContext(schemes=["argon2"], deprecated="auto")
+# Argon2 is deliberately slow. We run it in a bounded thread pool so that it doesn't
+# block the event loop; argon2-cffi releases the GIL while hashing. Excess requests
+# queue up in the executor.
+_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_WORKERS, thread_name_prefix="password"
+)
 
 
-def hash_password(password):
+async def hash_password(password):
     """Hash the given password and return the hash as string."""
-    return _CONTEXT.hash(password)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_EXECUTOR, _CONTEXT.hash, password)
 
 
-def verify_password(password, password_hash):
+async def verify_password(password, password_hash):
     """Return true if the password results in the hash, else False."""
-    return _CONTEXT.verify(password, password_hash)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _EXECUTOR, _CONTEXT.verify, password, password_hash
+    )
 
 
 ########################################################################################
@@ -47,21 +61,50 @@ def hash_token(token):
     return hashlib.sha512(token.encode("utf-8")).hexdigest()
 
 
+########################################################################################
+# Caches
+########################################################################################
+
+
+# Maps access token hashes to user identifiers
+_IDENTITIES = cache.Cache(
+    name="identities", size=settings.CACHE_SIZE, ttl=settings.CACHE_TTL
+)
+# Maps (resource type, user, network[, sensor]) tuples to relationships
+_RELATIONSHIPS = cache.Cache(
+    name="relationships", size=settings.CACHE_SIZE, ttl=settings.CACHE_TTL
+)
+
+
+def invalidate(user_identifier=None, network_identifier=None):
+    """Remove the cached relationships of the given user and/or network.
+
+    Call this on write paths that change the relationships between users and
+    resources, e.g. when creating networks, sensors, or permissions.
+    """
+    _RELATIONSHIPS.evict(
+        lambda key: (user_identifier is None or key[1] == user_identifier)
+        and (network_identifier is None or key[2] == network_identifier)
+    )
+
+
 ########################################################################################
 # Authentication middleware
 ########################################################################################
 
 
 class AuthenticationMiddleware:
-    """Validates Bearer authorization headers and provides the requester's identity.
+    """Validates Bearer authorization headers and provides the access token's hash.
 
-    The structure is adapted from Starlette's own AuthenticationMiddleware class.
+    The requester's identity is resolved lazily with `authenticate`, so that requests
+    that don't need it don't cost a database query. The structure is adapted from
+    Starlette's own AuthenticationMiddleware class.
     """
 
     def __init__(self, app):
         self.app = app
 
-    async def _authenticate(self, request):
+    def _extract(self, request):
         # Extract the access token from the authorization header
         if "authorization" not in request.headers:
             return None
@@ -73,31 +116,50 @@ class AuthenticationMiddleware:
         if scheme.lower() != "bearer":
             logger.warning("Malformed authorization header")
             return None
-        # Check if we have the access token in the database
-        query, arguments = database.parametrize(
-            identifier="authenticate",
-            arguments={"access_token_hash": hash_token(access_token)},
-        )
-        elements = await request.state.dbpool.fetch(query, *arguments)
-        elements = database.dictify(elements)
-        # If the result set is empty, the access token is invalid
-        if len(elements) == 0:
-            logger.warning("Invalid access token")
-            return None
-        # Return the requester's identity
-        return elements[0]["user_identifier"]
+        return hash_token(access_token)
 
     async def __call__(self, scope, receive, send):
         # Only process HTTP requests, not websockets
         if scope["type"] != "http":
             await self.app(scope, receive, send)
             return
-        # Authenticate and pass the result through to the route
+        # Pass the access token's hash through to the route
         request = starlette.requests.Request(scope)
-        request.state.identity = await self._authenticate(request)
+        request.state.access_token_hash = self._extract(request)
         await self.app(scope, receive, send)
 
 
+async def _authenticate(request):
+    access_token_hash = request.state.access_token_hash
+    if access_token_hash is None:
+        return None
+    if (identity := _IDENTITIES.get(access_token_hash)) is not None:
+        return identity
+    # Check if we have the access token in the database
+    query, arguments = database.parametrize(
+        identifier="authenticate",
+        arguments={"access_token_hash": access_token_hash},
+    )
+    elements = await request.state.dbpool.fetch(query, *arguments)
+    elements = database.dictify(elements)
+    # If the result set is empty, the access token is invalid
+    if len(elements) == 0:
+        logger.warning("Invalid access token")
+        return None
+    _IDENTITIES.set(access_token_hash, elements[0]["user_identifier"])
+    return elements[0]["user_identifier"]
+
+
+async def authenticate(request):
+    """Return the requester's identity or None if they're not authenticated.
+
+    The access token is resolved at most once per request.
+    """
+    if not hasattr(request.state, "identity"):
+        request.state.identity = await _authenticate(request)
+    return request.state.identity
+
+
 ########################################################################################
 # Authorization helpers
 ########################################################################################
@@ -123,7 +185,7 @@ class Resource:
 
 class User(Resource):
     async def _authorize(self, request):
-        if request.state.identity is None:
+        if await authenticate(request) is None:
             return Relationship.NONE
         if request.state.identity == self.identifier:
             return Relationship.OWNER
@@ -132,8 +194,11 @@ class User(Resource):
 
 class Network(Resource):
     async def _authorize(self, request):
-        if request.state.identity is None:
+        if await authenticate(request) is None:
             return Relationship.NONE
+        key = ("network", request.state.identity, self.identifier)
+        if (relationship := _RELATIONSHIPS.get(key)) is not None:
+            return relationship
         query, arguments = database.parametrize(
             identifier="authorize-resource-network",
             arguments={
@@ -143,19 +208,69 @@ class Network(Resource):
         )
         elements = await request.state.dbpool.fetch(query, *arguments)
         elements = database.dictify(elements)
+        # Nonexistent resources are not cached, they could be created at any time
         if len(elements) == 0:
             raise errors.NotFoundError
-        return (
+        relationship = (
             Relationship.DEFAULT
             if elements[0]["user_identifier"] is None
             else Relationship.OWNER
         )
+        _RELATIONSHIPS.set(key, relationship)
+        return relationship
 
 
 class Sensor(Resource):
+    def _key(self, identity):
+        return (
+            "sensor",
+            identity,
+            self.identifier["network_identifier"],
+            self.identifier["sensor_identifier"],
+        )
+
+    async def _authenticate_and_authorize(self, request):
+        """Resolve the access token and the relationship in a single query."""
+        query, arguments = database.parametrize(
+            identifier="authenticate-and-authorize-resource-sensor",
+            arguments={
+                "access_token_hash": request.state.access_token_hash,
+                "network_identifier": self.identifier["network_identifier"],
+                "sensor_identifier": self.identifier["sensor_identifier"],
+            },
+        )
+        elements = await request.state.dbpool.fetch(query, *arguments)
+        element = database.dictify(elements)[0]
+        request.state.identity = element["user_identifier"]
+        if request.state.identity is None:
+            logger.warning("Invalid access token")
+            return Relationship.NONE
+        _IDENTITIES.set(request.state.access_token_hash, request.state.identity)
+        if element["sensor_identifier"] is None:
+            raise errors.NotFoundError
+        relationship = (
+            Relationship.DEFAULT
+            if element["permission_identifier"] is None
+            else Relationship.OWNER
+        )
+        _RELATIONSHIPS.set(self._key(request.state.identity), relationship)
+        return relationship
+
     async def _authorize(self, request):
+        if not hasattr(request.state, "identity"):
+            access_token_hash = request.state.access_token_hash
+            if access_token_hash is None:
+                request.state.identity = None
+            elif (identity := _IDENTITIES.get(access_token_hash)) is not None:
+                request.state.identity = identity
+            else:
+                # Without a cached identity, there can't be a cached relationship
+                return await self._authenticate_and_authorize(request)
         if request.state.identity is None:
             return Relationship.NONE
+        key = self._key(request.state.identity)
+        if (relationship := _RELATIONSHIPS.get(key)) is not None:
+            return relationship
         query, arguments = database.parametrize(
             identifier="authorize-resource-sensor",
             arguments={
@@ -168,11 +283,13 @@ class Sensor(Resource):
         elements = database.dictify(elements)
         if len(elements) == 0:
             raise errors.NotFoundError
-        return (
+        relationship = (
             Relationship.DEFAULT
             if elements[0]["user_identifier"] is None
             else Relationship.OWNER
         )
+        _RELATIONSHIPS.set(key, relationship)
+        return relationship
 
 
 async def authorize(request, resource):
@@ -0,0 +1,59 @@
+import collections
+import time
+
+import app.metrics as metrics
+
+
+_HITS = metrics.Counter(
+    name="cache_hits",
+    description="Number of lookups that were answered from the cache",
+    label="cache",
+)
+_MISSES = metrics.Counter(
+    name="cache_misses",
+    description="Number of lookups that were missing or expired in the cache",
+    label="cache",
+)
+
+
+class Cache:
+    """Least-recently-used cache whose entries expire after a fixed time to live.
+
+    The cache is local to the process. Entries that can become stale through writes
+    must be invalidated explicitly; Other processes rely on the time to live.
+    """
+
+    def __init__(self, name, size, ttl):
+        self.name = name
+        self.size = size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value or None if it's missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            _MISSES.increment(self.name)
+            return None
+        self._entries.move_to_end(key)
+        _HITS.increment(self.name)
+        return entry[0]
+
+    def set(self, key, value):
+        """Cache the value and evict the least recently used entry if we're full."""
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def evict(self, predicate):
+        """Remove all entries whose key satisfies the predicate."""
+        for key in [key for key in self._entries.keys() if predicate(key)]:
+            del self._entries[key]
+
+    def clear(self):
+        """Remove all entries."""
+        self._entries.clear()
@@ -1,23 +1,89 @@
 import contextlib
+import datetime
 import json
+import operator
 import os
 import string
+import time
 
 import asyncpg
-import pendulum
 
+import app.metrics as metrics
 import app.settings as settings
 
 
+_WAIT = metrics.Histogram(
+    name="database_acquire_seconds",
+    description="Time spent waiting for a connection from the pool",
+    label="pool",
+)
+_BUSY = metrics.Gauge(
+    name="database_busy_connections",
+    description="Number of connections currently acquired from the pool",
+    label="pool",
+)
+_SIZE = metrics.Gauge(
+    name="database_connections",
+    description="Number of open connections in the pool",
+    label="pool",
+)
+_IDLE = metrics.Gauge(
+    name="database_idle_connections",
+    description="Number of open connections in the pool that are not acquired",
+    label="pool",
+)
+# The open pools, by name
+_POOLS = {}
+
+
+def _collect():
+    # The pools track their sizes themselves, so we only read them when scraped
+    for name, x in _POOLS.items():
+        _SIZE.set(x.get_size(), name)
+        _IDLE.set(x.get_idle_size(), name)
+
+
+metrics.COLLECTORS.append(_collect)
+
+
+class Query:
+    """SQL query with named arguments, compiled to native numbered arguments."""
+
+    def __init__(self, template):
+        template = string.Template(template)
+        # Get a list of the query argument names from the template
+        self.keys = tuple(template.get_identifiers())
+        self.keyset = frozenset(self.keys)
+        # Replace named arguments with native numbered arguments
+        self.sql = template.substitute(
+            {key: f"${i+1}" for i, key in enumerate(self.keys)}
+        )
+        # Build the argument tuple in C if all arguments are given
+        if len(self.keys) == 0:
+            self._getter = lambda arguments: ()
+        elif len(self.keys) == 1:
+            getter = operator.itemgetter(self.keys[0])
+            self._getter = lambda arguments: (getter(arguments),)
+        else:
+            self._getter = operator.itemgetter(*self.keys)
+
+    def order(self, arguments):
+        """Build the argument tuple and fill missing arguments with None."""
+        try:
+            return self._getter(arguments)
+        except KeyError:
+            return tuple(map(arguments.get, self.keys))
+
+
 def prepare():
-    """Load SQL queries from `queries.sql` file."""
+    """Load and compile SQL queries from `queries.sql` file."""
     with open(os.path.join(os.path.dirname(__file__), "queries.sql"), "r") as file:
         statements = file.read().split("\n\n\n")
         # Validate format
         assert all(statement.startswith("-- name: ") for statement in statements)
         assert not any("\n-- name: " in statement for statement in statements)
         return {
-            statement.split("\n", 1)[0][9:]: statement.split("\n", 1)[1]
+            statement.split("\n", 1)[0][9:]: Query(statement.split("\n", 1)[1])
             for statement in statements
         }
 
@@ -27,22 +93,15 @@ queries = prepare()
 
 def parametrize(identifier, arguments):
     """Return the query and translate named arguments into valid PostgreSQL."""
-    template = string.Template(queries[identifier])
+    query = queries[identifier]
     single = isinstance(arguments, dict)
-    # Get a list of the query argument names from the template
-    keys = template.get_identifiers()
     # Raise an error if unknown arguments are passed
-    if diff := set(arguments.keys() if single else arguments[0].keys()) - set(keys):
+    if not query.keyset.issuperset(arguments if single else arguments[0]):
+        diff = set(arguments if single else arguments[0]) - query.keyset
         raise ValueError(f"Unknown query arguments: {diff}")
-    # Replace named arguments with native numbered arguments
-    query = template.substitute({key: f"${i+1}" for i, key in enumerate(keys)})
-    # Build argument tuple and fill missing arguments with None
-    arguments = (
-        tuple(arguments.get(key) for key in keys)
-        if single
-        else [tuple(x.get(key) for key in keys) for x in arguments]
-    )
-    return query, arguments
+    if single:
+        return query.sql, query.order(arguments)
+    return query.sql, [query.order(x) for x in arguments]
 
 
 def dictify(elements):
@@ -52,32 +111,187 @@ def dictify(elements):
     return [dict(record) for record in elements]
 
 
+# Offset between the unix epoch and PostgreSQL's epoch (2000-01-01) in microseconds
+_EPOCH = 946684800_000000
+
+
+def _encode_timestamp(x):
+    return (round(x * 1_000_000) - _EPOCH,)
+
+
+def _decode_timestamp(x):
+    return (x[0] + _EPOCH) / 1_000_000
+
+
+def _encode_json(x):
+    # The binary JSONB format is the JSON text prefixed with a version number
+    return b"\x01" + json.dumps(x).encode()
+
+
+def _decode_json(x):
+    return json.loads(x[1:])
+
+
+def _encode_uuid(x):
+    return bytes.fromhex(x.replace("-", ""))
+
+
+def _decode_uuid(x):
+    x = x.hex()
+    return f"{x[:8]}-{x[8:12]}-{x[12:16]}-{x[16:20]}-{x[20:]}"
+
+
 async def initialize(connection):
+    # All codecs use the binary wire format, which spares PostgreSQL and us from
+    # formatting and parsing text
     # Automatically encode/decode TIMESTAMPTZ fields to/from unix timestamps
     await connection.set_type_codec(
         typename="timestamptz",
         schema="pg_catalog",
-        encoder=lambda x: pendulum.from_timestamp(x).isoformat(),
-        decoder=lambda x: pendulum.parse(x).float_timestamp,
+        encoder=_encode_timestamp,
+        decoder=_decode_timestamp,
+        format="tuple",
     )
     # Automatically encode/decode JSONB fields to/from str
     await connection.set_type_codec(
         typename="jsonb",
         schema="pg_catalog",
-        encoder=json.dumps,
-        decoder=json.loads,
+        encoder=_encode_json,
+        decoder=_decode_json,
+        format="binary",
     )
     # Automatically encode/decode UUID fields to/from str
     await connection.set_type_codec(
         typename="uuid",
         schema="pg_catalog",
-        encoder=str,
-        decoder=str,
+        encoder=_encode_uuid,
+        decoder=_decode_uuid,
+        format="binary",
+    )
+
+
+# Statements on the hot paths of the routes and the MQTT ingestion
+_HOT = (
+    "authenticate",
+    "authenticate-and-authorize-resource-sensor",
+    "authorize-resource-sensor",
+    "create-measurements",
+    "create-log",
+    "read-next-measurements",
+    "read-previous-measurements",
+    "read-latest-measurements",
+    "read-network-latest-measurements",
+    "read-network",
+    "update-sensor-latest",
+    "read-next-logs",
+    "read-previous-logs",
+)
+
+
+async def warm(connection):
+    """Prepare the hot statements so that their first execution skips parsing."""
+    for identifier in _HOT:
+        # The public connection.prepare() bypasses the statement cache that fetch()
+        # and execute() use (it prepares with use_cache=False), so warming with it
+        # would have no effect; We go through the cache directly. test_warm checks
+        # that later executions reuse these statements.
+        await connection._get_statement(queries[identifier].sql, timeout=None)
+
+
+async def _initialize(connection):
+    await initialize(connection)
+    if settings.POSTGRESQL_PREPARE and settings.POSTGRESQL_STATEMENT_CACHE_SIZE > 0:
+        await warm(connection)
+
+
+class Pool:
+    """Wrapper around an asyncpg pool that records how long acquiring takes.
+
+    Offers the subset of the asyncpg pool interface that we use.
+    """
+
+    def __init__(self, name, pool):
+        self.name = name
+        self._pool = pool
+
+    def get_size(self):
+        return self._pool.get_size()
+
+    def get_idle_size(self):
+        return self._pool.get_idle_size()
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        start = time.perf_counter()
+        async with self._pool.acquire() as connection:
+            _WAIT.observe(time.perf_counter() - start, self.name)
+            _BUSY.increment(self.name)
+            try:
+                yield connection
+            finally:
+                _BUSY.decrement(self.name)
+
+    async def fetch(self, query, *arguments):
+        async with self.acquire() as connection:
+            return await connection.fetch(query, *arguments)
+
+    async def fetchval(self, query, *arguments):
+        async with self.acquire() as connection:
+            return await connection.fetchval(query, *arguments)
+
+    async def execute(self, query, *arguments):
+        async with self.acquire() as connection:
+            return await connection.execute(query, *arguments)
+
+    async def executemany(self, query, arguments):
+        async with self.acquire() as connection:
+            return await connection.executemany(query, arguments)
+
+
+# Number of days that the continuous aggregates are refreshed for, see schema.sql;
+# Measurements must not be deleted before they are aggregated
+_REFRESH_DAYS = 10
+
+
+async def apply_policies(dbpool):
+    """Bring the compression and retention policies of the measurements in line with
+    the settings.
+
+    Policies are only replaced if they changed, as replacing them reschedules their
+    jobs. Concurrently starting processes don't conflict, since adding and removing
+    policies is idempotent.
+    """
+    compression = datetime.timedelta(days=settings.MEASUREMENT_COMPRESSION_DAYS)
+    retention = (
+        None
+        if settings.MEASUREMENT_RETENTION_DAYS is None
+        else datetime.timedelta(days=settings.MEASUREMENT_RETENTION_DAYS)
     )
+    if retention is not None and retention.days <= _REFRESH_DAYS:
+        raise ValueError(f"Retention must be longer than {_REFRESH_DAYS} days")
+    query, arguments = parametrize("read-measurement-policies", {})
+    element = (await dbpool.fetch(query, *arguments))[0]
+    for kind, current, target in [
+        ("compression", element["compress_after"], compression),
+        ("retention", element["drop_after"], retention),
+    ]:
+        if current == target:
+            continue
+        query, arguments = parametrize(f"delete-measurement-{kind}-policy", {})
+        await dbpool.execute(query, *arguments)
+        if target is not None:
+            query, arguments = parametrize(
+                f"create-measurement-{kind}-policy", {"days": target.days}
+            )
+            await dbpool.execute(query, *arguments)
 
 
 @contextlib.asynccontextmanager
-async def pool():
+async def pool(
+    name="api",
+    min_size=settings.POSTGRESQL_POOL_MIN_SIZE,
+    max_size=settings.POSTGRESQL_POOL_MAX_SIZE,
+):
     """Context manager for asyncpg database pool with custom settings."""
     async with asyncpg.create_pool(
         host=settings.POSTGRESQL_HOSTNAME,
@@ -85,10 +299,18 @@ async def pool():
         user=settings.POSTGRESQL_IDENTIFIER,
         password=settings.POSTGRESQL_PASSWORD,
         database=settings.POSTGRESQL_DATABASE,
-        min_size=2,
-        max_size=4,
+        min_size=min_size,
+        max_size=max_size,
         max_queries=16384,
         max_inactive_connection_lifetime=300,
-        init=initialize,
+        statement_cache_size=settings.POSTGRESQL_STATEMENT_CACHE_SIZE,
+        # Runs for every new connection, including when connections are recycled
+        init=_initialize,
     ) as x:
-        yield x
+        _POOLS[name] = Pool(name, x)
+        try:
+            yield _POOLS[name]
+        finally:
+            del _POOLS[name]
+            for gauge in (_SIZE, _IDLE):
+                gauge.values.pop(name, None)
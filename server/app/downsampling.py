@@ -0,0 +1,48 @@
+import numpy as np
+
+
+########################################################################################
+# Largest-Triangle-Three-Buckets downsampling
+########################################################################################
+
+
+def lttb(x, y, threshold):
+    """Return the indices of the points selected by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. The other points are split into
+    equally sized buckets, from each of which we keep the point that forms the
+    largest triangle with the previously kept point and the average of the next
+    bucket. Unlike averaging, this preserves peaks and outliers. The x values must
+    be sorted ascendingly.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1][:threshold], dtype=np.intp)
+    # Bucket i spans [bounds[i], bounds[i + 1]); The last bucket is the last point
+    bounds = np.empty(threshold, dtype=np.intp)
+    bounds[:-1] = np.floor(np.arange(threshold - 1) * ((n - 2) / (threshold - 2))) + 1
+    bounds[-1] = n
+    # Compute the averages of all buckets at once with cumulative sums
+    cx = np.concatenate(([0], np.cumsum(x)))
+    cy = np.concatenate(([0], np.cumsum(y)))
+    sizes = bounds[1:] - bounds[:-1]
+    averages_x = (cx[bounds[1:]] - cx[bounds[:-1]]) / sizes
+    averages_y = (cy[bounds[1:]] - cy[bounds[:-1]]) / sizes
+    indices = np.empty(threshold, dtype=np.intp)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    # Each bucket depends on the point selected in the previous one, so we iterate
+    # over the buckets and vectorize over the points within a bucket
+    for i in range(threshold - 2):
+        start, end = bounds[i], bounds[i + 1]
+        areas = np.abs(
+            (x[a] - averages_x[i + 1]) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (averages_y[i + 1] - y[a])
+        )
+        a = start + np.argmax(areas)
+        indices[i + 1] = a
+    return indices
@@ -0,0 +1,167 @@
+import csv
+import io
+import json
+
+import pyarrow
+import pyarrow.ipc
+import pyarrow.parquet
+
+import app.database as database
+
+
+########################################################################################
+# Streaming exports of a sensor's time series
+########################################################################################
+
+
+# Number of rows fetched from the database per round trip and emitted per chunk
+CHUNK_SIZE = 1024
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _ndjson(records):
+    return "".join(json.dumps(dict(record)) + "\n" for record in records)
+
+
+def _csv(records):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(records)
+    return buffer.getvalue()
+
+
+_FORMATTERS = {
+    "ndjson": _ndjson,
+    "csv": _csv,
+}
+
+
+async def stream(dbpool, identifier, arguments, format):
+    """Stream the results of the query in chunks in constant memory.
+
+    The rows are read through a server-side cursor, so the result set is never held
+    in memory as a whole. If the client disconnects, starlette cancels the generator,
+    which rolls back the transaction and releases the connection.
+    """
+    query, arguments = database.parametrize(identifier, arguments)
+    formatter = _FORMATTERS[format]
+    async with dbpool.acquire() as connection:
+        # Cursors only live within a transaction
+        async with connection.transaction(readonly=True):
+            statement = await connection.prepare(query)
+            keys = [attribute.name for attribute in statement.get_attributes()]
+            cursor = await statement.cursor(*arguments)
+            if format == "csv":
+                yield _csv([keys])
+            while records := await cursor.fetch(CHUNK_SIZE):
+                yield formatter(records)
+
+
+########################################################################################
+# Columnar exports of a sensor's measurements
+########################################################################################
+
+
+# Number of measurement rows per record batch; Parquet writes each batch as a row
+# group, which should not be too small for the format to compress well
+COLUMNAR_CHUNK_SIZE = 65536
+
+
+class _Sink:
+    """Write-only file that hands out what was written since the last call."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Parquet stores absolute offsets in the footer, so this must not reset
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _pivot(records, schema):
+    """Turn consecutive elements of the same data point into one row per point."""
+    index = {name: i for i, name in enumerate(schema.names[2:])}
+    timestamps, revisions, columns = [], [], [[] for _ in index]
+    key = None
+    for timestamp, revision, attribute, value in records:
+        if (timestamp, revision) != key:
+            key = (timestamp, revision)
+            timestamps.append(round(timestamp * 1_000_000))
+            revisions.append(revision)
+            for column in columns:
+                column.append(None)
+        columns[index[attribute]][-1] = value
+    return pyarrow.RecordBatch.from_arrays(
+        [timestamps, revisions, *columns], schema=schema
+    )
+
+
+async def stream_columnar(dbpool, arguments, format):
+    """Stream the measurements as Arrow IPC stream or Parquet with one column per
+    attribute, pivoted from the elements in chunks in constant memory.
+    """
+    async with dbpool.acquire() as connection:
+        # Read the attributes and the measurements from the same snapshot, so that
+        # the schema covers all attributes in the export
+        async with connection.transaction(isolation="repeatable_read", readonly=True):
+            query, parameters = database.parametrize("read-attributes", arguments)
+            elements = await connection.fetch(query, *parameters)
+            schema = pyarrow.schema(
+                [
+                    ("creation_timestamp", pyarrow.timestamp("us", tz="UTC")),
+                    ("revision", pyarrow.int32()),
+                    *[
+                        (element["attribute"], pyarrow.float64())
+                        for element in elements
+                    ],
+                ]
+            )
+            sink = _Sink()
+            writer = (
+                pyarrow.ipc.new_stream(sink, schema)
+                if format == "arrow"
+                else pyarrow.parquet.ParquetWriter(sink, schema)
+            )
+            query, parameters = database.parametrize("export-measurements", arguments)
+            cursor = await connection.cursor(query, *parameters)
+            pending = []
+            while records := await cursor.fetch(COLUMNAR_CHUNK_SIZE):
+                records = pending + records
+                # Hold back the last data point, its elements may continue in the
+                # next chunk
+                split = len(records)
+                key = (records[-1][0], records[-1][1])
+                while (
+                    split > 0 and (records[split - 1][0], records[split - 1][1]) == key
+                ):
+                    split -= 1
+                records, pending = records[:split], records[split:]
+                if records:
+                    writer.write_batch(_pivot(records, schema))
+                    yield sink.take()
+            if pending:
+                writer.write_batch(_pivot(pending, schema))
+            writer.close()
+            yield sink.take()
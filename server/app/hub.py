@@ -0,0 +1,79 @@
+import asyncio
+import collections
+import contextlib
+import json
+
+import app.metrics as metrics
+
+
+########################################################################################
+# In-process publish/subscribe of the data that sensors send
+########################################################################################
+
+
+# Maximum number of events waiting per subscriber before we drop events for it
+QUEUE_SIZE = 64
+
+_SUBSCRIBERS = collections.defaultdict(set)
+
+_SUBSCRIPTIONS = metrics.Gauge(
+    name="hub_subscriptions",
+    description="Number of clients subscribed to live sensor data",
+)
+_DROPPED = metrics.Counter(
+    name="hub_dropped_events",
+    description="Number of events dropped because a subscriber didn't keep up",
+)
+
+
+@contextlib.contextmanager
+def subscribe(sensor_identifier):
+    """Provide a queue that receives the events of the sensor until the exit."""
+    queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    _SUBSCRIBERS[sensor_identifier].add(queue)
+    _SUBSCRIPTIONS.increment()
+    try:
+        yield queue
+    finally:
+        _SUBSCRIPTIONS.decrement()
+        _SUBSCRIBERS[sensor_identifier].discard(queue)
+        if not _SUBSCRIBERS[sensor_identifier]:
+            del _SUBSCRIBERS[sensor_identifier]
+
+
+def subscribed(sensor_identifier):
+    """Return whether anyone is subscribed to the sensor's events."""
+    return sensor_identifier in _SUBSCRIBERS
+
+
+def publish(sensor_identifier, kind, elements):
+    """Send an event to all subscribers of the sensor without waiting.
+
+    The elements are encoded once per event, not per subscriber. Slow subscribers
+    miss events instead of holding up the ingestion.
+    """
+    if sensor_identifier not in _SUBSCRIBERS:
+        return
+    event = (kind, json.dumps(elements))
+    for queue in _SUBSCRIBERS[sensor_identifier]:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            _DROPPED.increment()
+
+
+async def stream(sensor_identifier, heartbeat=15):
+    """Stream the sensor's events in the Server-Sent Events format.
+
+    Comments are sent regularly when there are no events, so that proxies don't close
+    the idle connection. If the client disconnects, starlette cancels the generator,
+    which ends the subscription.
+    """
+    with subscribe(sensor_identifier) as queue:
+        while True:
+            try:
+                kind, data = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            yield f"event: {kind}\ndata: {data}\n\n"
@@ -11,10 +11,15 @@ import starlette.routing
 
 import app.auth as auth
 import app.database as database
+import app.downsampling as downsampling
 import app.errors as errors
+import app.export as export
+import app.hub as hub
 import app.logs as logs
+import app.metrics as metrics
 import app.mqtt as mqtt
 import app.settings as settings
+import app.utils as utils
 import app.validation as validation
 
 
@@ -33,9 +38,20 @@ async def read_status(request, values):
     )
 
 
+@validation.validate(schema=validation.ReadMetricsRequest)
+async def read_metrics(request, values):
+    if not settings.METRICS:
+        raise errors.NotFoundError
+    return starlette.responses.PlainTextResponse(
+        status_code=200,
+        content=metrics.render(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
 @validation.validate(schema=validation.CreateUserRequest)
 async def create_user(request, values):
-    password_hash = auth.hash_password(values.body["password"])
+    password_hash = await auth.hash_password(values.body["password"])
     access_token = auth.generate_token()
     access_token_hash = auth.hash_token(access_token)
     async with request.state.dbpool.acquire() as connection:
@@ -86,7 +102,7 @@ async def create_session(request, values):
     user_identifier = elements[0]["user_identifier"]
     password_hash = elements[0]["password_hash"]
     # Check if password hashes match
-    if not auth.verify_password(values.body["password"], password_hash):
+    if not await auth.verify_password(values.body["password"], password_hash):
         logger.warning(f"{request.method} {request.url.path} -- Invalid password")
         raise errors.UnauthorizedError
     access_token = auth.generate_token()
@@ -108,7 +124,9 @@ async def create_session(request, values):
 
 @validation.validate(schema=validation.CreateNetworkRequest)
 async def create_network(request, values):
-    relationship = await auth.authorize(request, auth.User(request.state.identity))
+    relationship = await auth.authorize(
+        request, auth.User(await auth.authenticate(request))
+    )
     if relationship < auth.Relationship.DEFAULT:
         # We don't check for < OWNER because a user is always it's own owner
         raise errors.UnauthorizedError
@@ -141,6 +159,8 @@ async def create_network(request, values):
                 # This can happen if the user is deleted after the permissions check
                 logger.warning(f"{request.method} {request.url.path} -- User not found")
                 raise errors.UnauthorizedError
+    # The user now has a new relationship
+    auth.invalidate(user_identifier=request.state.identity)
     # Return successful response
     return starlette.responses.JSONResponse(
         status_code=201,
@@ -151,7 +171,9 @@ async def create_network(request, values):
 @validation.validate(schema=validation.ReadNetworksRequest)
 async def read_networks(request, values):
     """Read the networks the user has permissions for."""
-    relationship = await auth.authorize(request, auth.User(request.state.identity))
+    relationship = await auth.authorize(
+        request, auth.User(await auth.authenticate(request))
+    )
     if relationship < auth.Relationship.DEFAULT:
         # We don't check for < OWNER because a user is always it's own owner
         raise errors.UnauthorizedError
@@ -165,6 +187,28 @@ async def read_networks(request, values):
     )
 
 
+@validation.validate(schema=validation.ReadNetworkRequest)
+async def read_network(request, values):
+    """Read the state of all sensors in the network."""
+    relationship = await auth.authorize(
+        request, auth.Network(values.path["network_identifier"])
+    )
+    if relationship < auth.Relationship.DEFAULT:
+        raise errors.UnauthorizedError
+    if relationship < auth.Relationship.OWNER:
+        raise errors.ForbiddenError
+    query, arguments = database.parametrize(
+        identifier="read-network",
+        arguments={"network_identifier": values.path["network_identifier"]},
+    )
+    # The query returns the sensors as JSON text, which we pass through unparsed
+    element = await request.state.dbpool.fetchval(query, *arguments)
+    # Return successful response
+    return starlette.responses.Response(
+        status_code=200, content=element, media_type="application/json"
+    )
+
+
 @validation.validate(schema=validation.CreateSensorRequest)
 async def create_sensor(request, values):
     relationship = await auth.authorize(
@@ -197,6 +241,8 @@ async def create_sensor(request, values):
         logger.warning(f"{request.method} {request.url.path} -- Uniqueness violation")
         raise errors.ConflictError
     sensor_identifier = database.dictify(elements)[0]["sensor_identifier"]
+    # The network's users now have relationships with the new sensor
+    auth.invalidate(network_identifier=values.path["network_identifier"])
     # Return successful response
     return starlette.responses.JSONResponse(
         status_code=201,
@@ -263,6 +309,49 @@ async def update_sensor(request, values):
     return starlette.responses.JSONResponse(status_code=200, content={})
 
 
+@validation.validate(schema=validation.CreateConfigurationsRequest)
+async def create_configurations(request, values):
+    """Roll out a configuration to multiple sensors of a network at once."""
+    relationship = await auth.authorize(
+        request, auth.Network(values.path["network_identifier"])
+    )
+    if relationship < auth.Relationship.DEFAULT:
+        raise errors.UnauthorizedError
+    if relationship < auth.Relationship.OWNER:
+        raise errors.ForbiddenError
+    sensor_identifiers = values.body["sensor_identifiers"]
+    if sensor_identifiers is not None:
+        sensor_identifiers = list(set(sensor_identifiers))
+    query, arguments = database.parametrize(
+        identifier="create-configurations",
+        arguments={
+            "network_identifier": values.path["network_identifier"],
+            "sensor_identifiers": sensor_identifiers,
+            "configuration": values.body["configuration"],
+        },
+    )
+    async with request.state.dbpool.acquire() as connection:
+        # Either all selected sensors get the configuration or none
+        async with connection.transaction():
+            elements = await connection.fetch(query, *arguments)
+            # Selected sensors that aren't part of the network are not found
+            missing = set(sensor_identifiers or []) - {
+                element["sensor_identifier"] for element in elements
+            }
+            if missing:
+                logger.warning(
+                    f"{request.method} {request.url.path} -- Sensors not found:"
+                    f" {missing}"
+                )
+                raise errors.NotFoundError
+    # The configurations are published over MQTT in the background
+    request.state.outbox.wake()
+    # Return successful response
+    return starlette.responses.JSONResponse(
+        status_code=201, content=database.dictify(elements)
+    )
+
+
 @validation.validate(schema=validation.CreateConfigurationRequest)
 async def create_configuration(request, values):
     relationship = await auth.authorize(
@@ -285,20 +374,14 @@ async def create_configuration(request, values):
             "configuration": values.body,
         },
     )
-    try:
-        elements = await request.state.dbpool.fetch(query, *arguments)
-    except asyncpg.ForeignKeyViolationError:
+    elements = await request.state.dbpool.fetch(query, *arguments)
+    # This can happen if the sensor is deleted after the permissions check
+    if len(elements) == 0:
         logger.warning(f"{request.method} {request.url.path} -- Sensor not found")
         raise errors.NotFoundError
     revision = database.dictify(elements)[0]["revision"]
-    # Send MQTT message with configuration
-    await mqtt.publish_configuration(
-        sensor_identifier=values.path["sensor_identifier"],
-        revision=revision,
-        configuration=values.body,
-        client=request.state.client,
-        dbpool=request.state.dbpool,
-    )
+    # The configuration is published over MQTT in the background
+    request.state.outbox.wake()
     # Return successful response
     return starlette.responses.JSONResponse(
         status_code=201,
@@ -329,16 +412,31 @@ async def read_configurations(request, values):
             "direction": values.query["direction"],
         },
     )
-    elements = await request.state.dbpool.fetch(query, *arguments)
+    # The query returns the page as JSON text, which we pass through unparsed
+    element = await request.state.dbpool.fetchval(query, *arguments)
     # Return successful response
-    return starlette.responses.JSONResponse(
-        status_code=200,
-        content=database.dictify(
-            elements if values.query["direction"] == "next" else reversed(elements)
-        ),
+    return starlette.responses.Response(
+        status_code=200, content=element, media_type="application/json"
     )
 
 
+# Resolutions of the measurement aggregations in seconds, from coarsest to finest
+_RESOLUTIONS = {
+    "1-day": 86400,
+    "1-hour": 3600,
+    "15-minutes": 900,
+    "1-minute": 60,
+}
+
+
+def _resolve(start_timestamp, end_timestamp, points):
+    """Return the coarsest resolution with at least the given number of buckets."""
+    for resolution, seconds in _RESOLUTIONS.items():
+        if (end_timestamp - start_timestamp) / seconds >= points:
+            return resolution
+    return resolution
+
+
 @validation.validate(schema=validation.ReadMeasurementsRequest)
 async def read_measurements(request, values):
     relationship = await auth.authorize(
@@ -354,21 +452,61 @@ async def read_measurements(request, values):
         raise errors.UnauthorizedError
     if relationship < auth.Relationship.OWNER:
         raise errors.ForbiddenError
+    if values.query["aggregate"] or values.query["downsample"]:
+        # Default to the last 4 weeks
+        end_timestamp = values.query["end_timestamp"]
+        if end_timestamp is None:
+            end_timestamp = utils.timestamp()
+        start_timestamp = values.query["start_timestamp"]
+        if start_timestamp is None:
+            start_timestamp = end_timestamp - 4 * 7 * 24 * 3600
     # Aggregate measurements
     if values.query["aggregate"]:
+        resolution = _resolve(start_timestamp, end_timestamp, values.query["points"])
         query, arguments = database.parametrize(
-            identifier="aggregate-measurements",
-            arguments={"sensor_identifier": values.path["sensor_identifier"]},
+            identifier=f"aggregate-measurements-{resolution}",
+            arguments={
+                "sensor_identifier": values.path["sensor_identifier"],
+                "start_timestamp": start_timestamp,
+                "end_timestamp": end_timestamp,
+            },
         )
-        elements = await request.state.dbpool.fetch(query, *arguments)
+        element = await request.state.dbpool.fetchval(query, *arguments)
         # Return successful response
-        return starlette.responses.JSONResponse(
-            status_code=200,
-            content={
-                element["attribute"]: element["values"]
-                for element in database.dictify(elements)
+        return starlette.responses.Response(
+            status_code=200, content=element, media_type="application/json"
+        )
+    # Downsample measurements
+    if values.query["downsample"]:
+        query, arguments = database.parametrize(
+            identifier="read-measurements-series",
+            arguments={
+                "sensor_identifier": values.path["sensor_identifier"],
+                "start_timestamp": start_timestamp,
+                "end_timestamp": end_timestamp,
             },
         )
+        elements = await request.state.dbpool.fetch(query, *arguments)
+        # Long series take a while to process, so we keep them off the event loop
+        loop = asyncio.get_running_loop()
+        content = {}
+        for element in elements:
+            indices = await loop.run_in_executor(
+                None,
+                downsampling.lttb,
+                element["timestamps"],
+                element["values"],
+                values.query["points"],
+            )
+            content[element["attribute"]] = [
+                {
+                    "creation_timestamp": element["timestamps"][i],
+                    "value": element["values"][i],
+                }
+                for i in indices
+            ]
+        # Return successful response
+        return starlette.responses.JSONResponse(status_code=200, content=content)
     # Page through measurements
     query, arguments = database.parametrize(
         identifier=f"read-{values.query['direction']}-measurements",
@@ -377,14 +515,60 @@ async def read_measurements(request, values):
             "creation_timestamp": values.query["creation_timestamp"],
         },
     )
-    elements = await request.state.dbpool.fetch(query, *arguments)
+    # The query returns the page as JSON text, which we pass through unparsed
+    element = await request.state.dbpool.fetchval(query, *arguments)
     # Return successful response
-    return starlette.responses.JSONResponse(
-        status_code=200,
-        content=database.dictify(
-            elements if values.query["direction"] == "next" else reversed(elements)
+    return starlette.responses.Response(
+        status_code=200, content=element, media_type="application/json"
+    )
+
+
+@validation.validate(schema=validation.ReadLatestMeasurementsRequest)
+async def read_latest_measurements(request, values):
+    relationship = await auth.authorize(
+        request,
+        auth.Sensor(
+            {
+                "network_identifier": values.path["network_identifier"],
+                "sensor_identifier": values.path["sensor_identifier"],
+            }
         ),
     )
+    if relationship < auth.Relationship.DEFAULT:
+        raise errors.UnauthorizedError
+    if relationship < auth.Relationship.OWNER:
+        raise errors.ForbiddenError
+    query, arguments = database.parametrize(
+        identifier="read-latest-measurements",
+        arguments={"sensor_identifier": values.path["sensor_identifier"]},
+    )
+    # The query returns the values as JSON text, which we pass through unparsed
+    element = await request.state.dbpool.fetchval(query, *arguments)
+    # Return successful response
+    return starlette.responses.Response(
+        status_code=200, content=element, media_type="application/json"
+    )
+
+
+@validation.validate(schema=validation.ReadNetworkLatestMeasurementsRequest)
+async def read_network_latest_measurements(request, values):
+    relationship = await auth.authorize(
+        request, auth.Network(values.path["network_identifier"])
+    )
+    if relationship < auth.Relationship.DEFAULT:
+        raise errors.UnauthorizedError
+    if relationship < auth.Relationship.OWNER:
+        raise errors.ForbiddenError
+    query, arguments = database.parametrize(
+        identifier="read-network-latest-measurements",
+        arguments={"network_identifier": values.path["network_identifier"]},
+    )
+    # The query returns the values as JSON text, which we pass through unparsed
+    element = await request.state.dbpool.fetchval(query, *arguments)
+    # Return successful response
+    return starlette.responses.Response(
+        status_code=200, content=element, media_type="application/json"
+    )
 
 
 @validation.validate(schema=validation.ReadLogsRequest)
@@ -403,20 +587,115 @@ async def read_logs(request, values):
     if relationship < auth.Relationship.OWNER:
         raise errors.ForbiddenError
     query, arguments = database.parametrize(
-        identifier="read-logs",
+        identifier=f"read-{values.query['direction']}-logs",
         arguments={
             "sensor_identifier": values.path["sensor_identifier"],
             "creation_timestamp": values.query["creation_timestamp"],
-            "direction": values.query["direction"],
+            "sequence": values.query["sequence"],
         },
     )
-    elements = await request.state.dbpool.fetch(query, *arguments)
+    # The query returns the page as JSON text, which we pass through unparsed
+    element = await request.state.dbpool.fetchval(query, *arguments)
     # Return successful response
-    return starlette.responses.JSONResponse(
+    return starlette.responses.Response(
+        status_code=200, content=element, media_type="application/json"
+    )
+
+
+@validation.validate(schema=validation.ExportMeasurementsRequest)
+async def export_measurements(request, values):
+    relationship = await auth.authorize(
+        request,
+        auth.Sensor(
+            {
+                "network_identifier": values.path["network_identifier"],
+                "sensor_identifier": values.path["sensor_identifier"],
+            }
+        ),
+    )
+    if relationship < auth.Relationship.DEFAULT:
+        raise errors.UnauthorizedError
+    if relationship < auth.Relationship.OWNER:
+        raise errors.ForbiddenError
+    arguments = {
+        "sensor_identifier": values.path["sensor_identifier"],
+        "start_timestamp": values.query["start_timestamp"],
+        "end_timestamp": values.query["end_timestamp"],
+    }
+    # Return successful response; The rows are streamed in chunks
+    return starlette.responses.StreamingResponse(
+        status_code=200,
+        content=(
+            export.stream_columnar(
+                dbpool=request.state.export_dbpool,
+                arguments=arguments,
+                format=values.query["format"],
+            )
+            if values.query["format"] in ("arrow", "parquet")
+            else export.stream(
+                dbpool=request.state.export_dbpool,
+                identifier="export-measurements",
+                arguments=arguments,
+                format=values.query["format"],
+            )
+        ),
+        media_type=export.MEDIA_TYPES[values.query["format"]],
+    )
+
+
+@validation.validate(schema=validation.ExportLogsRequest)
+async def export_logs(request, values):
+    relationship = await auth.authorize(
+        request,
+        auth.Sensor(
+            {
+                "network_identifier": values.path["network_identifier"],
+                "sensor_identifier": values.path["sensor_identifier"],
+            }
+        ),
+    )
+    if relationship < auth.Relationship.DEFAULT:
+        raise errors.UnauthorizedError
+    if relationship < auth.Relationship.OWNER:
+        raise errors.ForbiddenError
+    # Return successful response; The rows are streamed in chunks
+    return starlette.responses.StreamingResponse(
         status_code=200,
-        content=database.dictify(
-            elements if values.query["direction"] == "next" else reversed(elements)
+        content=export.stream(
+            dbpool=request.state.export_dbpool,
+            identifier="export-logs",
+            arguments={
+                "sensor_identifier": values.path["sensor_identifier"],
+                "start_timestamp": values.query["start_timestamp"],
+                "end_timestamp": values.query["end_timestamp"],
+            },
+            format=values.query["format"],
         ),
+        media_type=export.MEDIA_TYPES[values.query["format"]],
+    )
+
+
+@validation.validate(schema=validation.StreamEventsRequest)
+async def stream_events(request, values):
+    relationship = await auth.authorize(
+        request,
+        auth.Sensor(
+            {
+                "network_identifier": values.path["network_identifier"],
+                "sensor_identifier": values.path["sensor_identifier"],
+            }
+        ),
+    )
+    if relationship < auth.Relationship.DEFAULT:
+        raise errors.UnauthorizedError
+    if relationship < auth.Relationship.OWNER:
+        raise errors.ForbiddenError
+    # Return successful response; Events are pushed as the sensor's messages arrive
+    return starlette.responses.StreamingResponse(
+        status_code=200,
+        content=hub.stream(values.path["sensor_identifier"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
     )
 
 
@@ -427,6 +706,11 @@ ROUTES = [
         endpoint=read_status,
         methods=["GET"],
     ),
+    starlette.routing.Route(
+        path="/metrics",
+        endpoint=read_metrics,
+        methods=["GET"],
+    ),
     starlette.routing.Route(
         path="/users",
         endpoint=create_user,
@@ -447,6 +731,11 @@ ROUTES = [
         endpoint=read_networks,
         methods=["GET"],
     ),
+    starlette.routing.Route(
+        path="/networks/{network_identifier}",
+        endpoint=read_network,
+        methods=["GET"],
+    ),
     starlette.routing.Route(
         path="/networks/{network_identifier}/sensors",
         endpoint=create_sensor,
@@ -457,6 +746,16 @@ ROUTES = [
         endpoint=read_sensors,
         methods=["GET"],
     ),
+    starlette.routing.Route(
+        path="/networks/{network_identifier}/configurations",
+        endpoint=create_configurations,
+        methods=["POST"],
+    ),
+    starlette.routing.Route(
+        path="/networks/{network_identifier}/measurements/latest",
+        endpoint=read_network_latest_measurements,
+        methods=["GET"],
+    ),
     starlette.routing.Route(
         path="/networks/{network_identifier}/sensors/{sensor_identifier}",
         endpoint=update_sensor,
@@ -477,25 +776,67 @@ ROUTES = [
         endpoint=read_measurements,
         methods=["GET"],
     ),
+    starlette.routing.Route(
+        path="/networks/{network_identifier}/sensors/{sensor_identifier}/measurements/export",
+        endpoint=export_measurements,
+        methods=["GET"],
+    ),
+    starlette.routing.Route(
+        path="/networks/{network_identifier}/sensors/{sensor_identifier}/measurements/latest",
+        endpoint=read_latest_measurements,
+        methods=["GET"],
+    ),
     starlette.routing.Route(
         path="/networks/{network_identifier}/sensors/{sensor_identifier}/logs",
         endpoint=read_logs,
         methods=["GET"],
     ),
+    starlette.routing.Route(
+        path="/networks/{network_identifier}/sensors/{sensor_identifier}/logs/export",
+        endpoint=export_logs,
+        methods=["GET"],
+    ),
+    starlette.routing.Route(
+        path="/networks/{network_identifier}/sensors/{sensor_identifier}/stream",
+        endpoint=stream_events,
+        methods=["GET"],
+    ),
     # fmt: on
 ]
 
 
 @contextlib.asynccontextmanager
 async def lifespan(app):
-    """Manage the lifetime of the database connection and the MQTT client."""
-    async with database.pool() as dbpool, mqtt.client() as client:
-        # Start MQTT listener in (unawaited) asyncio task
+    """Manage the lifetime of the database connections and the MQTT client."""
+    async with (
+        database.pool() as dbpool,
+        database.pool(
+            name="ingest",
+            min_size=settings.POSTGRESQL_INGEST_POOL_MIN_SIZE,
+            max_size=settings.POSTGRESQL_INGEST_POOL_MAX_SIZE,
+        ) as ingest_dbpool,
+        # Exports hold a connection until the client has read everything, so they
+        # get their own pool that can't starve the other routes
+        database.pool(
+            name="export",
+            min_size=settings.POSTGRESQL_EXPORT_POOL_MIN_SIZE,
+            max_size=settings.POSTGRESQL_EXPORT_POOL_MAX_SIZE,
+        ) as export_dbpool,
+        mqtt.client() as client,
+        mqtt.buffer(ingest_dbpool) as buffer,
+        # Publishes pending configurations, including those from before a restart
+        mqtt.outbox(client, ingest_dbpool) as outbox,
+    ):
+        # Apply the compression and retention settings to the measurements
+        await database.apply_policies(dbpool)
+        # Start MQTT listener in (unawaited) asyncio task; The ingestion uses its own
+        # pool so that bursts of messages don't starve the API routes of connections
         loop = asyncio.get_event_loop()
-        task = loop.create_task(mqtt.handle(client, dbpool))
-        # Yield both to application state
-        yield {"dbpool": dbpool, "client": client}
-        # Cancel the MQTT listener task when the app exits
+        task = loop.create_task(mqtt.handle(client, ingest_dbpool, buffer))
+        # Yield all to application state
+        yield {"dbpool": dbpool, "export_dbpool": export_dbpool, "outbox": outbox}
+        # Cancel the MQTT listener task when the app exits; The buffered measurements
+        # are flushed when the buffer's context exits, before the pool is closed
         task.cancel()
         with contextlib.suppress(asyncio.CancelledError):
             await task
@@ -508,6 +849,8 @@ app = starlette.applications.Starlette(
     routes=ROUTES,
     lifespan=lifespan,
     middleware=[
+        # Outermost, so that the latencies include the other middlewares
+        starlette.middleware.Middleware(metrics.LatencyMiddleware),
         starlette.middleware.Middleware(
             starlette.middleware.cors.CORSMiddleware,
             allow_origins=["*"],
@@ -0,0 +1,166 @@
+import bisect
+import collections
+import time
+
+
+########################################################################################
+# Lightweight in-process metrics
+########################################################################################
+
+
+REGISTRY = []
+# Functions that update the metrics that are read rather than recorded, e.g. the
+# sizes of the database pools; They are called before the metrics are rendered
+COLLECTORS = []
+
+
+class _Metric:
+    """Base class for metrics, optionally split into series by a single label."""
+
+    def __init__(self, name, description, label=None):
+        self.name = name
+        self.description = description
+        self.label = label
+        REGISTRY.append(self)
+
+
+class Counter(_Metric):
+    """Value that only ever increases, e.g. the number of handled messages."""
+
+    def __init__(self, name, description, label=None):
+        super().__init__(name, description, label)
+        self.values = collections.defaultdict(float)
+
+    def increment(self, key=None, amount=1):
+        self.values[key] += amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, e.g. the number of queued messages."""
+
+    def __init__(self, name, description, label=None):
+        super().__init__(name, description, label)
+        self.values = collections.defaultdict(float)
+
+    def increment(self, key=None, amount=1):
+        self.values[key] += amount
+
+    def decrement(self, key=None, amount=1):
+        self.values[key] -= amount
+
+    def set(self, value, key=None):
+        self.values[key] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, e.g. latencies, counted in buckets."""
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, description, label=None, buckets=BUCKETS):
+        super().__init__(name, description, label)
+        self.buckets = buckets
+        # The last element counts the observations above the largest bucket
+        self.counts = collections.defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self.sums = collections.defaultdict(float)
+
+    def observe(self, value, key=None):
+        # Buckets are inclusive upper bounds, so we search from the left
+        self.counts[key][bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+
+########################################################################################
+# Prometheus text exposition format
+########################################################################################
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(metric, key, **extra):
+    labels = {} if key is None else {metric.label: key}
+    labels.update(extra)
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def render():
+    """Return the current values of all metrics in the Prometheus text format."""
+    for collect in COLLECTORS:
+        collect()
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        if isinstance(metric, Histogram):
+            lines.append(f"# TYPE {metric.name} histogram")
+            # Copy the keys, the values may change while we iterate
+            for key, counts in list(metric.counts.items()):
+                total = 0
+                for bucket, count in zip((*metric.buckets, "+Inf"), counts):
+                    total += count
+                    labels = _labels(metric, key, le=bucket)
+                    lines.append(f"{metric.name}_bucket{labels} {total}")
+                labels = _labels(metric, key)
+                lines.append(f"{metric.name}_sum{labels} {metric.sums[key]}")
+                lines.append(f"{metric.name}_count{labels} {total}")
+        else:
+            kind = "counter" if isinstance(metric, Counter) else "gauge"
+            lines.append(f"# TYPE {metric.name} {kind}")
+            for key, value in list(metric.values.items()):
+                lines.append(f"{metric.name}{_labels(metric, key)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+########################################################################################
+# Request latency
+########################################################################################
+
+
+_REQUESTS = Histogram(
+    name="http_request_seconds",
+    description="Time until the response starts, per route",
+    label="route",
+)
+
+
+class LatencyMiddleware:
+    """Record the time until each HTTP request's response starts, per route.
+
+    Measuring until the start of the response keeps streamed responses from counting
+    the time it takes the client to consume them. The route is read from the scope
+    after the router matched it; Requests that match no route are grouped together.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        observed = False
+
+        def observe():
+            nonlocal observed
+            observed = True
+            endpoint = scope.get("endpoint")
+            _REQUESTS.observe(
+                time.perf_counter() - start,
+                "unmatched" if endpoint is None else endpoint.__name__,
+            )
+
+        async def wrapper(message):
+            if not observed and message["type"] == "http.response.start":
+                observe()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, wrapper)
+        finally:
+            # Unhandled errors are answered outside of the middleware
+            if not observed:
+                observe()
@@ -1,14 +1,19 @@
 import asyncio
+import collections
 import contextlib
 import json
 import logging
+import secrets
 import ssl
+import time
 
 import aiomqtt
 import asyncpg
 import pydantic
 
 import app.database as database
+import app.hub as hub
+import app.metrics as metrics
 import app.settings as settings
 import app.validation as validation
 import app.utils as utils
@@ -20,7 +25,40 @@ def _encode_payload(payload):
 
 
 logger = logging.getLogger(__name__)
-task_references = set()
+
+_MESSAGES = metrics.Counter(
+    name="mqtt_received_messages",
+    description="Number of received messages",
+    label="subscription",
+)
+_ELEMENTS = metrics.Counter(
+    name="mqtt_received_elements",
+    description="Number of elements in the received messages that passed validation",
+    label="subscription",
+)
+_MALFORMED = metrics.Counter(
+    name="mqtt_validation_failures",
+    description="Number of received messages that failed validation",
+    label="subscription",
+)
+_DEPTH = metrics.Gauge(
+    name="mqtt_queued_messages",
+    description="Number of received messages waiting to be handled",
+    label="subscription",
+)
+_LATENCY = metrics.Histogram(
+    name="mqtt_handling_seconds",
+    description="Time it takes to validate and handle a message",
+    label="subscription",
+)
+_UNMATCHED = metrics.Counter(
+    name="mqtt_unmatched_acknowledgments",
+    description="Number of acknowledgments without a matching unacknowledged revision",
+)
+_INFLIGHT = metrics.Gauge(
+    name="mqtt_inflight_publications",
+    description="Number of configurations being published",
+)
 
 
 @contextlib.asynccontextmanager
@@ -39,96 +77,373 @@ async def client():
             else None
         ),
         # Make the MQTT connection persistent. The broker will retain messages on
-        # topics we subscribed to in case we disconnect.
-        clean_start=False,
-        identifier="server",
+        # topics we subscribed to in case we disconnect. With shared subscriptions,
+        # the group's other members receive the messages while we're disconnected.
+        clean_start=settings.MQTT_SHARED_GROUP is not None,
+        identifier=(
+            "server"
+            if settings.MQTT_SHARED_GROUP is None
+            else f"server-{secrets.token_hex(8)}"
+        ),
     ) as x:
         yield x
 
 
-async def publish_configuration(
-    sensor_identifier, revision, configuration, client, dbpool
-):
-    """Publish a configuration to the specified sensor."""
+class Buffer:
+    """Accumulate measurements and acknowledgments across messages and write them to
+    the database in bulk.
+
+    The buffer is flushed when it holds `size` rows or every `interval` seconds,
+    whichever comes first. Rows are written with a single query per flush instead of
+    one query per row. The most recent value of each sensor's attributes is coalesced
+    in memory, so that each flush updates it at most once per attribute. Likewise,
+    only the first acknowledgment of a revision is kept, as only that one is applied.
+    """
+
+    def __init__(
+        self,
+        dbpool,
+        size=settings.INGEST_BUFFER_SIZE,
+        interval=settings.INGEST_BUFFER_INTERVAL,
+    ):
+        self.dbpool = dbpool
+        self.size = size
+        self.interval = interval
+        self.measurements = []
+        self.latest = {}
+        self.acknowledgments = {}
+        self._closing = asyncio.Event()
+
+    async def _check(self):
+        if len(self.measurements) + len(self.acknowledgments) >= self.size:
+            # Flushing inline applies backpressure to the listener. The shield makes
+            # sure that the rows are written even if the listener is cancelled.
+            await asyncio.shield(self.flush())
 
-    async def helper(sensor_identifier, revision, configuration):
+    async def extend(self, measurements):
+        """Add measurement rows to the buffer and flush if it's full."""
+        self.measurements.extend(measurements)
+        for sensor_identifier, attribute, value, revision, timestamp in measurements:
+            key = (sensor_identifier, attribute)
+            if key not in self.latest or timestamp >= self.latest[key][2]:
+                self.latest[key] = (value, revision, timestamp)
+        await self._check()
+
+    async def acknowledge(self, acknowledgments):
+        """Add acknowledgment rows to the buffer and flush if it's full."""
+        for sensor_identifier, revision, success, timestamp in acknowledgments:
+            self.acknowledgments.setdefault(
+                (sensor_identifier, revision), (success, timestamp)
+            )
+        await self._check()
+
+    async def flush(self):
+        """Write all buffered measurements and acknowledgments to the database."""
+        # Swap the buffer before awaiting anything so that concurrent additions end
+        # up in the next batch
+        measurements, self.measurements = self.measurements, []
+        latest, self.latest = self.latest, {}
+        acknowledgments, self.acknowledgments = self.acknowledgments, {}
+        if len(measurements) > 0:
+            await self._write_measurements(measurements, latest)
+        if len(acknowledgments) > 0:
+            await self._write_acknowledgments(acknowledgments)
+
+    async def _write_measurements(self, measurements, latest):
+        (
+            sensor_identifiers,
+            attributes,
+            values,
+            revisions,
+            creation_timestamps,
+        ) = zip(*measurements)
         query, arguments = database.parametrize(
-            identifier="update-configuration-on-publication",
+            identifier="create-measurements",
             arguments={
-                "sensor_identifier": sensor_identifier,
-                "revision": revision,
+                "sensor_identifiers": sensor_identifiers,
+                "attributes": attributes,
+                "values": values,
+                "revisions": revisions,
+                "creation_timestamps": creation_timestamps,
             },
         )
-        for boff in utils.backoff():
-            try:
-                # Try to publish the configuration
-                await client.publish(
-                    topic=f"configurations/{sensor_identifier}",
-                    payload=_encode_payload(
-                        {"revision": revision, "configuration": configuration}
-                    ),
-                    qos=1,
-                    retain=True,
+        try:
+            response = await self.dbpool.execute(query, *arguments)
+        except Exception as e:  # pragma: no cover
+            logger.error(f"Failed to write {len(measurements)} measurements: {e!r}")
+            return
+        # The response has the form "INSERT 0 <count>"
+        if (count := len(measurements) - int(response.split()[-1])) > 0:
+            logger.warning(f"Failed to handle; Sensor not found for {count} rows")
+        # Notify the clients following the sensors live, only of measurements that
+        # were written; The rows of a data point are consecutive in the buffer
+        events = collections.defaultdict(list)
+        for sensor_identifier, attribute, value, revision, timestamp in measurements:
+            if not hub.subscribed(sensor_identifier):
+                continue
+            elements = events[sensor_identifier]
+            if (
+                len(elements) == 0
+                or elements[-1]["creation_timestamp"] != timestamp
+                or elements[-1]["revision"] != revision
+            ):
+                elements.append(
+                    {"creation_timestamp": timestamp, "revision": revision, "value": {}}
                 )
-                # Try to set the publication timestamp in the database
-                await dbpool.execute(query, *arguments)
-                logger.info(f"Published configuration {sensor_identifier}#{revision}")
+            elements[-1]["value"][attribute] = value
+        for sensor_identifier, event in events.items():
+            hub.publish(sensor_identifier, "measurements", event)
+        # Update the most recent values after the measurements are written
+        query, arguments = database.parametrize(
+            identifier="update-sensor-latest",
+            arguments={
+                "sensor_identifiers": [key[0] for key in latest.keys()],
+                "attributes": [key[1] for key in latest.keys()],
+                "values": [x[0] for x in latest.values()],
+                "revisions": [x[1] for x in latest.values()],
+                "creation_timestamps": [x[2] for x in latest.values()],
+            },
+        )
+        try:
+            await self.dbpool.execute(query, *arguments)
+        except Exception as e:  # pragma: no cover
+            logger.error(f"Failed to update {len(latest)} latest values: {e!r}")
+
+    async def _write_acknowledgments(self, acknowledgments):
+        query, arguments = database.parametrize(
+            identifier="update-configurations-on-acknowledgment",
+            arguments={
+                "sensor_identifiers": [key[0] for key in acknowledgments.keys()],
+                "revisions": [key[1] for key in acknowledgments.keys()],
+                "successes": [x[0] for x in acknowledgments.values()],
+                "acknowledgment_timestamps": [x[1] for x in acknowledgments.values()],
+            },
+        )
+        try:
+            elements = await self.dbpool.fetch(query, *arguments)
+        except Exception as e:  # pragma: no cover
+            logger.error(
+                f"Failed to write {len(acknowledgments)} acknowledgments: {e!r}"
+            )
+            return
+        if (count := len(acknowledgments) - len(elements)) > 0:
+            _UNMATCHED.increment(amount=count)
+            logger.warning(
+                "Failed to handle; Configuration not found or already acknowledged"
+                f" for {count} acknowledgments"
+            )
+        # Notify the clients following the sensors live, only of the acknowledgments
+        # that were applied
+        events = collections.defaultdict(list)
+        for element in elements:
+            key = (element["sensor_identifier"], element["revision"])
+            if hub.subscribed(key[0]):
+                events[key[0]].append(
+                    {
+                        "revision": key[1],
+                        "success": acknowledgments[key][0],
+                        "acknowledgment_timestamp": acknowledgments[key][1],
+                    }
+                )
+        for sensor_identifier, event in events.items():
+            hub.publish(sensor_identifier, "acknowledgments", event)
+
+    async def run(self):
+        """Flush the buffer periodically until it's closed."""
+        while True:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._closing.wait(), timeout=self.interval)
+            await self.flush()
+            if self._closing.is_set():
                 break
-            except Exception as e:  # pragma: no cover
-                # Retry if something fails. Duplicate messages are not a problem,
-                # the sensor can ignore them based on the revision number.
-                # The revision number only increases, never decreases.
+
+    def close(self):
+        """Stop the periodic flushing; The buffer is flushed one last time."""
+        self._closing.set()
+
+
+@contextlib.asynccontextmanager
+async def buffer(dbpool):
+    """Context manager to manage a periodically flushed ingestion buffer."""
+    x = Buffer(dbpool)
+    task = asyncio.create_task(x.run())
+    try:
+        yield x
+    finally:
+        # Flush the remaining rows before the database pool is closed
+        x.close()
+        await task
+
+
+class Outbox:
+    """Publish the configurations that are not yet published, in batches.
+
+    Configurations are published from the database rather than right after they are
+    created, so pending publications survive restarts and are resumed at startup.
+    At most `size` publications are in flight at once. A batch is claimed by leasing
+    it for `lease` seconds, and published outside of any transaction; The leases of
+    servers that stopped expire, after which other servers publish the batch. A
+    configuration that fails to be published backs off on its own, so that it
+    doesn't hold up the others. New configurations wake up the outbox; Otherwise,
+    it checks for publications that are due every `interval` seconds.
+    """
+
+    def __init__(
+        self,
+        client,
+        dbpool,
+        size=settings.PUBLICATION_BATCH_SIZE,
+        interval=settings.PUBLICATION_INTERVAL,
+        lease=60,
+    ):
+        self.client = client
+        self.dbpool = dbpool
+        self.size = size
+        self.interval = interval
+        self.lease = lease
+        self._wakeup = asyncio.Event()
+        self._closing = asyncio.Event()
+
+    def wake(self):
+        """Signal that there are new configurations to publish."""
+        self._wakeup.set()
+
+    async def publish(self):
+        """Publish a batch of configurations and mark them as published.
+
+        Returns the number of configurations in the batch. The configurations that
+        failed to be published are retried after a backoff.
+        """
+        # The claim is committed right away, so that no connection is held and no
+        # rows are locked while the messages are in flight
+        query, arguments = database.parametrize(
+            identifier="claim-unpublished-configurations",
+            arguments={"batch_size": self.size, "lease": self.lease},
+        )
+        elements = await self.dbpool.fetch(query, *arguments)
+        if len(elements) == 0:
+            return 0
+        _INFLIGHT.set(len(elements))
+        try:
+            results = await asyncio.gather(
+                *[
+                    self.client.publish(
+                        topic=f"configurations/{element['sensor_identifier']}",
+                        payload=_encode_payload(
+                            {
+                                "revision": element["revision"],
+                                "configuration": element["value"],
+                            }
+                        ),
+                        qos=1,
+                        retain=True,
+                    )
+                    for element in elements
+                ],
+                return_exceptions=True,
+            )
+        finally:
+            _INFLIGHT.set(0)
+        published, failed = [], []
+        for element, result in zip(elements, results):
+            (failed if isinstance(result, Exception) else published).append(element)
+        # Duplicate messages are not a problem if we fail before the update, the
+        # sensor can ignore them based on the revision number
+        for identifier, subset in [
+            ("update-configurations-on-publication", published),
+            ("update-configurations-on-publication-failure", failed),
+        ]:
+            if len(subset) == 0:
+                continue
+            query, arguments = database.parametrize(
+                identifier=identifier,
+                arguments={
+                    "sensor_identifiers": [x["sensor_identifier"] for x in subset],
+                    "revisions": [x["revision"] for x in subset],
+                },
+            )
+            await self.dbpool.execute(query, *arguments)
+        for element in published:
+            logger.info(
+                "Published configuration"
+                f" {element['sensor_identifier']}#{element['revision']}"
+            )
+        for element, result in zip(elements, results):
+            if isinstance(result, Exception):
                 logger.warning(
-                    f"Failed to publish configuration {sensor_identifier}#{revision},"
-                    f" retrying in {boff} seconds: {repr(e)}"
+                    "Failed to publish configuration"
+                    f" {element['sensor_identifier']}#{element['revision']}:"
+                    f" {result!r}"
                 )
-                await asyncio.sleep(boff)
+        return len(elements)
 
-    # Fire-and-forget the retry task, save the reference, and return immediately
-    task = asyncio.create_task(helper(sensor_identifier, revision, configuration))
-    task_references.add(task)
-    task.add_done_callback(task_references.remove)
+    async def run(self):
+        """Publish configurations until the outbox is closed."""
+        while not self._closing.is_set():
+            # Clear before publishing, so that configurations created in the
+            # meantime wake us up again
+            self._wakeup.clear()
+            try:
+                count = await self.publish()
+            except Exception as e:  # pragma: no cover
+                logger.error(f"Failed to publish configurations: {e!r}")
+                count = 0
+            # A full batch means that there are probably more configurations waiting
+            if count == self.size:
+                continue
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
 
+    def close(self):
+        """Stop publishing after the current batch."""
+        self._closing.set()
+        self._wakeup.set()
 
-async def _handle_acknowledgments(sensor_identifier, payload, dbpool):
-    query, arguments = database.parametrize(
-        identifier="update-configuration-on-acknowledgment",
-        arguments=[
-            {
-                "sensor_identifier": sensor_identifier,
-                "success": element.success,
-                "acknowledgment_timestamp": element.timestamp,
-                "revision": element.revision,
-            }
+
+@contextlib.asynccontextmanager
+async def outbox(client, dbpool):
+    """Context manager to manage the publication of configurations."""
+    x = Outbox(client, dbpool)
+    task = asyncio.create_task(x.run())
+    try:
+        yield x
+    finally:
+        x.close()
+        await task
+
+
+async def _handle_acknowledgments(sensor_identifier, payload, dbpool, buffer):
+    # Acknowledgments are applied in bulk when the buffer is flushed; Nonexistent
+    # sensors and revisions are ignored then. The clients following the sensor live
+    # are notified after the flush, of the applied acknowledgments only.
+    await buffer.acknowledge(
+        [
+            (sensor_identifier, element.revision, element.success, element.timestamp)
             for element in payload
-        ],
+        ]
     )
-    # Ignores when the sensor or revision does not exist, because it's an UPDATE query
-    await dbpool.executemany(query, arguments)
 
 
-async def _handle_measurements(sensor_identifier, payload, dbpool):
-    query, arguments = database.parametrize(
-        identifier="create-measurement",
-        arguments=[
-            {
-                "sensor_identifier": sensor_identifier,
-                "attribute": attribute,
-                "value": value,
-                "creation_timestamp": element.timestamp,
-                "revision": element.revision,
-            }
+async def _handle_measurements(sensor_identifier, payload, dbpool, buffer):
+    # Measurements are written in bulk when the buffer is flushed; Nonexistent
+    # sensors are filtered out then. The clients following the sensor live are
+    # notified after the flush.
+    await buffer.extend(
+        [
+            (
+                sensor_identifier,
+                attribute,
+                value,
+                element.revision,
+                element.timestamp,
+            )
             for element in payload
             for attribute, value in element.value.items()
-        ],
+        ]
     )
-    try:
-        await dbpool.executemany(query, arguments)
-    except asyncpg.ForeignKeyViolationError:
-        logger.warning(f"Failed to handle; Sensor not found: {sensor_identifier}")
 
 
-async def _handle_logs(sensor_identifier, payload, dbpool):
+async def _handle_logs(sensor_identifier, payload, dbpool, buffer):
     query, arguments = database.parametrize(
         identifier="create-log",
         arguments=[
@@ -146,6 +461,22 @@ async def _handle_logs(sensor_identifier, payload, dbpool):
         await dbpool.executemany(query, arguments)
     except asyncpg.ForeignKeyViolationError:
         logger.warning(f"Failed to handle; Sensor not found: {sensor_identifier}")
+        return
+    # Notify the clients following the sensor live
+    if hub.subscribed(sensor_identifier):
+        hub.publish(
+            sensor_identifier,
+            "logs",
+            [
+                {
+                    "creation_timestamp": element.timestamp,
+                    "revision": element.revision,
+                    "severity": element.severity,
+                    "message": element.message,
+                }
+                for element in payload
+            ],
+        )
 
 
 SUBSCRIPTIONS = {
@@ -164,30 +495,59 @@ SUBSCRIPTIONS = {
 }
 
 
-async def handle(client, dbpool):
-    """Subscribe and handle incoming MQTT messages from sensors."""
-    for wildcard in SUBSCRIPTIONS.keys():
-        # Subscribe to all our topics
-        await client.subscribe(wildcard, qos=1, timeout=10)
-        logger.info(f"Subscribed to: {wildcard}")
+async def _work(queue, dbpool, buffer):
+    """Handle the messages of one partition of the sensors in order of arrival."""
     while True:
+        wildcard, sensor_identifier, message = await queue.get()
+        handle, validator = SUBSCRIPTIONS[wildcard]
+        start = time.perf_counter()
         try:
+            payload = validator.validate_json(message.payload)
+            _ELEMENTS.increment(wildcard, len(payload))
+            await handle(sensor_identifier, payload, dbpool, buffer)
+        # Errors are logged and ignored as we can't give feedback
+        except pydantic.ValidationError:
+            _MALFORMED.increment(wildcard)
+            logger.warning(f"Malformed message: {message.payload!r}")
+        except Exception as e:  # pragma: no cover
+            logger.error(e, exc_info=True)
+        finally:
+            _LATENCY.observe(time.perf_counter() - start, wildcard)
+            _DEPTH.decrement(wildcard)
+
+
+async def _listen(client, queues):
+    """Receive MQTT messages and distribute them to the workers' queues."""
+    while True:
+        try:
+            # Subscribe to all our topics; We subscribe again after reconnecting,
+            # because sessions with shared subscriptions are not persistent
+            for wildcard in SUBSCRIPTIONS.keys():
+                if settings.MQTT_SHARED_GROUP is not None:
+                    wildcard = f"$share/{settings.MQTT_SHARED_GROUP}/{wildcard}"
+                await client.subscribe(wildcard, qos=1, timeout=10)
+                logger.info(f"Subscribed to: {wildcard}")
             async for message in client._messages():
                 logger.debug(f"Received: {message.payload!r} on topic: {message.topic}")
-                # Get sensor identifier from the topic
-                # TODO validate that identifier is a valid UUID format
-                sensor_identifier = str(message.topic).split("/")[-1]
-                # Call the appropriate handler; First match wins
-                for wildcard, (handle, validator) in SUBSCRIPTIONS.items():
+                # Get sensor identifier from the topic; Measurements are written in
+                # batches, so we can't rely on the database to reject malformed ones
+                try:
+                    sensor_identifier = validation.IdentifierValidator.validate_python(
+                        str(message.topic).split("/")[-1]
+                    )
+                except pydantic.ValidationError:
+                    logger.warning(f"Malformed topic: {message.topic}")
+                    continue
+                # Find the appropriate handler; First match wins
+                for wildcard in SUBSCRIPTIONS.keys():
                     if message.topic.matches(wildcard):
-                        try:
-                            payload = validator.validate_json(message.payload)
-                            await handle(sensor_identifier, payload, dbpool)
-                        # Errors are logged and ignored as we can't give feedback
-                        except pydantic.ValidationError:
-                            logger.warning(f"Malformed message: {message.payload!r}")
-                        except Exception as e:  # pragma: no cover
-                            logger.error(e, exc_info=True)
+                        # Messages of the same sensor always go to the same worker,
+                        # which preserves their order. Waiting for a free slot in a
+                        # full queue applies backpressure to the broker.
+                        queue = queues[hash(sensor_identifier) % len(queues)]
+                        _MESSAGES.increment(wildcard)
+                        _DEPTH.increment(wildcard)
+                        await queue.put((wildcard, sensor_identifier, message))
                         break
                 else:  # Executed if no break is called
                     logger.warning(f"Failed to match topic: {message.topic}")
@@ -203,3 +563,22 @@ async def handle(client, dbpool):
                     await client.__aenter__()
                     logger.info("Successfully reconnected to the MQTT broker")
                     break
+
+
+async def handle(client, dbpool, buffer):
+    """Subscribe and handle incoming MQTT messages from sensors.
+
+    Messages are processed concurrently by a fixed number of workers, each with its
+    own bounded queue. With shared subscriptions, the broker distributes the messages
+    between all server processes in the group, so that each message is handled by
+    exactly one of them.
+    """
+    queues = [
+        asyncio.Queue(maxsize=settings.MQTT_QUEUE_SIZE)
+        for _ in range(settings.MQTT_WORKERS)
+    ]
+    # Cancelling the listener cancels the workers as well
+    async with asyncio.TaskGroup() as group:
+        for queue in queues:
+            group.create_task(_work(queue, dbpool, buffer))
+        await _listen(client, queues)
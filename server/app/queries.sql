@@ -1,17 +1,111 @@
--- name: aggregate-measurements
-SELECT
-    attribute,
-    array_agg(
-        jsonb_build_object(
-            'bucket_timestamp', extract(EPOCH FROM bucket_timestamp),
-            'average', average
-        ) ORDER BY bucket_timestamp ASC
-    ) AS values
-FROM measurement_aggregation_1_hour
-WHERE
-    sensor_identifier = ${sensor_identifier}
-    AND bucket_timestamp > now() - INTERVAL '4 weeks'
-GROUP BY attribute;
+-- name: aggregate-measurements-1-minute
+-- Return the aggregated measurements per attribute as a JSON object. We use one
+-- query per resolution. The time range includes buckets that overlap its start.
+WITH buckets AS (
+    SELECT
+        attribute,
+        json_agg(
+            json_build_object(
+                'bucket_timestamp',
+                extract(EPOCH FROM bucket_timestamp)::DOUBLE PRECISION,
+                'average', total / count,
+                'minimum', minimum,
+                'maximum', maximum,
+                'count', count
+            ) ORDER BY bucket_timestamp ASC
+        ) AS values
+    FROM measurement_aggregation_1_minute
+    WHERE
+        sensor_identifier = ${sensor_identifier}
+        AND bucket_timestamp
+        > ${start_timestamp}::TIMESTAMPTZ - INTERVAL '1 minute'
+        AND bucket_timestamp < ${end_timestamp}::TIMESTAMPTZ
+    GROUP BY attribute
+)
+
+SELECT coalesce(json_object_agg(attribute, values), '{}')::TEXT AS elements
+FROM buckets;
+
+
+-- name: aggregate-measurements-15-minutes
+WITH buckets AS (
+    SELECT
+        attribute,
+        json_agg(
+            json_build_object(
+                'bucket_timestamp',
+                extract(EPOCH FROM bucket_timestamp)::DOUBLE PRECISION,
+                'average', total / count,
+                'minimum', minimum,
+                'maximum', maximum,
+                'count', count
+            ) ORDER BY bucket_timestamp ASC
+        ) AS values
+    FROM measurement_aggregation_15_minutes
+    WHERE
+        sensor_identifier = ${sensor_identifier}
+        AND bucket_timestamp
+        > ${start_timestamp}::TIMESTAMPTZ - INTERVAL '15 minutes'
+        AND bucket_timestamp < ${end_timestamp}::TIMESTAMPTZ
+    GROUP BY attribute
+)
+
+SELECT coalesce(json_object_agg(attribute, values), '{}')::TEXT AS elements
+FROM buckets;
+
+
+-- name: aggregate-measurements-1-hour
+WITH buckets AS (
+    SELECT
+        attribute,
+        json_agg(
+            json_build_object(
+                'bucket_timestamp',
+                extract(EPOCH FROM bucket_timestamp)::DOUBLE PRECISION,
+                'average', total / count,
+                'minimum', minimum,
+                'maximum', maximum,
+                'count', count
+            ) ORDER BY bucket_timestamp ASC
+        ) AS values
+    FROM measurement_aggregation_1_hour
+    WHERE
+        sensor_identifier = ${sensor_identifier}
+        AND bucket_timestamp
+        > ${start_timestamp}::TIMESTAMPTZ - INTERVAL '1 hour'
+        AND bucket_timestamp < ${end_timestamp}::TIMESTAMPTZ
+    GROUP BY attribute
+)
+
+SELECT coalesce(json_object_agg(attribute, values), '{}')::TEXT AS elements
+FROM buckets;
+
+
+-- name: aggregate-measurements-1-day
+WITH buckets AS (
+    SELECT
+        attribute,
+        json_agg(
+            json_build_object(
+                'bucket_timestamp',
+                extract(EPOCH FROM bucket_timestamp)::DOUBLE PRECISION,
+                'average', total / count,
+                'minimum', minimum,
+                'maximum', maximum,
+                'count', count
+            ) ORDER BY bucket_timestamp ASC
+        ) AS values
+    FROM measurement_aggregation_1_day
+    WHERE
+        sensor_identifier = ${sensor_identifier}
+        AND bucket_timestamp
+        > ${start_timestamp}::TIMESTAMPTZ - INTERVAL '1 day'
+        AND bucket_timestamp < ${end_timestamp}::TIMESTAMPTZ
+    GROUP BY attribute
+)
+
+SELECT coalesce(json_object_agg(attribute, values), '{}')::TEXT AS elements
+FROM buckets;
 
 
 -- name: read-sensors
@@ -22,6 +116,74 @@ FROM sensor
 WHERE sensor.network_identifier = ${network_identifier};
 
 
+-- name: read-network
+-- Return the state of all sensors in the network as a JSON array in a single
+-- query. Each lateral subquery is an index lookup per sensor.
+WITH overview AS (
+    SELECT
+        sensor.identifier AS sensor_identifier,
+        sensor.name AS sensor_name,
+        latest.measurement_timestamp,
+        recent.severity AS log_severity,
+        recent.creation_timestamp AS log_timestamp,
+        current.revision,
+        current.publication_timestamp,
+        current.acknowledgment_timestamp,
+        current.success
+    FROM sensor
+    LEFT JOIN LATERAL (
+        SELECT max(sensor_latest.creation_timestamp) AS measurement_timestamp
+        FROM sensor_latest
+        WHERE sensor_latest.sensor_identifier = sensor.identifier
+    ) AS latest ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT
+            log.severity,
+            log.creation_timestamp
+        FROM log
+        WHERE log.sensor_identifier = sensor.identifier
+        ORDER BY log.creation_timestamp DESC, log.sequence DESC
+        LIMIT 1
+    ) AS recent ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT
+            configuration.revision,
+            configuration.publication_timestamp,
+            configuration.acknowledgment_timestamp,
+            configuration.success
+        FROM configuration
+        WHERE configuration.sensor_identifier = sensor.identifier
+        ORDER BY configuration.revision DESC
+        LIMIT 1
+    ) AS current ON TRUE
+    WHERE sensor.network_identifier = ${network_identifier}
+)
+
+SELECT
+    coalesce(
+        json_agg(
+            json_build_object(
+                'sensor_identifier', sensor_identifier,
+                'sensor_name', sensor_name,
+                'measurement_timestamp',
+                extract(EPOCH FROM measurement_timestamp)::DOUBLE PRECISION,
+                'log_severity', log_severity,
+                'log_timestamp',
+                extract(EPOCH FROM log_timestamp)::DOUBLE PRECISION,
+                'revision', revision,
+                'publication_timestamp',
+                extract(EPOCH FROM publication_timestamp)::DOUBLE PRECISION,
+                'acknowledgment_timestamp',
+                extract(EPOCH FROM acknowledgment_timestamp)::DOUBLE PRECISION,
+                'success', success
+            )
+            ORDER BY sensor_name ASC
+        ),
+        '[]'
+    )::TEXT AS elements
+FROM overview;
+
+
 -- name: create-network
 INSERT INTO network (
     identifier,
@@ -77,7 +239,10 @@ VALUES (
 );
 
 
--- name: create-measurement
+-- name: create-measurements
+-- Insert a batch of measurements from parallel arrays in a single statement.
+-- The join drops the rows of nonexistent sensors instead of failing the whole
+-- batch.
 INSERT INTO measurement (
     sensor_identifier,
     attribute,
@@ -86,14 +251,59 @@ INSERT INTO measurement (
     creation_timestamp,
     receipt_timestamp
 )
-VALUES (
-    ${sensor_identifier},
-    ${attribute},
-    ${value},
-    ${revision},
-    ${creation_timestamp},
-    now()
-);
+SELECT
+    sensor.identifier,
+    interim.attribute,
+    interim.value,
+    interim.revision,
+    to_timestamp(interim.creation_timestamp) AS creation_timestamp,
+    now() AS receipt_timestamp
+FROM
+    unnest(
+        ${sensor_identifiers}::TEXT []::UUID [],
+        ${attributes}::TEXT [],
+        ${values}::DOUBLE PRECISION [],
+        ${revisions}::INT [],
+        ${creation_timestamps}::DOUBLE PRECISION []
+    ) AS interim (
+        sensor_identifier, attribute, value, revision, creation_timestamp
+    )
+INNER JOIN sensor ON interim.sensor_identifier = sensor.identifier;
+
+
+-- name: update-sensor-latest
+-- Update the most recent values from parallel arrays. The arrays must not
+-- contain the same sensor and attribute twice. Older values never replace newer
+-- ones.
+INSERT INTO sensor_latest (
+    sensor_identifier,
+    attribute,
+    value,
+    revision,
+    creation_timestamp
+)
+SELECT
+    sensor.identifier,
+    interim.attribute,
+    interim.value,
+    interim.revision,
+    to_timestamp(interim.creation_timestamp) AS creation_timestamp
+FROM
+    unnest(
+        ${sensor_identifiers}::TEXT []::UUID [],
+        ${attributes}::TEXT [],
+        ${values}::DOUBLE PRECISION [],
+        ${revisions}::INT [],
+        ${creation_timestamps}::DOUBLE PRECISION []
+    ) AS interim (
+        sensor_identifier, attribute, value, revision, creation_timestamp
+    )
+INNER JOIN sensor ON interim.sensor_identifier = sensor.identifier
+ON CONFLICT (sensor_identifier, attribute) DO UPDATE
+SET (value, revision, creation_timestamp) = (
+    excluded.value, excluded.revision, excluded.creation_timestamp
+)
+WHERE excluded.creation_timestamp >= sensor_latest.creation_timestamp;
 
 
 -- name: create-sensor
@@ -141,102 +351,349 @@ VALUES (
 RETURNING identifier AS user_identifier;
 
 
--- name: read-configurations
+-- name: read-latest-measurements
+-- Return the most recent value of each of the sensor's attributes as a JSON
+-- object keyed by attribute.
 SELECT
-    value,
-    revision,
-    creation_timestamp,
-    publication_timestamp,
-    acknowledgment_timestamp,
-    success
-FROM configuration
-WHERE
-    sensor_identifier = ${sensor_identifier}
-    AND CASE
-        WHEN ${revision}::INT IS NOT NULL
-            THEN (
-                CASE
-                    WHEN ${direction} = 'next'
-                        THEN revision > ${revision}
-                    WHEN ${direction} = 'previous'
-                        THEN revision < ${revision}
-                    ELSE TRUE
-                END
+    coalesce(
+        json_object_agg(
+            attribute,
+            json_build_object(
+                'value', value,
+                'revision', revision,
+                'creation_timestamp',
+                extract(EPOCH FROM creation_timestamp)::DOUBLE PRECISION
             )
-        ELSE TRUE
-    END
-ORDER BY
-    CASE WHEN ${direction} = 'next' THEN revision END ASC,
-    CASE WHEN ${direction} = 'previous' THEN revision END DESC
-LIMIT 64;
+        ),
+        '{}'
+    )::TEXT AS elements
+FROM sensor_latest
+WHERE sensor_identifier = ${sensor_identifier};
+
+
+-- name: read-network-latest-measurements
+-- Return the most recent values of all sensors in the network as a JSON object
+-- keyed by sensor and attribute.
+WITH sensors AS (
+    SELECT
+        sensor_latest.sensor_identifier,
+        json_object_agg(
+            sensor_latest.attribute,
+            json_build_object(
+                'value', sensor_latest.value,
+                'revision', sensor_latest.revision,
+                'creation_timestamp',
+                extract(
+                    EPOCH FROM sensor_latest.creation_timestamp
+                )::DOUBLE PRECISION
+            )
+        ) AS attributes
+    FROM sensor_latest
+    INNER JOIN sensor ON sensor_latest.sensor_identifier = sensor.identifier
+    WHERE sensor.network_identifier = ${network_identifier}
+    GROUP BY sensor_latest.sensor_identifier
+)
+
+SELECT
+    coalesce(json_object_agg(sensor_identifier, attributes), '{}')::TEXT
+    AS elements
+FROM sensors;
+
+
+-- name: read-configurations
+-- Return the page as a JSON array in chronological order. PostgreSQL builds the
+-- JSON text, which we pass through to the response without parsing it.
+WITH page AS (
+    SELECT
+        value,
+        revision,
+        creation_timestamp,
+        publication_timestamp,
+        acknowledgment_timestamp,
+        success
+    FROM configuration
+    WHERE
+        sensor_identifier = ${sensor_identifier}
+        AND CASE
+            WHEN ${revision}::INT IS NOT NULL
+                THEN (
+                    CASE
+                        WHEN ${direction} = 'next'
+                            THEN revision > ${revision}
+                        WHEN ${direction} = 'previous'
+                            THEN revision < ${revision}
+                        ELSE TRUE
+                    END
+                )
+            ELSE TRUE
+        END
+    ORDER BY
+        CASE WHEN ${direction} = 'next' THEN revision END ASC,
+        CASE WHEN ${direction} = 'previous' THEN revision END DESC
+    LIMIT 64
+)
+
+SELECT
+    coalesce(
+        json_agg(
+            json_build_object(
+                'value', value,
+                'revision', revision,
+                'creation_timestamp',
+                extract(EPOCH FROM creation_timestamp)::DOUBLE PRECISION,
+                'publication_timestamp',
+                extract(EPOCH FROM publication_timestamp)::DOUBLE PRECISION,
+                'acknowledgment_timestamp',
+                extract(EPOCH FROM acknowledgment_timestamp)::DOUBLE PRECISION,
+                'success', success
+            ) ORDER BY revision ASC
+        ),
+        '[]'
+    )::TEXT AS elements
+FROM page;
 
 
 -- name: read-next-measurements
 -- Reassemble data points that have the same timestamp and revision from EAV
--- back to JSON, then sort and paginate. We use one query per direction.
+-- back to JSON, then sort and paginate, and return the page as a JSON array in
+-- chronological order. We use one query per direction.
 -- Somehow the query planner stumbles when we use a second CASE statement for
 -- the direction and does a full table scan.
+WITH page AS (
+    SELECT
+        creation_timestamp,
+        revision,
+        jsonb_object_agg(attribute, value) AS value
+    FROM measurement
+    WHERE
+        sensor_identifier = ${sensor_identifier}
+        AND CASE
+            WHEN ${creation_timestamp}::TIMESTAMPTZ IS NOT NULL
+                THEN creation_timestamp > ${creation_timestamp}
+            ELSE TRUE
+        END
+    GROUP BY creation_timestamp, revision
+    ORDER BY creation_timestamp ASC
+    LIMIT 64
+)
+
 SELECT
-    creation_timestamp,
-    revision,
-    jsonb_object_agg(attribute, value) AS value
+    coalesce(
+        json_agg(
+            json_build_object(
+                'creation_timestamp',
+                extract(EPOCH FROM creation_timestamp)::DOUBLE PRECISION,
+                'revision', revision,
+                'value', value
+            ) ORDER BY creation_timestamp ASC
+        ),
+        '[]'
+    )::TEXT AS elements
+FROM page;
+
+
+-- name: read-previous-measurements
+WITH page AS (
+    SELECT
+        creation_timestamp,
+        revision,
+        jsonb_object_agg(attribute, value) AS value
+    FROM measurement
+    WHERE
+        sensor_identifier = ${sensor_identifier}
+        AND CASE
+            WHEN ${creation_timestamp}::TIMESTAMPTZ IS NOT NULL
+                THEN creation_timestamp < ${creation_timestamp}
+            ELSE TRUE
+        END
+    GROUP BY creation_timestamp, revision
+    ORDER BY creation_timestamp DESC
+    LIMIT 64
+)
+
+SELECT
+    coalesce(
+        json_agg(
+            json_build_object(
+                'creation_timestamp',
+                extract(EPOCH FROM creation_timestamp)::DOUBLE PRECISION,
+                'revision', revision,
+                'value', value
+            ) ORDER BY creation_timestamp ASC
+        ),
+        '[]'
+    )::TEXT AS elements
+FROM page;
+
+
+-- name: read-next-logs
+-- Return the page as a JSON array in chronological order. The cursor is the
+-- timestamp and the sequence number of the last element, which breaks ties
+-- between logs with the same timestamp. Without a sequence number, the page
+-- starts after all logs with the cursor's timestamp. We use one query per
+-- direction and write the cursor as a row comparison on the columns of the
+-- index, so that the planner can use an index scan even with a generic plan.
+-- The redundant comparison on the timestamp lets TimescaleDB exclude chunks.
+WITH page AS (
+    SELECT
+        severity,
+        message,
+        revision,
+        creation_timestamp,
+        sequence
+    FROM log
+    WHERE
+        sensor_identifier = ${sensor_identifier}
+        AND creation_timestamp >= coalesce(
+            ${creation_timestamp}::TIMESTAMPTZ, '-infinity'
+        )
+        AND (creation_timestamp, sequence) > (
+            coalesce(${creation_timestamp}::TIMESTAMPTZ, '-infinity'),
+            coalesce(${sequence}::BIGINT, 9223372036854775807)
+        )
+    ORDER BY creation_timestamp ASC, sequence ASC
+    LIMIT 64
+)
+
+SELECT
+    coalesce(
+        json_agg(
+            json_build_object(
+                'severity', severity,
+                'message', message,
+                'revision', revision,
+                'creation_timestamp',
+                extract(EPOCH FROM creation_timestamp)::DOUBLE PRECISION,
+                'sequence', sequence
+            ) ORDER BY creation_timestamp ASC, sequence ASC
+        ),
+        '[]'
+    )::TEXT AS elements
+FROM page;
+
+
+-- name: read-previous-logs
+WITH page AS (
+    SELECT
+        severity,
+        message,
+        revision,
+        creation_timestamp,
+        sequence
+    FROM log
+    WHERE
+        sensor_identifier = ${sensor_identifier}
+        AND creation_timestamp <= coalesce(
+            ${creation_timestamp}::TIMESTAMPTZ, 'infinity'
+        )
+        AND (creation_timestamp, sequence) < (
+            coalesce(${creation_timestamp}::TIMESTAMPTZ, 'infinity'),
+            coalesce(${sequence}::BIGINT, 0)
+        )
+    ORDER BY creation_timestamp DESC, sequence DESC
+    LIMIT 64
+)
+
+SELECT
+    coalesce(
+        json_agg(
+            json_build_object(
+                'severity', severity,
+                'message', message,
+                'revision', revision,
+                'creation_timestamp',
+                extract(EPOCH FROM creation_timestamp)::DOUBLE PRECISION,
+                'sequence', sequence
+            ) ORDER BY creation_timestamp ASC, sequence ASC
+        ),
+        '[]'
+    )::TEXT AS elements
+FROM page;
+
+
+-- name: read-measurements-series
+-- Return the measurements in the time range as one series per attribute for
+-- downsampling.
+SELECT
+    attribute,
+    array_agg(
+        extract(EPOCH FROM creation_timestamp)::DOUBLE PRECISION
+        ORDER BY creation_timestamp ASC
+    ) AS timestamps,
+    array_agg(value ORDER BY creation_timestamp ASC) AS values
+FROM measurement
+WHERE
+    sensor_identifier = ${sensor_identifier}
+    AND creation_timestamp >= ${start_timestamp}
+    AND creation_timestamp < ${end_timestamp}
+GROUP BY attribute;
+
+
+-- name: read-attributes
+-- Return the attributes that occur in the time range of the export.
+SELECT DISTINCT attribute
 FROM measurement
 WHERE
     sensor_identifier = ${sensor_identifier}
     AND CASE
-        WHEN ${creation_timestamp}::TIMESTAMPTZ IS NOT NULL
-            THEN creation_timestamp > ${creation_timestamp}
+        WHEN ${start_timestamp}::TIMESTAMPTZ IS NOT NULL
+            THEN creation_timestamp >= ${start_timestamp}
+        ELSE TRUE
+    END
+    AND CASE
+        WHEN ${end_timestamp}::TIMESTAMPTZ IS NOT NULL
+            THEN creation_timestamp < ${end_timestamp}
         ELSE TRUE
     END
-GROUP BY creation_timestamp, revision
-ORDER BY creation_timestamp ASC
-LIMIT 64;
+ORDER BY attribute ASC;
 
 
--- name: read-previous-measurements
+-- name: export-measurements
+-- Return the measurements in the time range in chronological order, one element
+-- per attribute. The range is inclusive at the start and exclusive at the end.
+-- The attributes of a data point are adjacent, so that they can be pivoted into
+-- one row while streaming.
 SELECT
     creation_timestamp,
     revision,
-    jsonb_object_agg(attribute, value) AS value
+    attribute,
+    value
 FROM measurement
 WHERE
     sensor_identifier = ${sensor_identifier}
     AND CASE
-        WHEN ${creation_timestamp}::TIMESTAMPTZ IS NOT NULL
-            THEN creation_timestamp < ${creation_timestamp}
+        WHEN ${start_timestamp}::TIMESTAMPTZ IS NOT NULL
+            THEN creation_timestamp >= ${start_timestamp}
+        ELSE TRUE
+    END
+    AND CASE
+        WHEN ${end_timestamp}::TIMESTAMPTZ IS NOT NULL
+            THEN creation_timestamp < ${end_timestamp}
         ELSE TRUE
     END
-GROUP BY creation_timestamp, revision
-ORDER BY creation_timestamp DESC
-LIMIT 64;
+ORDER BY creation_timestamp ASC, revision ASC;
 
 
--- name: read-logs
+-- name: export-logs
 SELECT
-    severity,
-    message,
+    creation_timestamp,
     revision,
-    creation_timestamp
+    severity,
+    message
 FROM log
 WHERE
     sensor_identifier = ${sensor_identifier}
     AND CASE
-        WHEN ${creation_timestamp}::TIMESTAMPTZ IS NOT NULL
-            THEN (
-                CASE
-                    WHEN ${direction} = 'next'
-                        THEN creation_timestamp > ${creation_timestamp}
-                    WHEN ${direction} = 'previous'
-                        THEN creation_timestamp < ${creation_timestamp}
-                    ELSE TRUE
-                END
-            )
+        WHEN ${start_timestamp}::TIMESTAMPTZ IS NOT NULL
+            THEN creation_timestamp >= ${start_timestamp}
         ELSE TRUE
     END
-ORDER BY
-    CASE WHEN ${direction} = 'next' THEN creation_timestamp END ASC,
-    CASE WHEN ${direction} = 'previous' THEN creation_timestamp END DESC
-LIMIT 64;
+    AND CASE
+        WHEN ${end_timestamp}::TIMESTAMPTZ IS NOT NULL
+            THEN creation_timestamp < ${end_timestamp}
+        ELSE TRUE
+    END
+ORDER BY creation_timestamp ASC, sequence ASC;
 
 
 -- name: read-user
@@ -289,48 +746,248 @@ WHERE
     AND sensor.identifier = ${sensor_identifier};
 
 
+-- name: authenticate-and-authorize-resource-sensor
+-- Resolve the access token and the requester's relationship with the sensor
+-- in a single round trip. Always returns exactly one element. The
+-- user_identifier is NULL if the access token is invalid, the
+-- sensor_identifier is NULL if the network or sensor doesn't exist, and the
+-- permission_identifier is NULL if permissions are missing.
+SELECT
+    session.user_identifier,
+    sensor.identifier AS sensor_identifier,
+    permission.user_identifier AS permission_identifier
+FROM (SELECT 1) AS anchor
+LEFT JOIN session ON session.access_token_hash = ${access_token_hash}
+LEFT JOIN sensor
+    ON
+        sensor.network_identifier = ${network_identifier}
+        AND sensor.identifier = ${sensor_identifier}
+LEFT JOIN permission
+    ON
+        session.user_identifier = permission.user_identifier
+        AND sensor.network_identifier = permission.network_identifier;
+
+
 -- name: create-configuration
+-- Take the next revision from the sensor's counter. The row lock on the sensor
+-- queues concurrent creations instead of failing them.
+WITH counter AS (
+    UPDATE sensor
+    SET next_revision = next_revision + 1
+    WHERE identifier = ${sensor_identifier}
+    RETURNING identifier, next_revision
+)
+
 INSERT INTO configuration (
     sensor_identifier,
     revision,
     creation_timestamp,
     value
 )
-VALUES (
-    ${sensor_identifier},
-    (
-        SELECT coalesce(max(revision) + 1, 0)
-        FROM configuration
-        WHERE sensor_identifier = ${sensor_identifier}
-    ),
-    now(),
-    ${configuration}
-)
+SELECT
+    identifier,
+    next_revision - 1 AS revision,
+    now() AS creation_timestamp,
+    ${configuration} AS value
+FROM counter
 RETURNING revision;
 
 
--- name: update-configuration-on-publication
+-- name: create-configurations
+-- Create a revision of the configuration for each selected sensor in the
+-- network in a single statement. If no sensors are given, all are selected.
+-- The sensors are locked in a fixed order, so that concurrent rollouts can't
+-- deadlock.
+WITH selection AS (
+    SELECT identifier
+    FROM sensor
+    WHERE
+        network_identifier = ${network_identifier}
+        AND (
+            ${sensor_identifiers}::TEXT []::UUID [] IS NULL
+            OR identifier = any(${sensor_identifiers}::TEXT []::UUID [])
+        )
+    ORDER BY identifier ASC
+    FOR UPDATE
+),
+
+counter AS (
+    UPDATE sensor
+    SET next_revision = sensor.next_revision + 1
+    FROM selection
+    WHERE sensor.identifier = selection.identifier
+    RETURNING sensor.identifier, sensor.next_revision
+)
+
+INSERT INTO configuration (
+    sensor_identifier,
+    revision,
+    creation_timestamp,
+    value
+)
+SELECT
+    identifier,
+    next_revision - 1 AS revision,
+    now() AS creation_timestamp,
+    ${configuration} AS value
+FROM counter
+RETURNING sensor_identifier, revision;
+
+
+-- name: claim-unpublished-configurations
+-- Claim a batch of configurations that are due for publication by leasing
+-- them for a number of seconds. Only the oldest unpublished revision of each
+-- sensor is eligible, so that the revisions are published in order, even if
+-- multiple servers publish concurrently. Rows that another server is claiming
+-- or has leased, and rows that back off after a failed publication, are
+-- skipped. The leases of servers that stopped expire.
+WITH due AS (
+    SELECT
+        configuration.sensor_identifier,
+        configuration.revision
+    FROM configuration
+    WHERE
+        configuration.publication_timestamp IS NULL
+        AND (
+            configuration.publication_lease_timestamp IS NULL
+            OR configuration.publication_lease_timestamp <= now()
+        )
+        AND NOT EXISTS (
+            SELECT
+            FROM configuration AS previous
+            WHERE
+                previous.sensor_identifier = configuration.sensor_identifier
+                AND previous.revision < configuration.revision
+                AND previous.publication_timestamp IS NULL
+        )
+    ORDER BY configuration.creation_timestamp ASC
+    FOR UPDATE SKIP LOCKED
+    LIMIT ${batch_size}
+)
+
+UPDATE configuration
+SET publication_lease_timestamp = now() + make_interval(secs => ${lease})
+WHERE (sensor_identifier, revision) IN (
+    SELECT
+        sensor_identifier,
+        revision
+    FROM due
+)
+RETURNING sensor_identifier, revision, value;
+
+
+-- name: update-configurations-on-publication
+UPDATE configuration
+SET
+    publication_timestamp = now(),
+    publication_lease_timestamp = NULL
+FROM
+    unnest(
+        ${sensor_identifiers}::TEXT []::UUID [],
+        ${revisions}::INT []
+    ) AS published (sensor_identifier, revision)
+WHERE
+    configuration.sensor_identifier = published.sensor_identifier
+    AND configuration.revision = published.revision;
+
+
+-- name: update-configurations-on-publication-failure
+-- Back off exponentially per configuration, up to about 5 minutes, with jitter.
 UPDATE configuration
-SET publication_timestamp = now()
+SET
+    publication_attempts = configuration.publication_attempts + 1,
+    publication_lease_timestamp = now() + make_interval(
+        secs => least(2 ^ configuration.publication_attempts, 256)
+        + random()
+        - 0.5
+    )
+FROM
+    unnest(
+        ${sensor_identifiers}::TEXT []::UUID [],
+        ${revisions}::INT []
+    ) AS failed (sensor_identifier, revision)
 WHERE
-    sensor_identifier = ${sensor_identifier}
-    AND revision = ${revision}
-    AND publication_timestamp IS NULL;
+    configuration.sensor_identifier = failed.sensor_identifier
+    AND configuration.revision = failed.revision;
 
 
--- name: update-configuration-on-acknowledgment
+-- name: update-configurations-on-acknowledgment
+-- Apply a batch of acknowledgments from parallel arrays in a single statement
+-- and return the matched ones. The arrays must not contain the same sensor and
+-- revision twice. Nonexistent sensors or revisions and revisions that were
+-- already acknowledged don't match any row.
 UPDATE configuration
 SET
-    acknowledgment_timestamp = ${acknowledgment_timestamp},
+    acknowledgment_timestamp = to_timestamp(
+        acknowledgment.acknowledgment_timestamp
+    ),
     receipt_timestamp = now(),
-    success = ${success}
+    success = acknowledgment.success
+FROM
+    unnest(
+        ${sensor_identifiers}::TEXT []::UUID [],
+        ${revisions}::INT [],
+        ${successes}::BOOLEAN [],
+        ${acknowledgment_timestamps}::DOUBLE PRECISION []
+    ) AS acknowledgment (
+        sensor_identifier, revision, success, acknowledgment_timestamp
+    )
 WHERE
-    sensor_identifier = ${sensor_identifier}
-    AND revision = ${revision}
-    AND acknowledgment_timestamp IS NULL;
+    configuration.sensor_identifier = acknowledgment.sensor_identifier
+    AND configuration.revision = acknowledgment.revision
+    AND configuration.acknowledgment_timestamp IS NULL
+RETURNING configuration.sensor_identifier, configuration.revision;
 
 
 -- name: update-sensor
 UPDATE sensor
 SET name = ${sensor_name}
 WHERE identifier = ${sensor_identifier};
+
+
+-- name: read-measurement-policies
+SELECT
+    max(
+        CASE
+            WHEN proc_name = 'policy_compression'
+                THEN (config ->> 'compress_after')::INTERVAL
+        END
+    ) AS compress_after,
+    max(
+        CASE
+            WHEN proc_name = 'policy_retention'
+                THEN (config ->> 'drop_after')::INTERVAL
+        END
+    ) AS drop_after
+FROM timescaledb_information.jobs
+WHERE hypertable_schema = 'public' AND hypertable_name = 'measurement';
+
+
+-- name: create-measurement-compression-policy
+SELECT add_compression_policy(
+    hypertable => 'measurement',
+    compress_after => make_interval(days => ${days}),
+    if_not_exists => TRUE
+);
+
+
+-- name: delete-measurement-compression-policy
+SELECT remove_compression_policy(
+    hypertable => 'measurement',
+    if_exists => TRUE
+);
+
+
+-- name: create-measurement-retention-policy
+SELECT add_retention_policy(
+    relation => 'measurement',
+    drop_after => make_interval(days => ${days}),
+    if_not_exists => TRUE
+);
+
+
+-- name: delete-measurement-retention-policy
+SELECT remove_retention_policy(
+    relation => 'measurement',
+    if_exists => TRUE
+);
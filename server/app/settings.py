@@ -18,9 +18,71 @@ POSTGRESQL_PORT = int(os.environ["POSTGRESQL_PORT"])
 POSTGRESQL_IDENTIFIER = os.environ["POSTGRESQL_IDENTIFIER"]
 POSTGRESQL_PASSWORD = os.environ["POSTGRESQL_PASSWORD"]
 POSTGRESQL_DATABASE = os.environ["POSTGRESQL_DATABASE"]
+# Number of prepared statements cached per connection and whether to prepare the
+# statements on the hot paths when a connection is opened
+POSTGRESQL_STATEMENT_CACHE_SIZE = int(
+    os.environ.get("POSTGRESQL_STATEMENT_CACHE_SIZE", 128)
+)
+POSTGRESQL_PREPARE = os.environ.get("POSTGRESQL_PREPARE", "true").lower() == "true"
+# Minimum and maximum number of connections of the pool serving the API routes, of
+# the separate pool serving the MQTT ingestion, so that reads don't queue behind
+# writes, and of the pool serving the exports, which hold their connection for the
+# whole export
+POSTGRESQL_POOL_MIN_SIZE = int(os.environ.get("POSTGRESQL_POOL_MIN_SIZE", 2))
+POSTGRESQL_POOL_MAX_SIZE = int(os.environ.get("POSTGRESQL_POOL_MAX_SIZE", 4))
+POSTGRESQL_INGEST_POOL_MIN_SIZE = int(
+    os.environ.get("POSTGRESQL_INGEST_POOL_MIN_SIZE", 1)
+)
+POSTGRESQL_INGEST_POOL_MAX_SIZE = int(
+    os.environ.get("POSTGRESQL_INGEST_POOL_MAX_SIZE", 2)
+)
+POSTGRESQL_EXPORT_POOL_MIN_SIZE = int(
+    os.environ.get("POSTGRESQL_EXPORT_POOL_MIN_SIZE", 0)
+)
+POSTGRESQL_EXPORT_POOL_MAX_SIZE = int(
+    os.environ.get("POSTGRESQL_EXPORT_POOL_MAX_SIZE", 2)
+)
 
 # MQTT connection details
 MQTT_HOSTNAME = os.environ["MQTT_HOSTNAME"]
 MQTT_PORT = int(os.environ["MQTT_PORT"])
 MQTT_IDENTIFIER = os.environ["MQTT_IDENTIFIER"]
 MQTT_PASSWORD = os.environ["MQTT_PASSWORD"]
+# Name of the MQTT v5 shared subscription group; If set, each server process connects
+# with its own client identifier and the processes share the incoming messages
+MQTT_SHARED_GROUP = os.environ.get("MQTT_SHARED_GROUP")
+# Number of concurrent workers handling incoming MQTT messages and the maximum number
+# of messages waiting per worker before we stop reading from the broker
+MQTT_WORKERS = int(os.environ.get("MQTT_WORKERS", 4))
+MQTT_QUEUE_SIZE = int(os.environ.get("MQTT_QUEUE_SIZE", 64))
+
+# Maximum number of passwords that are hashed or verified concurrently
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", 2))
+
+# Size and time to live in seconds of the in-process caches for access tokens and
+# authorization relationships
+CACHE_SIZE = int(os.environ.get("CACHE_SIZE", 4096))
+CACHE_TTL = float(os.environ.get("CACHE_TTL", 60))
+
+# Measurement ingestion; Buffered measurements are written to the database when the
+# buffer holds this many rows or after this many seconds, whichever comes first
+INGEST_BUFFER_SIZE = int(os.environ.get("INGEST_BUFFER_SIZE", 4096))
+INGEST_BUFFER_INTERVAL = float(os.environ.get("INGEST_BUFFER_INTERVAL", 1))
+
+# Configuration publication; At most this many configurations are published at once,
+# and the database is checked for pending publications every this many seconds
+PUBLICATION_BATCH_SIZE = int(os.environ.get("PUBLICATION_BATCH_SIZE", 64))
+PUBLICATION_INTERVAL = float(os.environ.get("PUBLICATION_INTERVAL", 10))
+
+# Whether to serve the metrics at /metrics; The route is not authenticated, so it
+# must only be enabled when it is not reachable from the public internet
+METRICS = os.environ.get("METRICS", "false").lower() == "true"
+
+# Measurements are compressed after this many days and, if set, deleted after this
+# many days; Deleted measurements remain available in the continuous aggregates
+MEASUREMENT_COMPRESSION_DAYS = int(os.environ.get("MEASUREMENT_COMPRESSION_DAYS", 7))
+MEASUREMENT_RETENTION_DAYS = (
+    int(os.environ["MEASUREMENT_RETENTION_DAYS"])
+    if "MEASUREMENT_RETENTION_DAYS" in os.environ
+    else None
+)
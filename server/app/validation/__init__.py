@@ -1,6 +1,7 @@
 from .mqtt import (
     Acknowledgment,
     AcknowledgmentsValidator,
+    IdentifierValidator,
     Log,
     LogsValidator,
     Measurement,
@@ -8,17 +9,25 @@ from .mqtt import (
 )
 from .routes import (
     CreateConfigurationRequest,
+    CreateConfigurationsRequest,
     CreateNetworkRequest,
     CreateSensorRequest,
     CreateSessionRequest,
     CreateUserRequest,
+    ExportLogsRequest,
+    ExportMeasurementsRequest,
     ReadConfigurationsRequest,
+    ReadLatestMeasurementsRequest,
     ReadLogsAggregatesRequest,
     ReadLogsRequest,
     ReadMeasurementsRequest,
+    ReadMetricsRequest,
+    ReadNetworkLatestMeasurementsRequest,
+    ReadNetworkRequest,
     ReadNetworksRequest,
     ReadSensorsRequest,
     ReadStatusRequest,
+    StreamEventsRequest,
     UpdateSensorRequest,
     validate,
 )
@@ -28,6 +37,7 @@ __all__ = [
     "Acknowledgment",
     "Measurement",
     "Log",
+    "IdentifierValidator",
     "AcknowledgmentsValidator",
     "MeasurementsValidator",
     "LogsValidator",
@@ -35,13 +45,21 @@ __all__ = [
     "CreateUserRequest",
     "CreateSessionRequest",
     "CreateConfigurationRequest",
+    "CreateConfigurationsRequest",
     "ReadLogsAggregatesRequest",
     "ReadLogsRequest",
     "ReadConfigurationsRequest",
     "CreateNetworkRequest",
     "ReadMeasurementsRequest",
+    "ReadLatestMeasurementsRequest",
+    "ReadNetworkLatestMeasurementsRequest",
+    "ExportMeasurementsRequest",
+    "ExportLogsRequest",
+    "StreamEventsRequest",
     "ReadStatusRequest",
+    "ReadMetricsRequest",
     "ReadSensorsRequest",
+    "ReadNetworkRequest",
     "ReadNetworksRequest",
     "UpdateSensorRequest",
     "validate",
@@ -6,6 +6,9 @@ class Limit(int, enum.Enum):
     MEDIUM = 2**8  # 256
     LARGE = 2**14  # 16384
     MAXINT4 = 2**31  # Maximum value signed 32-bit integer + 1
+    MAXINT8 = 2**63  # Maximum value signed 64-bit integer + 1
+    MINTIMESTAMP = -210866803200  # Minimum unix timestamp of PostgreSQL, 4713 BC
+    MAXTIMESTAMP = 9224318016000  # Maximum unix timestamp of PostgreSQL + 1, 294277 AD
 
 
 class Pattern(str, enum.Enum):
@@ -48,3 +48,11 @@ MeasurementsValidator = pydantic.TypeAdapter(
 LogsValidator = pydantic.TypeAdapter(
     pydantic.conlist(item_type=Log, min_length=1),
 )
+
+
+########################################################################################
+# Validator for the sensor identifiers in the topics
+########################################################################################
+
+
+IdentifierValidator = pydantic.TypeAdapter(types.Identifier)
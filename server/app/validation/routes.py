@@ -4,11 +4,18 @@ import logging
 import typing
 
 import app.errors as errors
+import app.metrics as metrics
 import app.validation.types as types
 
 
 logger = logging.getLogger(__name__)
 
+_FAILURES = metrics.Counter(
+    name="http_validation_failures",
+    description="Number of requests that failed validation",
+    label="route",
+)
+
 
 ########################################################################################
 # Route validation decorator
@@ -33,6 +40,7 @@ def validate(schema):
                     f"{request.method} {request.url.path} -- Request failed validation:"
                     f" {repr(e)}"
                 )
+                _FAILURES.increment(func.__name__)
                 raise errors.BadRequestError()
             # TODO Requests are immutable, so we modify the scope and recreate one
             # TODO Integrate into request instead + remove frozen=False from StrictModel
@@ -55,6 +63,10 @@ class _ReadStatusRequestPath(types.StrictModel):
     pass
 
 
+class _ReadMetricsRequestPath(types.StrictModel):
+    pass
+
+
 class _CreateUserRequestPath(types.StrictModel):
     pass
 
@@ -75,6 +87,10 @@ class _CreateSensorRequestPath(types.StrictModel):
     network_identifier: types.Identifier
 
 
+class _ReadNetworkRequestPath(types.StrictModel):
+    network_identifier: types.Identifier
+
+
 class _ReadSensorsRequestPath(types.StrictModel):
     network_identifier: types.Identifier
 
@@ -84,6 +100,10 @@ class _UpdateSensorRequestPath(types.StrictModel):
     sensor_identifier: types.Identifier
 
 
+class _CreateConfigurationsRequestPath(types.StrictModel):
+    network_identifier: types.Identifier
+
+
 class _CreateConfigurationRequestPath(types.StrictModel):
     network_identifier: types.Identifier
     sensor_identifier: types.Identifier
@@ -104,6 +124,30 @@ class _ReadLogsRequestPath(types.StrictModel):
     sensor_identifier: types.Identifier
 
 
+class _ExportMeasurementsRequestPath(types.StrictModel):
+    network_identifier: types.Identifier
+    sensor_identifier: types.Identifier
+
+
+class _ExportLogsRequestPath(types.StrictModel):
+    network_identifier: types.Identifier
+    sensor_identifier: types.Identifier
+
+
+class _StreamEventsRequestPath(types.StrictModel):
+    network_identifier: types.Identifier
+    sensor_identifier: types.Identifier
+
+
+class _ReadLatestMeasurementsRequestPath(types.StrictModel):
+    network_identifier: types.Identifier
+    sensor_identifier: types.Identifier
+
+
+class _ReadNetworkLatestMeasurementsRequestPath(types.StrictModel):
+    network_identifier: types.Identifier
+
+
 class _ReadLogsAggregatesRequestPath(types.StrictModel):
     network_identifier: types.Identifier
     sensor_identifier: types.Identifier
@@ -118,6 +162,10 @@ class _ReadStatusRequestQuery(types.LooseModel):
     pass
 
 
+class _ReadMetricsRequestQuery(types.LooseModel):
+    pass
+
+
 class _CreateUserRequestQuery(types.LooseModel):
     pass
 
@@ -138,6 +186,10 @@ class _CreateSensorRequestQuery(types.LooseModel):
     pass
 
 
+class _ReadNetworkRequestQuery(types.LooseModel):
+    pass
+
+
 class _ReadSensorsRequestQuery(types.LooseModel):
     pass
 
@@ -146,6 +198,10 @@ class _UpdateSensorRequestQuery(types.LooseModel):
     pass
 
 
+class _CreateConfigurationsRequestQuery(types.LooseModel):
+    pass
+
+
 class _CreateConfigurationRequestQuery(types.LooseModel):
     pass
 
@@ -159,13 +215,42 @@ class _ReadMeasurementsRequestQuery(types.LooseModel):
     creation_timestamp: types.Timestamp = None
     direction: typing.Literal["next", "previous"] = "next"
     aggregate: bool = False
+    downsample: bool = False
+    start_timestamp: types.Timestamp = None
+    end_timestamp: types.Timestamp = None
+    points: types.Points = 512
 
 
 class _ReadLogsRequestQuery(types.LooseModel):
     creation_timestamp: types.Timestamp = None
+    sequence: types.Sequence = None
     direction: typing.Literal["next", "previous"] = "next"
 
 
+class _ExportMeasurementsRequestQuery(types.LooseModel):
+    start_timestamp: types.Timestamp = None
+    end_timestamp: types.Timestamp = None
+    format: typing.Literal["ndjson", "csv", "arrow", "parquet"] = "ndjson"
+
+
+class _ExportLogsRequestQuery(types.LooseModel):
+    start_timestamp: types.Timestamp = None
+    end_timestamp: types.Timestamp = None
+    format: typing.Literal["ndjson", "csv"] = "ndjson"
+
+
+class _StreamEventsRequestQuery(types.LooseModel):
+    pass
+
+
+class _ReadLatestMeasurementsRequestQuery(types.LooseModel):
+    pass
+
+
+class _ReadNetworkLatestMeasurementsRequestQuery(types.LooseModel):
+    pass
+
+
 class _ReadLogsAggregatesRequestQuery(types.LooseModel):
     pass
 
@@ -179,6 +264,10 @@ class _ReadStatusRequestBody(types.StrictModel):
     pass
 
 
+class _ReadMetricsRequestBody(types.StrictModel):
+    pass
+
+
 class _CreateUserRequestBody(types.StrictModel):
     user_name: types.Name
     password: types.Password
@@ -201,6 +290,10 @@ class _CreateSensorRequestBody(types.StrictModel):
     sensor_name: types.Name
 
 
+class _ReadNetworkRequestBody(types.StrictModel):
+    pass
+
+
 class _ReadSensorsRequestBody(types.StrictModel):
     pass
 
@@ -209,6 +302,12 @@ class _UpdateSensorRequestBody(types.StrictModel):
     sensor_name: types.Name
 
 
+class _CreateConfigurationsRequestBody(types.StrictModel):
+    configuration: types.Configuration
+    # All sensors of the network if not given
+    sensor_identifiers: types.Identifiers = None
+
+
 class _CreateConfigurationRequestBody(types.Configuration):
     pass
 
@@ -225,6 +324,26 @@ class _ReadLogsRequestBody(types.StrictModel):
     pass
 
 
+class _ExportMeasurementsRequestBody(types.StrictModel):
+    pass
+
+
+class _ExportLogsRequestBody(types.StrictModel):
+    pass
+
+
+class _StreamEventsRequestBody(types.StrictModel):
+    pass
+
+
+class _ReadLatestMeasurementsRequestBody(types.StrictModel):
+    pass
+
+
+class _ReadNetworkLatestMeasurementsRequestBody(types.StrictModel):
+    pass
+
+
 class _ReadLogsAggregatesRequestBody(types.StrictModel):
     pass
 
@@ -241,6 +360,12 @@ class ReadStatusRequest(types.StrictModel):
     body: _ReadStatusRequestBody
 
 
+class ReadMetricsRequest(types.StrictModel):
+    path: _ReadMetricsRequestPath
+    query: _ReadMetricsRequestQuery
+    body: _ReadMetricsRequestBody
+
+
 class CreateUserRequest(types.StrictModel):
     path: _CreateUserRequestPath
     query: _CreateUserRequestQuery
@@ -271,6 +396,12 @@ class CreateSensorRequest(types.StrictModel):
     body: _CreateSensorRequestBody
 
 
+class ReadNetworkRequest(types.StrictModel):
+    path: _ReadNetworkRequestPath
+    query: _ReadNetworkRequestQuery
+    body: _ReadNetworkRequestBody
+
+
 class ReadSensorsRequest(types.StrictModel):
     path: _ReadSensorsRequestPath
     query: _ReadSensorsRequestQuery
@@ -283,6 +414,12 @@ class UpdateSensorRequest(types.StrictModel):
     body: _UpdateSensorRequestBody
 
 
+class CreateConfigurationsRequest(types.StrictModel):
+    path: _CreateConfigurationsRequestPath
+    query: _CreateConfigurationsRequestQuery
+    body: _CreateConfigurationsRequestBody
+
+
 class CreateConfigurationRequest(types.StrictModel):
     path: _CreateConfigurationRequestPath
     query: _CreateConfigurationRequestQuery
@@ -307,6 +444,36 @@ class ReadLogsRequest(types.StrictModel):
     body: _ReadLogsRequestBody
 
 
+class ExportMeasurementsRequest(types.StrictModel):
+    path: _ExportMeasurementsRequestPath
+    query: _ExportMeasurementsRequestQuery
+    body: _ExportMeasurementsRequestBody
+
+
+class ExportLogsRequest(types.StrictModel):
+    path: _ExportLogsRequestPath
+    query: _ExportLogsRequestQuery
+    body: _ExportLogsRequestBody
+
+
+class StreamEventsRequest(types.StrictModel):
+    path: _StreamEventsRequestPath
+    query: _StreamEventsRequestQuery
+    body: _StreamEventsRequestBody
+
+
+class ReadLatestMeasurementsRequest(types.StrictModel):
+    path: _ReadLatestMeasurementsRequestPath
+    query: _ReadLatestMeasurementsRequestQuery
+    body: _ReadLatestMeasurementsRequestBody
+
+
+class ReadNetworkLatestMeasurementsRequest(types.StrictModel):
+    path: _ReadNetworkLatestMeasurementsRequestPath
+    query: _ReadNetworkLatestMeasurementsRequestQuery
+    body: _ReadNetworkLatestMeasurementsRequestBody
+
+
 class ReadLogsAggregatesRequest(types.StrictModel):
     path: _ReadLogsAggregatesRequestPath
     query: _ReadLogsAggregatesRequestQuery
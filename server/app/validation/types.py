@@ -39,7 +39,22 @@ Key = pydantic.constr(max_length=64, pattern=constants.Pattern.KEY.value)
 # PostgreSQL errors if an integer is out of range, so we must validate
 Revision = pydantic.conint(ge=0, lt=constants.Limit.MAXINT4)
 
-# PostgreSQL rounds if it cannot store a float in full precision, so we do not need to
-# validate min/max values here
-Timestamp = float
+# Selection of sensors, e.g. to roll out a configuration to
+Identifiers = typing.Annotated[
+    list[Identifier], pydantic.Field(min_length=1, max_length=constants.Limit.LARGE)
+]
+
+# Sequence number of a log that breaks ties between logs with the same timestamp
+Sequence = pydantic.conint(ge=0, lt=constants.Limit.MAXINT8)
+
+# Number of points that a client wants to display, e.g. the width of a plot in pixels
+Points = pydantic.conint(ge=1, le=constants.Limit.LARGE)
+
+# PostgreSQL errors if a timestamp is out of range, which would fail the whole batch
+# of rows that it's written with, so we must validate
+Timestamp = pydantic.confloat(
+    allow_inf_nan=False,
+    ge=constants.Limit.MINTIMESTAMP,
+    lt=constants.Limit.MAXTIMESTAMP,
+)
 Measurement = typing.Annotated[dict[Key, float], pydantic.Field(min_length=1)]
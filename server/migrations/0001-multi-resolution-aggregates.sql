@@ -0,0 +1,104 @@
+-- Replace the hourly continuous aggregate of the measurements with a hierarchy of
+-- continuous aggregates at 1 minute, 15 minutes, 1 hour, and 1 day resolution that
+-- carry the minimum, maximum, sum, and count. Requires TimescaleDB 2.9 or later.
+-- Statements are separated by two blank lines, like in schema.sql.
+DROP MATERIALIZED VIEW measurement_aggregation_1_hour;
+
+
+-- Continuous aggregates at multiple resolutions, each built on top of the next finer
+-- one. They carry the sum and count instead of the average, so that the coarser
+-- levels can be computed exactly from the finer ones.
+CREATE MATERIALIZED VIEW measurement_aggregation_1_minute
+WITH (timescaledb.continuous, timescaledb.materialized_only = true, timescaledb.create_group_indexes = false) AS
+    SELECT
+        sensor_identifier,
+        attribute,
+        min(value) AS minimum,
+        max(value) AS maximum,
+        sum(value) AS total,
+        count(*) AS count,
+        time_bucket('1 minute', creation_timestamp) AS bucket_timestamp
+    FROM measurement
+    GROUP BY sensor_identifier, attribute, bucket_timestamp
+WITH DATA;
+
+
+CREATE INDEX ON measurement_aggregation_1_minute (sensor_identifier ASC, bucket_timestamp ASC, attribute ASC);
+
+SELECT add_continuous_aggregate_policy(
+    continuous_aggregate => 'measurement_aggregation_1_minute',
+    start_offset => '10 days',
+    end_offset => '1 minute',
+    schedule_interval => '1 minute');
+
+
+CREATE MATERIALIZED VIEW measurement_aggregation_15_minutes
+WITH (timescaledb.continuous, timescaledb.materialized_only = true, timescaledb.create_group_indexes = false) AS
+    SELECT
+        sensor_identifier,
+        attribute,
+        min(minimum) AS minimum,
+        max(maximum) AS maximum,
+        sum(total) AS total,
+        sum(count)::BIGINT AS count,
+        time_bucket('15 minutes', bucket_timestamp) AS bucket_timestamp
+    FROM measurement_aggregation_1_minute
+    GROUP BY sensor_identifier, attribute, time_bucket('15 minutes', bucket_timestamp)
+WITH DATA;
+
+
+CREATE INDEX ON measurement_aggregation_15_minutes (sensor_identifier ASC, bucket_timestamp ASC, attribute ASC);
+
+SELECT add_continuous_aggregate_policy(
+    continuous_aggregate => 'measurement_aggregation_15_minutes',
+    start_offset => '10 days',
+    end_offset => '15 minutes',
+    schedule_interval => '15 minutes');
+
+
+CREATE MATERIALIZED VIEW measurement_aggregation_1_hour
+WITH (timescaledb.continuous, timescaledb.materialized_only = true, timescaledb.create_group_indexes = false) AS
+    SELECT
+        sensor_identifier,
+        attribute,
+        min(minimum) AS minimum,
+        max(maximum) AS maximum,
+        sum(total) AS total,
+        sum(count)::BIGINT AS count,
+        time_bucket('1 hour', bucket_timestamp) AS bucket_timestamp
+    FROM measurement_aggregation_15_minutes
+    GROUP BY sensor_identifier, attribute, time_bucket('1 hour', bucket_timestamp)
+WITH DATA;
+
+
+CREATE INDEX ON measurement_aggregation_1_hour (sensor_identifier ASC, bucket_timestamp ASC, attribute ASC);
+
+SELECT add_continuous_aggregate_policy(
+    continuous_aggregate => 'measurement_aggregation_1_hour',
+    start_offset => '10 days',
+    end_offset => '1 hour',
+    schedule_interval => '1 hour');
+
+
+CREATE MATERIALIZED VIEW measurement_aggregation_1_day
+WITH (timescaledb.continuous, timescaledb.materialized_only = true, timescaledb.create_group_indexes = false) AS
+    SELECT
+        sensor_identifier,
+        attribute,
+        min(minimum) AS minimum,
+        max(maximum) AS maximum,
+        sum(total) AS total,
+        sum(count)::BIGINT AS count,
+        time_bucket('1 day', bucket_timestamp) AS bucket_timestamp
+    FROM measurement_aggregation_1_hour
+    GROUP BY sensor_identifier, attribute, time_bucket('1 day', bucket_timestamp)
+WITH DATA;
+
+
+CREATE INDEX ON measurement_aggregation_1_day (sensor_identifier ASC, bucket_timestamp ASC, attribute ASC);
+
+SELECT add_continuous_aggregate_policy(
+    continuous_aggregate => 'measurement_aggregation_1_day',
+    start_offset => '10 days',
+    end_offset => '1 day',
+    schedule_interval => '1 day');
@@ -0,0 +1,28 @@
+-- Add the table with the most recent value of each of a sensor's attributes and fill
+-- it from the existing measurements. Statements are separated by two blank lines,
+-- like in schema.sql.
+CREATE TABLE sensor_latest (
+    sensor_identifier UUID NOT NULL REFERENCES sensor (identifier) ON DELETE CASCADE,
+    attribute TEXT NOT NULL,
+    value DOUBLE PRECISION NOT NULL,
+    revision INT,
+    creation_timestamp TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (sensor_identifier, attribute)
+);
+
+
+INSERT INTO sensor_latest (
+    sensor_identifier,
+    attribute,
+    value,
+    revision,
+    creation_timestamp
+)
+SELECT DISTINCT ON (sensor_identifier, attribute)
+    sensor_identifier,
+    attribute,
+    value,
+    revision,
+    creation_timestamp
+FROM measurement
+ORDER BY sensor_identifier ASC, attribute ASC, creation_timestamp DESC;
@@ -0,0 +1,7 @@
+-- Number the logs, so that the keyset pagination has a unique cursor, and index the
+-- logs per sensor along the cursor's columns. Existing logs are numbered in arbitrary
+-- order.
+ALTER TABLE log ADD COLUMN sequence BIGSERIAL;
+
+
+CREATE INDEX ON log (sensor_identifier ASC, creation_timestamp ASC, sequence ASC);
@@ -0,0 +1,8 @@
+-- Enable the native compression of the measurements. The compression and retention
+-- policies are added by the server at startup according to its settings. Requires
+-- TimescaleDB 2.11 or later, which supports modifying compressed chunks.
+ALTER TABLE measurement SET (
+    timescaledb.compress,
+    timescaledb.compress_segmentby = 'sensor_identifier, attribute',
+    timescaledb.compress_orderby = 'creation_timestamp ASC'
+);
@@ -0,0 +1,3 @@
+-- Index the configurations that are yet to be published, which the server now scans
+-- for publication instead of publishing them right after they are created.
+CREATE INDEX ON configuration (creation_timestamp ASC) WHERE publication_timestamp IS NULL;
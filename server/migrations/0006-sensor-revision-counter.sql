@@ -0,0 +1,11 @@
+-- Count the revisions of the configurations per sensor, instead of searching for the
+-- highest revision when a configuration is created.
+ALTER TABLE sensor ADD COLUMN next_revision INT NOT NULL DEFAULT 0;
+
+
+UPDATE sensor
+SET next_revision = (
+    SELECT coalesce(max(revision) + 1, 0)
+    FROM configuration
+    WHERE configuration.sensor_identifier = sensor.identifier
+);
@@ -0,0 +1,5 @@
+-- Lease the configurations to the server that publishes them, instead of locking
+-- them for the duration of the publication. The lease also defers the next attempt
+-- after a failed publication, which backs off per configuration.
+ALTER TABLE configuration ADD COLUMN publication_lease_timestamp TIMESTAMPTZ;
+ALTER TABLE configuration ADD COLUMN publication_attempts INT NOT NULL DEFAULT 0;
@@ -23,6 +23,8 @@ CREATE TABLE sensor (
     name TEXT NOT NULL,
     network_identifier UUID NOT NULL REFERENCES network (identifier) ON DELETE CASCADE,
     creation_timestamp TIMESTAMPTZ NOT NULL,
+    -- Revision of the sensor's next configuration
+    next_revision INT NOT NULL DEFAULT 0,
 
     -- Add more parameters here? e.g. description (that do not get relayed to the sensor)
 
@@ -52,6 +54,8 @@ CREATE TABLE configuration (
     revision INT NOT NULL,
     creation_timestamp TIMESTAMPTZ NOT NULL,
     publication_timestamp TIMESTAMPTZ,
+    publication_lease_timestamp TIMESTAMPTZ,
+    publication_attempts INT NOT NULL DEFAULT 0,
     acknowledgment_timestamp TIMESTAMPTZ,
     receipt_timestamp TIMESTAMPTZ,
     success BOOLEAN
@@ -61,6 +65,9 @@ CREATE TABLE configuration (
 -- revision faster
 CREATE UNIQUE INDEX ON configuration (sensor_identifier ASC, revision DESC);
 
+-- Configurations that are yet to be published are the outbox of the MQTT publication
+CREATE INDEX ON configuration (creation_timestamp ASC) WHERE publication_timestamp IS NULL;
+
 
 -- Measurements don't have a unique primary key. Enforcing that the combination of
 -- (sensor_identifier, creation_timestamp, attribute) is unique filters out duplicates
@@ -83,19 +90,95 @@ SELECT create_hypertable(
     relation => 'measurement',
     time_column_name => 'creation_timestamp');
 
+-- Compressed chunks store each sensor's attribute as a column sorted by time, which is
+-- what both the paging and the aggregations read. The compression and retention
+-- policies are managed by the server according to its settings.
+ALTER TABLE measurement SET (
+    timescaledb.compress,
+    timescaledb.compress_segmentby = 'sensor_identifier, attribute',
+    timescaledb.compress_orderby = 'creation_timestamp ASC'
+);
+
 
-CREATE MATERIALIZED VIEW measurement_aggregation_1_hour
+-- Holds the most recent value of each of a sensor's attributes, so that current readings
+-- don't have to be searched in the measurement table. Updated in bulk with the writes of
+-- the measurements.
+CREATE TABLE sensor_latest (
+    sensor_identifier UUID NOT NULL REFERENCES sensor (identifier) ON DELETE CASCADE,
+    attribute TEXT NOT NULL,
+    value DOUBLE PRECISION NOT NULL,
+    revision INT,
+    creation_timestamp TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (sensor_identifier, attribute)
+);
+
+
+-- Continuous aggregates at multiple resolutions, each built on top of the next finer
+-- one. They carry the sum and count instead of the average, so that the coarser
+-- levels can be computed exactly from the finer ones.
+CREATE MATERIALIZED VIEW measurement_aggregation_1_minute
 WITH (timescaledb.continuous, timescaledb.materialized_only = true, timescaledb.create_group_indexes = false) AS
     SELECT
         sensor_identifier,
         attribute,
-        avg(value)::DOUBLE PRECISION AS average,
-        time_bucket('1 hour', creation_timestamp) AS bucket_timestamp
+        min(value) AS minimum,
+        max(value) AS maximum,
+        sum(value) AS total,
+        count(*) AS count,
+        time_bucket('1 minute', creation_timestamp) AS bucket_timestamp
     FROM measurement
     GROUP BY sensor_identifier, attribute, bucket_timestamp
 WITH DATA;
 
 
+CREATE INDEX ON measurement_aggregation_1_minute (sensor_identifier ASC, bucket_timestamp ASC, attribute ASC);
+
+SELECT add_continuous_aggregate_policy(
+    continuous_aggregate => 'measurement_aggregation_1_minute',
+    start_offset => '10 days',
+    end_offset => '1 minute',
+    schedule_interval => '1 minute');
+
+
+CREATE MATERIALIZED VIEW measurement_aggregation_15_minutes
+WITH (timescaledb.continuous, timescaledb.materialized_only = true, timescaledb.create_group_indexes = false) AS
+    SELECT
+        sensor_identifier,
+        attribute,
+        min(minimum) AS minimum,
+        max(maximum) AS maximum,
+        sum(total) AS total,
+        sum(count)::BIGINT AS count,
+        time_bucket('15 minutes', bucket_timestamp) AS bucket_timestamp
+    FROM measurement_aggregation_1_minute
+    GROUP BY sensor_identifier, attribute, time_bucket('15 minutes', bucket_timestamp)
+WITH DATA;
+
+
+CREATE INDEX ON measurement_aggregation_15_minutes (sensor_identifier ASC, bucket_timestamp ASC, attribute ASC);
+
+SELECT add_continuous_aggregate_policy(
+    continuous_aggregate => 'measurement_aggregation_15_minutes',
+    start_offset => '10 days',
+    end_offset => '15 minutes',
+    schedule_interval => '15 minutes');
+
+
+CREATE MATERIALIZED VIEW measurement_aggregation_1_hour
+WITH (timescaledb.continuous, timescaledb.materialized_only = true, timescaledb.create_group_indexes = false) AS
+    SELECT
+        sensor_identifier,
+        attribute,
+        min(minimum) AS minimum,
+        max(maximum) AS maximum,
+        sum(total) AS total,
+        sum(count)::BIGINT AS count,
+        time_bucket('1 hour', bucket_timestamp) AS bucket_timestamp
+    FROM measurement_aggregation_15_minutes
+    GROUP BY sensor_identifier, attribute, time_bucket('1 hour', bucket_timestamp)
+WITH DATA;
+
+
 CREATE INDEX ON measurement_aggregation_1_hour (sensor_identifier ASC, bucket_timestamp ASC, attribute ASC);
 
 SELECT add_continuous_aggregate_policy(
@@ -105,22 +188,48 @@ SELECT add_continuous_aggregate_policy(
     schedule_interval => '1 hour');
 
 
+CREATE MATERIALIZED VIEW measurement_aggregation_1_day
+WITH (timescaledb.continuous, timescaledb.materialized_only = true, timescaledb.create_group_indexes = false) AS
+    SELECT
+        sensor_identifier,
+        attribute,
+        min(minimum) AS minimum,
+        max(maximum) AS maximum,
+        sum(total) AS total,
+        sum(count)::BIGINT AS count,
+        time_bucket('1 day', bucket_timestamp) AS bucket_timestamp
+    FROM measurement_aggregation_1_hour
+    GROUP BY sensor_identifier, attribute, time_bucket('1 day', bucket_timestamp)
+WITH DATA;
+
+
+CREATE INDEX ON measurement_aggregation_1_day (sensor_identifier ASC, bucket_timestamp ASC, attribute ASC);
+
+SELECT add_continuous_aggregate_policy(
+    continuous_aggregate => 'measurement_aggregation_1_day',
+    start_offset => '10 days',
+    end_offset => '1 day',
+    schedule_interval => '1 day');
+
+
 -- Logs don't have a unique primary key. Enforcing uniqueness over the combination
 -- of (sensor_identifier, creation_timestamp) could filter out duplicates, but also
--- incorrectly reject valid logs with the same timestamp. The keyset pagination's cursor
--- is thus not unique. This means that elements can potentially be skipped when they
--- are at the edges of a page. We accept this trade-off in favor of performance.
--- If this ever becomes a problem, we can generate a column that reliably makes the
--- combination unique and use that for the keyset pagination.
+-- incorrectly reject valid logs with the same timestamp. Instead, the sequence number
+-- breaks ties between logs with the same timestamp, so that the keyset pagination's
+-- cursor of (creation_timestamp, sequence) is unique and no logs are skipped at the
+-- edges of a page.
 CREATE TABLE log (
     sensor_identifier UUID NOT NULL REFERENCES sensor (identifier) ON DELETE CASCADE,
     message TEXT NOT NULL,
     severity TEXT NOT NULL,
     revision INT,
     creation_timestamp TIMESTAMPTZ NOT NULL,
-    receipt_timestamp TIMESTAMPTZ NOT NULL
+    receipt_timestamp TIMESTAMPTZ NOT NULL,
+    sequence BIGSERIAL
 );
 
+CREATE INDEX ON log (sensor_identifier ASC, creation_timestamp ASC, sequence ASC);
+
 SELECT create_hypertable(
     relation => 'log',
     time_column_name => 'creation_timestamp');
@@ -0,0 +1,397 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import statistics
+import string
+import time
+import timeit
+
+import asyncpg
+import pendulum
+import starlette.responses
+
+import app.auth as auth
+import app.database as database
+
+
+def _report(name, samples, unit="ms", scale=1000):
+    """Print the median, 99th percentile, and maximum of the samples."""
+    samples = sorted(samples)
+    print(
+        f"{name:>24}:"
+        f" p50={statistics.median(samples) * scale:8.3f}{unit}"
+        f" p99={samples[int(len(samples) * 0.99)] * scale:8.3f}{unit}"
+        f" max={samples[-1] * scale:8.3f}{unit}"
+        f" n={len(samples)}"
+    )
+
+
+@contextlib.asynccontextmanager
+async def _sensor(dbpool, measurements=0):
+    """Provide an example sensor with the given number of temperature measurements,
+    one per second. The example network is deleted afterwards.
+    """
+    network_identifier = await dbpool.fetchval(
+        "INSERT INTO network (identifier, name, creation_timestamp)"
+        " VALUES (uuid_generate_v4(), 'benchmark', now()) RETURNING identifier;"
+    )
+    try:
+        sensor_identifier = await dbpool.fetchval(
+            (
+                "INSERT INTO sensor (identifier, name, network_identifier,"
+                " creation_timestamp) VALUES (uuid_generate_v4(), 'benchmark', $1,"
+                " now()) RETURNING identifier;"
+            ),
+            network_identifier,
+        )
+        await dbpool.execute(
+            (
+                "INSERT INTO measurement (sensor_identifier, attribute, value,"
+                " revision, creation_timestamp, receipt_timestamp) SELECT $1,"
+                " 'temperature', x, 0, to_timestamp(x), now()"
+                " FROM generate_series(1, $2) AS x;"
+            ),
+            sensor_identifier,
+            measurements,
+        )
+        yield sensor_identifier
+    finally:
+        await dbpool.execute(
+            "DELETE FROM network WHERE identifier = $1;", network_identifier
+        )
+
+
+########################################################################################
+# Benchmark: Password hashing
+########################################################################################
+
+
+async def _lag(stop, samples, interval=0.001):
+    """Measure how late the event loop wakes up a sleeping task."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def passwords(concurrency=32):
+    """Compare the event loop's latency during a burst of password verifications."""
+    password_hash = auth._CONTEXT.hash("12345678")
+
+    async def inline():
+        return auth._CONTEXT.verify("12345678", password_hash)
+
+    async def offloaded():
+        return await auth.verify_password("12345678", password_hash)
+
+    for name, verify in [("inline", inline), ("offloaded", offloaded)]:
+        stop, samples = asyncio.Event(), []
+        task = asyncio.create_task(_lag(stop, samples))
+        start = time.perf_counter()
+        await asyncio.gather(*[verify() for _ in range(concurrency)])
+        duration = time.perf_counter() - start
+        stop.set()
+        await task
+        _report(f"{name} loop lag", samples)
+        print(f"{name:>24}: {concurrency} verifications in {duration:.3f}s")
+
+
+########################################################################################
+# Benchmark: Query parametrization
+########################################################################################
+
+
+def _parametrize(template, arguments):
+    """Reference implementation that compiles the query template on every call."""
+    template = string.Template(template)
+    single = isinstance(arguments, dict)
+    keys = template.get_identifiers()
+    if diff := set(arguments.keys() if single else arguments[0].keys()) - set(keys):
+        raise ValueError(f"Unknown query arguments: {diff}")
+    query = template.substitute({key: f"${i+1}" for i, key in enumerate(keys)})
+    arguments = (
+        tuple(arguments.get(key) for key in keys)
+        if single
+        else [tuple(x.get(key) for key in keys) for x in arguments]
+    )
+    return query, arguments
+
+
+async def queries(number=10000):
+    """Compare the per-call overhead of parametrizing queries on the hot paths."""
+    cases = {
+        "authenticate": {"access_token_hash": auth.hash_token("0" * 64)},
+        "create-log": [
+            {
+                "sensor_identifier": "81bf7042-e20f-4a97-ac44-c15853e3618f",
+                "message": "",
+                "severity": "info",
+                "creation_timestamp": 0.0,
+                "revision": None,
+            }
+        ] * 64,
+    }
+    for identifier, arguments in cases.items():
+        with open("app/queries.sql") as file:
+            template = {
+                statement.split("\n", 1)[0][9:]: statement.split("\n", 1)[1]
+                for statement in file.read().split("\n\n\n")
+            }[identifier]
+        before = timeit.timeit(lambda: _parametrize(template, arguments), number=number)
+        after = timeit.timeit(
+            lambda: database.parametrize(identifier, arguments), number=number
+        )
+        print(
+            f"{identifier:>24}: before={before / number * 1e6:8.2f}us"
+            f" after={after / number * 1e6:8.2f}us speedup={before / after:5.1f}x"
+        )
+
+
+########################################################################################
+# Benchmark: Type codecs
+########################################################################################
+
+
+async def _initialize_text(connection):
+    """Reference implementation of the text codecs before the binary ones."""
+    await connection.set_type_codec(
+        typename="timestamptz",
+        schema="pg_catalog",
+        encoder=lambda x: pendulum.from_timestamp(x).isoformat(),
+        decoder=lambda x: pendulum.parse(x).float_timestamp,
+    )
+    await connection.set_type_codec(
+        typename="jsonb",
+        schema="pg_catalog",
+        encoder=json.dumps,
+        decoder=json.loads,
+    )
+    await connection.set_type_codec(
+        typename="uuid",
+        schema="pg_catalog",
+        encoder=str,
+        decoder=str,
+    )
+
+
+async def codecs(history=64 * 1024, number=256, size=64):
+    """Compare the rows per second of the old text and new binary codecs on the hot
+    queries.
+
+    Writes batches of `create-measurements` and reads pages of
+    `read-next-measurements` and `export-measurements`. Runs against the database
+    configured in the environment.
+    """
+    async with (
+        database.pool(name="benchmark", min_size=1, max_size=1) as dbpool,
+        _sensor(dbpool, measurements=history) as sensor_identifier,
+    ):
+        cases = {
+            "create-measurements": {
+                "sensor_identifiers": [sensor_identifier] * size,
+                "attributes": ["humidity"] * size,
+                "values": [0.5] * size,
+                "revisions": [0] * size,
+                "creation_timestamps": [1700000000.123456 + i for i in range(size)],
+            },
+            "read-next-measurements": {
+                "sensor_identifier": sensor_identifier,
+                "creation_timestamp": 1.0,
+            },
+            "export-measurements": {
+                "sensor_identifier": sensor_identifier,
+                "start_timestamp": 1.0,
+                "end_timestamp": 1.0 + size * 16,
+            },
+        }
+        results = {}
+        for name, initialize in [
+            ("before", _initialize_text),
+            ("after", database.initialize),
+        ]:
+            async with dbpool.acquire() as connection:
+                await initialize(connection)
+                for identifier, arguments in cases.items():
+                    query, arguments = database.parametrize(identifier, arguments)
+                    start = time.perf_counter()
+                    rows = 0
+                    for _ in range(number):
+                        if identifier == "create-measurements":
+                            await connection.execute(query, *arguments)
+                            rows += size
+                        elif identifier == "read-next-measurements":
+                            await connection.fetchval(query, *arguments)
+                            rows += size
+                        else:
+                            rows += len(await connection.fetch(query, *arguments))
+                    results[identifier, name] = rows / (time.perf_counter() - start)
+        for identifier in cases.keys():
+            before, after = results[identifier, "before"], results[identifier, "after"]
+            print(
+                f"{identifier:>24}: before={before:10.0f}rows/s"
+                f" after={after:10.0f}rows/s speedup={after / before:5.1f}x"
+            )
+
+
+########################################################################################
+# Benchmark: JSON responses
+########################################################################################
+
+
+# The query that read a page of measurements before PostgreSQL built the JSON
+_READ_NEXT_MEASUREMENTS = """
+SELECT
+    creation_timestamp,
+    revision,
+    jsonb_object_agg(attribute, value) AS value
+FROM measurement
+WHERE sensor_identifier = $1 AND creation_timestamp > $2
+GROUP BY creation_timestamp, revision
+ORDER BY creation_timestamp ASC
+LIMIT 64;
+"""
+
+
+async def responses(history=64 * 1024, number=1000):
+    """Compare reading a page of measurements as records and encoding them with
+    JSONResponse against passing the JSON text that PostgreSQL builds through to the
+    response.
+
+    Reads full pages of 64 measurements through the whole route path, from the
+    query to the response. Runs against the database configured in the environment.
+    """
+    async with (
+        database.pool(name="benchmark", min_size=1, max_size=1) as dbpool,
+        _sensor(dbpool, measurements=history) as sensor_identifier,
+    ):
+        query, arguments = database.parametrize(
+            "read-next-measurements",
+            {"sensor_identifier": sensor_identifier, "creation_timestamp": 1.0},
+        )
+
+        async def before():
+            elements = await dbpool.fetch(_READ_NEXT_MEASUREMENTS, *arguments)
+            return starlette.responses.JSONResponse(
+                status_code=200, content=database.dictify(elements)
+            )
+
+        async def after():
+            element = await dbpool.fetchval(query, *arguments)
+            return starlette.responses.Response(
+                status_code=200, content=element, media_type="application/json"
+            )
+
+        for name, function in [("before", before), ("after", after)]:
+            # Both variants must respond with the same page
+            assert json.loads((await before()).body) == json.loads((await after()).body)
+            samples = []
+            start = time.process_time()
+            for _ in range(number):
+                timestamp = time.perf_counter()
+                await function()
+                samples.append(time.perf_counter() - timestamp)
+            duration = time.process_time() - start
+            _report(f"{name} latency", samples)
+            print(f"{name:>24}: cpu={duration / number * 1000:8.3f}ms per page")
+
+
+########################################################################################
+# Benchmark: Configuration revisions
+########################################################################################
+
+
+# The query that creates a configuration before the sensors counted their revisions
+_CREATE_CONFIGURATION = """
+INSERT INTO configuration (sensor_identifier, revision, creation_timestamp, value)
+VALUES (
+    $1,
+    (
+        SELECT coalesce(max(revision) + 1, 0)
+        FROM configuration
+        WHERE sensor_identifier = $1
+    ),
+    now(),
+    $2
+)
+RETURNING revision;
+"""
+
+
+async def revisions(history=100000, number=1024, concurrency=16):
+    """Compare creating configurations with the `max(revision) + 1` subquery against
+    the sensor's revision counter, for a sensor with a long revision history.
+
+    Configurations are created concurrently for the same sensor, which makes the
+    subquery fail with uniqueness violations. Runs against the database configured in
+    the environment.
+    """
+    async with (
+        database.pool(
+            name="benchmark", min_size=concurrency, max_size=concurrency
+        ) as dbpool,
+        _sensor(dbpool) as sensor_identifier,
+    ):
+        await dbpool.execute(
+            (
+                "INSERT INTO configuration (sensor_identifier, revision,"
+                " creation_timestamp, value) SELECT $1, x, now(), '{}'"
+                " FROM generate_series(0, $2 - 1) AS x;"
+            ),
+            sensor_identifier,
+            history,
+        )
+        query, arguments = database.parametrize(
+            "create-configuration",
+            {"sensor_identifier": sensor_identifier, "configuration": {}},
+        )
+        cases = [
+            ("before", _CREATE_CONFIGURATION, (sensor_identifier, {})),
+            ("after", query, arguments),
+        ]
+        for name, query, arguments in cases:
+            # Continue the counter where the history ends
+            await dbpool.execute(
+                (
+                    "UPDATE sensor SET next_revision = (SELECT max(revision) + 1"
+                    " FROM configuration WHERE sensor_identifier = $1)"
+                    " WHERE identifier = $1;"
+                ),
+                sensor_identifier,
+            )
+            samples, conflicts = [], 0
+
+            async def create():
+                nonlocal conflicts
+                start = time.perf_counter()
+                try:
+                    await dbpool.fetchval(query, *arguments)
+                except asyncpg.UniqueViolationError:
+                    conflicts += 1
+                samples.append(time.perf_counter() - start)
+
+            for _ in range(number // concurrency):
+                await asyncio.gather(*[create() for _ in range(concurrency)])
+            _report(f"{name} latency", samples)
+            print(f"{name:>24}: conflicts={conflicts}/{len(samples)}")
+
+
+########################################################################################
+# Entrypoint
+########################################################################################
+
+
+BENCHMARKS = {
+    "codecs": codecs,
+    "passwords": passwords,
+    "queries": queries,
+    "responses": responses,
+    "revisions": revisions,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", choices=BENCHMARKS.keys())
+    args = parser.parse_args()
+    asyncio.run(BENCHMARKS[args.benchmark]())
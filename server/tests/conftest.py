@@ -6,6 +6,7 @@ import os
 import asyncpg
 import pytest
 
+import app.auth as auth
 import app.database as database
 import app.utils as utils
 
@@ -106,8 +107,9 @@ async def _populate(connection, offset):
                 f'INSERT INTO "{table_name}" ({columns}) VALUES ({identifiers});',
                 [tuple(element[key] for key in keys) for element in elements],
             )
-    # Refresh the materialized views
-    await connection.execute("CALL refresh_continuous_aggregate('measurement_aggregation_1_hour', NULL, NULL);")  # fmt: skip
+    # Refresh the materialized views, from the finest to the coarsest resolution
+    for resolution in ["1_minute", "15_minutes", "1_hour", "1_day"]:
+        await connection.execute(f"CALL refresh_continuous_aggregate('measurement_aggregation_{resolution}', NULL, NULL);")  # fmt: skip
 
 
 @pytest.fixture(scope="function")
@@ -119,3 +121,14 @@ async def reset(connection, offset):
         await connection.execute("DELETE FROM network;")
     # Populate with the initial test data again
     await _populate(connection, offset)
+    # Drop cached access tokens and relationships of the previous test
+    auth._IDENTITIES.clear()
+    auth._RELATIONSHIPS.clear()
+
+
+@pytest.fixture(scope="function")
+async def compress(reset, connection):
+    """Compress the measurements of the test data for the duration of a test."""
+    await connection.execute("SELECT compress_chunk(x, if_not_compressed => true) FROM show_chunks('measurement') AS x;")  # fmt: skip
+    yield
+    await connection.execute("SELECT decompress_chunk(x, if_compressed => true) FROM show_chunks('measurement') AS x;")  # fmt: skip
@@ -0,0 +1,131 @@
+import types
+
+import pytest
+
+import app.auth as auth
+import app.errors as errors
+
+
+@pytest.fixture(scope="session")
+def access_token_hash():
+    """Provide the hash of the access token of the user with the example network."""
+    return auth.hash_token(
+        "c59805ae394cceea937163877ca31375183650586137170a69652b6d8543e869"
+    )
+
+
+def _request(access_token_hash, connection):
+    """Provide a stand-in for a request that passed the authentication middleware."""
+    return types.SimpleNamespace(
+        state=types.SimpleNamespace(
+            access_token_hash=access_token_hash, dbpool=connection
+        )
+    )
+
+
+def _sensor(network_identifier, sensor_identifier):
+    return auth.Sensor(
+        {
+            "network_identifier": network_identifier,
+            "sensor_identifier": sensor_identifier,
+        }
+    )
+
+
+########################################################################################
+# Authorization: Sensors
+########################################################################################
+
+
+async def test_authorize_sensor(
+    reset,
+    connection,
+    access_token_hash,
+    user_identifier,
+    network_identifier,
+    sensor_identifier,
+):
+    """Test that a single call resolves and caches the identity and relationship."""
+    request = _request(access_token_hash, connection)
+    resource = _sensor(network_identifier, sensor_identifier)
+    relationship = await auth.authorize(request, resource)
+    assert relationship == auth.Relationship.OWNER
+    assert request.state.identity == user_identifier
+    assert auth._IDENTITIES.get(access_token_hash) == user_identifier
+    assert auth._RELATIONSHIPS.get(resource._key(user_identifier)) == relationship
+
+
+async def test_authorize_sensor_with_cache(
+    reset, connection, access_token_hash, network_identifier, sensor_identifier
+):
+    """Test that a second request is served from the cache without the database."""
+    resource = _sensor(network_identifier, sensor_identifier)
+    await auth.authorize(_request(access_token_hash, connection), resource)
+    request = _request(access_token_hash, None)
+    assert await auth.authorize(request, resource) == auth.Relationship.OWNER
+
+
+async def test_authorize_sensor_with_invalid_authentication(
+    reset, connection, network_identifier, sensor_identifier
+):
+    """Test authorizing a sensor with an access token that doesn't exist."""
+    access_token_hash = auth.hash_token("0" * 64)
+    request = _request(access_token_hash, connection)
+    resource = _sensor(network_identifier, sensor_identifier)
+    assert await auth.authorize(request, resource) == auth.Relationship.NONE
+    assert request.state.identity is None
+    assert auth._IDENTITIES.get(access_token_hash) is None
+
+
+async def test_authorize_sensor_with_expired_authentication(
+    reset, connection, access_token_hash, network_identifier, sensor_identifier
+):
+    """Test authorizing a sensor with an access token whose session was deleted."""
+    await connection.execute(
+        "DELETE FROM session WHERE access_token_hash = $1;", access_token_hash
+    )
+    request = _request(access_token_hash, connection)
+    resource = _sensor(network_identifier, sensor_identifier)
+    assert await auth.authorize(request, resource) == auth.Relationship.NONE
+
+
+async def test_authorize_sensor_with_nonexistent_sensor(
+    reset,
+    connection,
+    access_token_hash,
+    user_identifier,
+    network_identifier,
+    identifier,
+):
+    """Test that nonexistent sensors raise but still cache the identity."""
+    request = _request(access_token_hash, connection)
+    resource = _sensor(network_identifier, identifier)
+    with pytest.raises(errors.NotFoundError):
+        await auth.authorize(request, resource)
+    assert auth._IDENTITIES.get(access_token_hash) == user_identifier
+    assert auth._RELATIONSHIPS.get(resource._key(user_identifier)) is None
+
+
+async def test_authorize_sensor_with_foreign_network(
+    reset, connection, access_token_hash, user_identifier
+):
+    """Test authorizing a sensor in a network without permissions."""
+    request = _request(access_token_hash, connection)
+    resource = _sensor(
+        "2f9a5285-4ce1-4ddb-a268-0164c70f4826", "23825517-4631-4beb-acd4-5545c57a9928"
+    )
+    assert await auth.authorize(request, resource) == auth.Relationship.DEFAULT
+    assert (
+        auth._RELATIONSHIPS.get(resource._key(user_identifier))
+        == auth.Relationship.DEFAULT
+    )
+
+
+async def test_authorize_sensor_with_mismatched_network(
+    reset, connection, access_token_hash, sensor_identifier
+):
+    """Test that a sensor can't be reached through another network."""
+    request = _request(access_token_hash, connection)
+    resource = _sensor("a9727106-63d2-4a2e-9bbc-3203742d0d55", sensor_identifier)
+    with pytest.raises(errors.NotFoundError):
+        await auth.authorize(request, resource)
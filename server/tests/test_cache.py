@@ -0,0 +1,60 @@
+import time
+
+import app.cache as cache
+
+
+########################################################################################
+# Cache
+########################################################################################
+
+
+def test_cache_get():
+    """Test reading a cached and a missing entry."""
+    x = cache.Cache(name="test", size=2, ttl=60)
+    x.set("a", 1)
+    assert x.get("a") == 1
+    assert x.get("b") is None
+
+
+def test_cache_with_expired_entry(monkeypatch):
+    """Test that entries expire after their time to live."""
+    x = cache.Cache(name="test", size=2, ttl=60)
+    x.set("a", 1)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert x.get("a") is None
+
+
+def test_cache_with_full_cache():
+    """Test that the least recently used entry is evicted when the cache is full."""
+    x = cache.Cache(name="test", size=2, ttl=60)
+    x.set("a", 1)
+    x.set("b", 2)
+    x.get("a")
+    x.set("c", 3)
+    assert len(x) == 2
+    assert x.get("a") == 1
+    assert x.get("b") is None
+    assert x.get("c") == 3
+
+
+def test_cache_evict():
+    """Test removing entries by a predicate over their keys."""
+    x = cache.Cache(name="test", size=4, ttl=60)
+    x.set(("network", "user", "a"), 1)
+    x.set(("network", "user", "b"), 2)
+    x.set(("network", "other", "a"), 3)
+    x.evict(lambda key: key[1] == "user")
+    assert len(x) == 1
+    assert x.get(("network", "other", "a")) == 3
+
+
+def test_cache_metrics():
+    """Test that hits and misses are counted."""
+    x = cache.Cache(name="metrics", size=2, ttl=60)
+    x.set("a", 1)
+    x.get("a")
+    x.get("b")
+    x.get("b")
+    assert cache._HITS.values["metrics"] == 1
+    assert cache._MISSES.values["metrics"] == 2
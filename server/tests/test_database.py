@@ -0,0 +1,177 @@
+import datetime
+
+import pytest
+
+import app.database as database
+import app.settings as settings
+
+
+########################################################################################
+# Query parametrization
+########################################################################################
+
+
+def test_parametrize():
+    """Test translating named arguments into numbered arguments."""
+    query, arguments = database.parametrize(
+        identifier="update-sensor",
+        arguments={"sensor_name": "bulbasaur", "sensor_identifier": "x"},
+    )
+    assert "${" not in query
+    assert arguments == ("bulbasaur", "x")
+
+
+def test_parametrize_with_multiple():
+    """Test translating a batch of named arguments for executemany."""
+    query, arguments = database.parametrize(
+        identifier="update-sensor",
+        arguments=[{"sensor_name": "bulbasaur", "sensor_identifier": "x"}] * 2,
+    )
+    assert arguments == [("bulbasaur", "x")] * 2
+
+
+def test_parametrize_with_missing_arguments():
+    """Test that missing arguments are filled with None."""
+    _, arguments = database.parametrize(
+        identifier="update-sensor", arguments={"sensor_name": "bulbasaur"}
+    )
+    assert arguments == ("bulbasaur", None)
+
+
+def test_parametrize_with_unknown_arguments():
+    """Test that unknown arguments raise an error."""
+    with pytest.raises(ValueError):
+        database.parametrize(identifier="update-sensor", arguments={"example": 0})
+
+
+########################################################################################
+# Type codecs
+########################################################################################
+
+
+@pytest.mark.parametrize(
+    "timestamp", [0.0, 1.5, -3600.25, 1700000000.123456, -946684800.000001]
+)
+def test_timestamp_codec(timestamp):
+    """Test that timestamps survive the round trip through the binary format."""
+    assert database._decode_timestamp(database._encode_timestamp(timestamp)) == (
+        pytest.approx(timestamp, abs=1e-6)
+    )
+
+
+def test_timestamp_codec_with_postgresql_epoch():
+    """Test that timestamps are encoded relative to PostgreSQL's epoch."""
+    assert database._encode_timestamp(946684800.0) == (0,)
+    assert database._encode_timestamp(0.000001) == (1 - database._EPOCH,)
+    assert database._decode_timestamp((-1,)) == 946684799.999999
+
+
+def test_json_codec():
+    """Test that JSON values survive the round trip and carry the version byte."""
+    value = {"temperature": 21.5, "cache": True, "strategy": "default"}
+    encoded = database._encode_json(value)
+    assert encoded[:1] == b"\x01"
+    assert database._decode_json(encoded) == value
+
+
+def test_uuid_codec(identifier, sensor_identifier):
+    """Test that UUIDs survive the round trip through their 16 raw bytes."""
+    for x in [identifier, sensor_identifier]:
+        encoded = database._encode_uuid(x)
+        assert len(encoded) == 16
+        assert database._decode_uuid(encoded) == x
+
+
+async def test_codecs(connection, sensor_identifier):
+    """Test that the codecs agree with PostgreSQL's own conversions."""
+    element = await connection.fetchrow(
+        """
+        SELECT
+            $1::TIMESTAMPTZ = to_timestamp(-3600.25) AS timestamp,
+            $2::JSONB = '{"value": [1, 2.5]}'::JSONB AS json,
+            $3::UUID = '81bf7042-e20f-4a97-ac44-c15853e3618f'::UUID AS uuid,
+            to_timestamp(1700000000.123456) AS decoded_timestamp,
+            '{"value": [1, 2.5]}'::JSONB AS decoded_json,
+            '81bf7042-e20f-4a97-ac44-c15853e3618f'::UUID AS decoded_uuid;
+        """,
+        -3600.25,
+        {"value": [1, 2.5]},
+        sensor_identifier,
+    )
+    assert element["timestamp"] and element["json"] and element["uuid"]
+    assert element["decoded_timestamp"] == 1700000000.123456
+    assert element["decoded_json"] == {"value": [1, 2.5]}
+    assert element["decoded_uuid"] == sensor_identifier
+
+
+########################################################################################
+# Prepared statements
+########################################################################################
+
+
+async def _statements(connection):
+    """Return the statements prepared in the connection's session."""
+    elements = await connection.fetch("SELECT statement FROM pg_prepared_statements;")
+    return {element["statement"] for element in elements}
+
+
+async def test_warm(connection):
+    """Test that the hot statements are prepared and reused by later executions."""
+    await database.warm(connection)
+    statements = await _statements(connection)
+    for identifier in database._HOT:
+        assert database.queries[identifier].sql in statements
+    # A cache miss would prepare the statement again under a new name
+    query, arguments = database.parametrize(
+        identifier="authenticate", arguments={"access_token_hash": ""}
+    )
+    await connection.fetch(query, *arguments)
+    assert await _statements(connection) == statements
+
+
+########################################################################################
+# Connection pool
+########################################################################################
+
+
+async def test_pool():
+    """Test that acquiring connections from the pool is timed."""
+    async with database.pool(name="test", min_size=1, max_size=1) as dbpool:
+        assert await dbpool.execute("SELECT 1;") == "SELECT 1"
+        async with dbpool.acquire():
+            assert database._BUSY.values["test"] == 1
+    assert database._BUSY.values["test"] == 0
+    assert sum(database._WAIT.counts["test"]) == 2
+
+
+########################################################################################
+# Compression and retention policies
+########################################################################################
+
+
+async def _policies(connection):
+    query, arguments = database.parametrize("read-measurement-policies", {})
+    element = (await connection.fetch(query, *arguments))[0]
+    return element["compress_after"], element["drop_after"]
+
+
+async def test_apply_policies(connection, monkeypatch):
+    """Test that the policies are replaced when the settings change."""
+    monkeypatch.setattr(settings, "MEASUREMENT_COMPRESSION_DAYS", 14)
+    monkeypatch.setattr(settings, "MEASUREMENT_RETENTION_DAYS", 90)
+    await database.apply_policies(connection)
+    assert await _policies(connection) == (
+        datetime.timedelta(days=14),
+        datetime.timedelta(days=90),
+    )
+    # Restore the defaults
+    monkeypatch.undo()
+    await database.apply_policies(connection)
+    assert await _policies(connection) == (datetime.timedelta(days=7), None)
+
+
+async def test_apply_policies_with_short_retention(connection, monkeypatch):
+    """Test that measurements can't be deleted before they are aggregated."""
+    monkeypatch.setattr(settings, "MEASUREMENT_RETENTION_DAYS", 10)
+    with pytest.raises(ValueError):
+        await database.apply_policies(connection)
@@ -0,0 +1,37 @@
+import numpy as np
+
+import app.downsampling as downsampling
+
+
+########################################################################################
+# Largest-Triangle-Three-Buckets
+########################################################################################
+
+
+def test_lttb_with_fewer_points_than_threshold():
+    """Test that short series are returned unchanged."""
+    assert downsampling.lttb([0, 1, 2], [0, 1, 0], 8).tolist() == [0, 1, 2]
+
+
+def test_lttb_keeps_first_and_last_point():
+    """Test that the first and last points are always selected."""
+    x = np.arange(1000)
+    indices = downsampling.lttb(x, np.sin(x), 10)
+    assert len(indices) == 10
+    assert indices[0] == 0
+    assert indices[-1] == 999
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_lttb_keeps_spikes():
+    """Test that a single outlier survives downsampling, unlike with averaging."""
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[567] = 100
+    assert 567 in downsampling.lttb(x, y, 20)
+
+
+def test_lttb_with_small_threshold():
+    """Test thresholds that leave no room for buckets."""
+    assert downsampling.lttb(range(10), range(10), 2).tolist() == [0, 9]
+    assert downsampling.lttb(range(10), range(10), 1).tolist() == [0]
@@ -0,0 +1,45 @@
+import json
+
+import app.hub as hub
+
+
+########################################################################################
+# Publish/subscribe
+########################################################################################
+
+
+async def test_publish(identifier):
+    """Test that subscribers receive the events of their sensor."""
+    with hub.subscribe(identifier) as queue:
+        assert hub.subscribed(identifier)
+        hub.publish(identifier, "logs", [{"message": ""}])
+        kind, data = queue.get_nowait()
+        assert kind == "logs"
+        assert json.loads(data) == [{"message": ""}]
+    assert not hub.subscribed(identifier)
+
+
+async def test_publish_with_other_sensor(identifier, sensor_identifier):
+    """Test that subscribers don't receive the events of other sensors."""
+    with hub.subscribe(identifier) as queue:
+        hub.publish(sensor_identifier, "logs", [])
+        assert queue.empty()
+
+
+async def test_publish_with_full_queue(identifier):
+    """Test that events are dropped for subscribers that don't keep up."""
+    with hub.subscribe(identifier) as queue:
+        for _ in range(hub.QUEUE_SIZE + 1):
+            hub.publish(identifier, "logs", [])
+        assert queue.qsize() == hub.QUEUE_SIZE
+        assert hub._DROPPED.values[None] >= 1
+
+
+async def test_stream(identifier):
+    """Test that events are formatted as Server-Sent Events."""
+    stream = hub.stream(identifier, heartbeat=0.01)
+    assert await anext(stream) == ": heartbeat\n\n"
+    hub.publish(identifier, "logs", [])
+    assert await anext(stream) == "event: logs\ndata: []\n\n"
+    await stream.aclose()
+    assert not hub.subscribed(identifier)
@@ -0,0 +1,65 @@
+import app.metrics as metrics
+
+
+########################################################################################
+# Rendering
+########################################################################################
+
+
+def test_render_counter(monkeypatch):
+    """Test rendering a counter with a label."""
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+    x = metrics.Counter(name="test_counter", description="Test", label="kind")
+    x.increment("a")
+    x.increment('"b"', amount=2)
+    lines = metrics.render().splitlines()
+    assert "# HELP test_counter Test" in lines
+    assert "# TYPE test_counter counter" in lines
+    assert 'test_counter{kind="a"} 1.0' in lines
+    assert 'test_counter{kind="\\"b\\""} 2.0' in lines
+
+
+def test_render_histogram(monkeypatch):
+    """Test that histogram buckets are rendered cumulatively."""
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+    x = metrics.Histogram(name="test_histogram", description="Test", buckets=(1, 2))
+    x.observe(0.5)
+    x.observe(1.5)
+    x.observe(3)
+    lines = metrics.render().splitlines()
+    assert "# TYPE test_histogram histogram" in lines
+    assert 'test_histogram_bucket{le="1"} 1' in lines
+    assert 'test_histogram_bucket{le="2"} 2' in lines
+    assert 'test_histogram_bucket{le="+Inf"} 3' in lines
+    assert "test_histogram_sum 5.0" in lines
+    assert "test_histogram_count 3" in lines
+
+
+def test_render_with_collector(monkeypatch):
+    """Test that collectors update their metrics before rendering."""
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+    x = metrics.Gauge(name="test_gauge", description="Test")
+    monkeypatch.setattr(metrics, "COLLECTORS", [lambda: x.set(7)])
+    assert "test_gauge 7" in metrics.render().splitlines()
+
+
+########################################################################################
+# Request latency
+########################################################################################
+
+
+async def test_latency_middleware():
+    """Test that the latency is recorded per route when the response starts."""
+
+    async def read_test(scope, receive, send):
+        scope["endpoint"] = read_test
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    count = sum(metrics._REQUESTS.counts["read_test"])
+    middleware = metrics.LatencyMiddleware(read_test)
+    await middleware({"type": "http"}, None, send)
+    assert sum(metrics._REQUESTS.counts["read_test"]) == count + 1
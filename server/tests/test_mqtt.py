@@ -1,41 +1,144 @@
+import asyncio
+import json
+import random
+import types
+
+import aiomqtt
+import pydantic
+import pytest
+
+import app.database as database
+import app.hub as hub
 import app.mqtt as mqtt
 import app.validation as validation
 
 
+@pytest.fixture(scope="function")
+def buffer(connection):
+    """Provide an ingestion buffer that writes to the test database."""
+    return mqtt.Buffer(connection)
+
+
+async def _count(connection, sensor_identifier):
+    """Return the number of measurements of the given sensor."""
+    return await connection.fetchval(
+        "SELECT count(*) FROM measurement WHERE sensor_identifier = $1;",
+        sensor_identifier,
+    )
+
+
 ########################################################################################
 # Acknowledgments
 ########################################################################################
 
 
-async def test_handle_acknowledgments(reset, connection, sensor_identifier):
+async def _acknowledgment(connection, sensor_identifier, revision):
+    """Return the acknowledgment columns of the given configuration."""
+    return await connection.fetchrow(
+        """
+        SELECT acknowledgment_timestamp, success
+        FROM configuration
+        WHERE sensor_identifier = $1 AND revision = $2;
+        """,
+        sensor_identifier,
+        revision,
+    )
+
+
+async def test_handle_acknowledgments(reset, connection, buffer, sensor_identifier):
     """Test handling an acknowledgments message."""
     await mqtt._handle_acknowledgments(
         sensor_identifier,
-        [validation.Acknowledgment(success=True, timestamp=0, revision=0)],
+        [validation.Acknowledgment(success=True, timestamp=0, revision=2)],
         connection,
+        buffer,
     )
+    assert len(buffer.acknowledgments) == 1
+    await buffer.flush()
+    assert len(buffer.acknowledgments) == 0
+    record = await _acknowledgment(connection, sensor_identifier, 2)
+    assert record["acknowledgment_timestamp"] == 0
+    assert record["success"] is True
 
 
 async def test_handle_acknowledgments_with_multiple(
-    reset, connection, sensor_identifier
+    reset, connection, buffer, sensor_identifier
 ):
-    """Test handling a batched acknowledgments message."""
+    """Test that only the first acknowledgment of a revision is applied."""
     await mqtt._handle_acknowledgments(
         sensor_identifier,
-        [validation.Acknowledgment(success=True, timestamp=0, revision=0)] * 2,
+        [validation.Acknowledgment(success=False, timestamp=0, revision=2)],
         connection,
+        buffer,
     )
+    await mqtt._handle_acknowledgments(
+        sensor_identifier,
+        [validation.Acknowledgment(success=True, timestamp=1, revision=2)] * 2,
+        connection,
+        buffer,
+    )
+    assert len(buffer.acknowledgments) == 1
+    await buffer.flush()
+    record = await _acknowledgment(connection, sensor_identifier, 2)
+    assert record["acknowledgment_timestamp"] == 0
+    assert record["success"] is False
+
+
+async def test_handle_acknowledgments_with_acknowledged_revision(
+    reset, connection, buffer, sensor_identifier, offset
+):
+    """Test that an already acknowledged revision is not overwritten."""
+    count = mqtt._UNMATCHED.values[None]
+    await mqtt._handle_acknowledgments(
+        sensor_identifier,
+        [validation.Acknowledgment(success=True, timestamp=0, revision=1)],
+        connection,
+        buffer,
+    )
+    await buffer.flush()
+    record = await _acknowledgment(connection, sensor_identifier, 1)
+    assert record["acknowledgment_timestamp"] == offset - 5400
+    assert record["success"] is False
+    assert mqtt._UNMATCHED.values[None] == count + 1
 
 
 async def test_handle_acknowledgments_with_nonexistent_sensor(
-    reset, connection, identifier
+    reset, connection, buffer, identifier
 ):
     """Test handling an acknowledgments message for a nonexistent sensor."""
+    count = mqtt._UNMATCHED.values[None]
     await mqtt._handle_acknowledgments(
         identifier,
         [validation.Acknowledgment(success=True, timestamp=0, revision=0)],
         connection,
+        buffer,
     )
+    await buffer.flush()
+    assert mqtt._UNMATCHED.values[None] == count + 1
+
+
+async def test_handle_acknowledgments_with_subscriber(
+    reset, connection, buffer, sensor_identifier
+):
+    """Test that only applied acknowledgments are published, after the flush."""
+    with hub.subscribe(sensor_identifier) as queue:
+        await mqtt._handle_acknowledgments(
+            sensor_identifier,
+            [
+                validation.Acknowledgment(success=True, timestamp=0, revision=1),
+                validation.Acknowledgment(success=True, timestamp=0, revision=2),
+            ],
+            connection,
+            buffer,
+        )
+        assert queue.empty()
+        await buffer.flush()
+        kind, data = queue.get_nowait()
+        assert queue.empty()
+    assert kind == "acknowledgments"
+    assert json.loads(data) == [
+        {"revision": 2, "success": True, "acknowledgment_timestamp": 0}
+    ]
 
 
 ########################################################################################
@@ -43,33 +146,131 @@ async def test_handle_acknowledgments_with_nonexistent_sensor(
 ########################################################################################
 
 
-async def test_handle_measurements(reset, connection, sensor_identifier):
+async def test_handle_measurements(reset, connection, buffer, sensor_identifier):
     """Test handling a measurements message."""
+    count = await _count(connection, sensor_identifier)
     await mqtt._handle_measurements(
         sensor_identifier,
         [validation.Measurement(value={"temperature": 0}, timestamp=0)],
         connection,
+        buffer,
     )
+    await buffer.flush()
+    assert await _count(connection, sensor_identifier) == count + 1
 
 
-async def test_handle_measurements_with_multiple(reset, connection, sensor_identifier):
+async def test_handle_measurements_with_multiple(
+    reset, connection, buffer, sensor_identifier
+):
     """Test handling a batched measurements message."""
+    count = await _count(connection, sensor_identifier)
     await mqtt._handle_measurements(
         sensor_identifier,
-        [validation.Measurement(value={"temperature": 0}, timestamp=0)] * 2,
+        [validation.Measurement(value={"temperature": 0, "humidity": 0}, timestamp=0)]
+        * 2,
         connection,
+        buffer,
     )
+    await buffer.flush()
+    assert await _count(connection, sensor_identifier) == count + 4
 
 
 async def test_handle_measurements_with_nonexistent_sensor(
-    reset, connection, identifier
+    reset, connection, buffer, sensor_identifier, identifier
 ):
     """Test handling a measurements message for a nonexistent sensor."""
+    count = await _count(connection, sensor_identifier)
+    for x in [identifier, sensor_identifier]:
+        await mqtt._handle_measurements(
+            x,
+            [validation.Measurement(value={"temperature": 0}, timestamp=0)],
+            connection,
+            buffer,
+        )
+    # The rows of the nonexistent sensor are dropped without failing the batch
+    await buffer.flush()
+    assert await _count(connection, sensor_identifier) == count + 1
+    assert await _count(connection, identifier) == 0
+
+
+async def test_handle_measurements_with_full_buffer(
+    reset, connection, sensor_identifier
+):
+    """Test that the buffer is flushed when it reaches its maximum size."""
+    count = await _count(connection, sensor_identifier)
+    buffer = mqtt.Buffer(connection, size=2)
     await mqtt._handle_measurements(
-        identifier,
+        sensor_identifier,
+        [validation.Measurement(value={"temperature": 0}, timestamp=0)] * 2,
+        connection,
+        buffer,
+    )
+    assert len(buffer.measurements) == 0
+    assert await _count(connection, sensor_identifier) == count + 2
+
+
+async def test_handle_measurements_updates_latest(
+    reset, connection, buffer, sensor_identifier
+):
+    """Test that flushing the buffer keeps only the most recent values."""
+    await mqtt._handle_measurements(
+        sensor_identifier,
+        [
+            validation.Measurement(value={"temperature": 1}, timestamp=1),
+            validation.Measurement(value={"temperature": 2}, timestamp=2),
+        ],
+        connection,
+        buffer,
+    )
+    # Older values don't replace newer ones
+    await mqtt._handle_measurements(
+        sensor_identifier,
         [validation.Measurement(value={"temperature": 0}, timestamp=0)],
         connection,
+        buffer,
     )
+    await buffer.flush()
+    value = await connection.fetchval(
+        (
+            "SELECT value FROM sensor_latest WHERE sensor_identifier = $1"
+            " AND attribute = 'temperature';"
+        ),
+        sensor_identifier,
+    )
+    assert value == 2
+
+
+async def test_handle_measurements_with_subscriber(
+    reset, connection, buffer, sensor_identifier
+):
+    """Test that measurements are published after they are written, per data point."""
+    with hub.subscribe(sensor_identifier) as queue:
+        await mqtt._handle_measurements(
+            sensor_identifier,
+            [
+                validation.Measurement(
+                    value={"temperature": 0, "humidity": 1}, timestamp=0
+                ),
+                validation.Measurement(
+                    value={"temperature": 2}, timestamp=1, revision=0
+                ),
+            ],
+            connection,
+            buffer,
+        )
+        assert queue.empty()
+        await buffer.flush()
+        kind, data = queue.get_nowait()
+        assert queue.empty()
+    assert kind == "measurements"
+    assert json.loads(data) == [
+        {
+            "creation_timestamp": 0,
+            "revision": None,
+            "value": {"temperature": 0, "humidity": 1},
+        },
+        {"creation_timestamp": 1, "revision": 0, "value": {"temperature": 2}},
+    ]
 
 
 ########################################################################################
@@ -77,28 +278,331 @@ async def test_handle_measurements_with_nonexistent_sensor(
 ########################################################################################
 
 
-async def test_handle_logs(reset, connection, sensor_identifier):
+async def test_handle_logs(reset, connection, buffer, sensor_identifier):
     """Test handling a logs message."""
     await mqtt._handle_logs(
         sensor_identifier,
         [validation.Log(message="", severity="info", timestamp=0)],
         connection,
+        buffer,
     )
 
 
-async def test_handle_logs_with_multiple(reset, connection, sensor_identifier):
+async def test_handle_logs_with_multiple(reset, connection, buffer, sensor_identifier):
     """Test handling a batched logs message."""
     await mqtt._handle_logs(
         sensor_identifier,
         [validation.Log(message="", severity="info", timestamp=0)] * 2,
         connection,
+        buffer,
     )
 
 
-async def test_handle_logs_with_nonexistent_sensor(reset, connection, identifier):
+async def test_handle_logs_with_nonexistent_sensor(
+    reset, connection, buffer, identifier
+):
     """Test handling a logs message for a nonexistent sensor."""
     await mqtt._handle_logs(
         identifier,
         [validation.Log(message="", severity="info", timestamp=0)],
         connection,
+        buffer,
+    )
+
+
+async def test_handle_logs_with_subscriber(
+    reset, connection, buffer, sensor_identifier
+):
+    """Test that handled logs are published to the sensor's live subscribers."""
+    with hub.subscribe(sensor_identifier) as queue:
+        await mqtt._handle_logs(
+            sensor_identifier,
+            [validation.Log(message="", severity="info", timestamp=0)],
+            connection,
+            buffer,
+        )
+        kind, data = queue.get_nowait()
+    assert kind == "logs"
+    assert json.loads(data) == [
+        {"creation_timestamp": 0, "revision": None, "severity": "info", "message": ""}
+    ]
+
+
+########################################################################################
+# Concurrent handling
+########################################################################################
+
+
+class _Client:
+    """Stand-in for the MQTT client that delivers the given messages once."""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.consumed = 0
+
+    async def subscribe(self, *args, **kwargs):
+        pass
+
+    async def _messages(self):
+        for topic, payload in self.messages:
+            self.consumed += 1
+            yield types.SimpleNamespace(topic=aiomqtt.Topic(topic), payload=payload)
+        await asyncio.Event().wait()
+
+
+def _identifiers(count):
+    return [f"00000000-0000-4000-8000-{i:012d}" for i in range(count)]
+
+
+async def test_handle_in_order(monkeypatch):
+    """Test that the messages of each sensor are handled in order of arrival."""
+    handled = []
+
+    async def handle(sensor_identifier, payload, dbpool, buffer):
+        # Yield a random number of times to interleave the workers
+        for _ in range(random.randint(0, 3)):
+            await asyncio.sleep(0)
+        handled.append((sensor_identifier, *payload))
+
+    validator = pydantic.TypeAdapter(list[int])
+    monkeypatch.setattr(mqtt, "SUBSCRIPTIONS", {"test/+": (handle, validator)})
+    monkeypatch.setattr(mqtt.settings, "MQTT_SHARED_GROUP", None)
+    monkeypatch.setattr(mqtt.settings, "MQTT_WORKERS", 3)
+    monkeypatch.setattr(mqtt.settings, "MQTT_QUEUE_SIZE", 2)
+    identifiers = _identifiers(8)
+    messages = [
+        (f"test/{x}", f"[{i}]".encode()) for i in range(16) for x in identifiers
+    ]
+    task = asyncio.create_task(mqtt.handle(_Client(messages), None, None))
+    async with asyncio.timeout(5):
+        while len(handled) < len(messages):
+            await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    for x in identifiers:
+        assert [payload for y, payload in handled if y == x] == list(range(16))
+    assert mqtt._DEPTH.values["test/+"] == 0
+    assert mqtt._MESSAGES.values["test/+"] == len(messages)
+
+
+async def test_handle_with_full_queue(monkeypatch):
+    """Test that a full queue stops the listener from receiving more messages."""
+    release = asyncio.Event()
+    handled = []
+
+    async def handle(sensor_identifier, payload, dbpool, buffer):
+        await release.wait()
+        handled.extend(payload)
+
+    validator = pydantic.TypeAdapter(list[int])
+    monkeypatch.setattr(mqtt, "SUBSCRIPTIONS", {"blocked/+": (handle, validator)})
+    monkeypatch.setattr(mqtt.settings, "MQTT_SHARED_GROUP", None)
+    monkeypatch.setattr(mqtt.settings, "MQTT_WORKERS", 1)
+    monkeypatch.setattr(mqtt.settings, "MQTT_QUEUE_SIZE", 1)
+    (identifier,) = _identifiers(1)
+    client = _Client([(f"blocked/{identifier}", f"[{i}]".encode()) for i in range(8)])
+    task = asyncio.create_task(mqtt.handle(client, None, None))
+    await asyncio.sleep(0.05)
+    # One message is being handled, one is queued and one waits for a free slot
+    assert client.consumed == 3
+    assert mqtt._DEPTH.values["blocked/+"] == 3
+    release.set()
+    async with asyncio.timeout(5):
+        while len(handled) < 8:
+            await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert handled == list(range(8))
+    assert mqtt._DEPTH.values["blocked/+"] == 0
+
+
+async def test_handle_with_malformed_timestamp(
+    monkeypatch, reset, connection, buffer, sensor_identifier
+):
+    """Test that a message with an out-of-range timestamp doesn't fail the batch."""
+    monkeypatch.setattr(mqtt.settings, "MQTT_SHARED_GROUP", None)
+    count = await _count(connection, sensor_identifier)
+    malformed = mqtt._MALFORMED.values["measurements/+"]
+    messages = [
+        (
+            f"measurements/{sensor_identifier}",
+            json.dumps(
+                [{"value": {"temperature": 0}, "timestamp": timestamp}]
+            ).encode(),
+        )
+        for timestamp in [0, 1e300, 1]
+    ]
+    task = asyncio.create_task(mqtt.handle(_Client(messages), connection, buffer))
+    async with asyncio.timeout(5):
+        while mqtt._DEPTH.values["measurements/+"] > 0 or len(buffer.measurements) < 2:
+            await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    # The malformed message is rejected on its own, the others are written
+    await buffer.flush()
+    assert mqtt._MALFORMED.values["measurements/+"] == malformed + 1
+    assert await _count(connection, sensor_identifier) == count + 2
+
+
+async def test_handle_with_malformed_acknowledgment(
+    monkeypatch, reset, connection, buffer, sensor_identifier, identifier
+):
+    """Test that a malformed acknowledgment doesn't fail the other sensors' batch."""
+    monkeypatch.setattr(mqtt.settings, "MQTT_SHARED_GROUP", None)
+    malformed = mqtt._MALFORMED.values["acknowledgments/+"]
+    messages = [
+        (
+            f"acknowledgments/{x}",
+            json.dumps(
+                [{"success": True, "timestamp": timestamp, "revision": 2}]
+            ).encode(),
+        )
+        for x, timestamp in [(identifier, 1e300), (sensor_identifier, 0)]
+    ]
+    task = asyncio.create_task(mqtt.handle(_Client(messages), connection, buffer))
+    async with asyncio.timeout(5):
+        while (
+            mqtt._DEPTH.values["acknowledgments/+"] > 0
+            or len(buffer.acknowledgments) < 1
+        ):
+            await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await buffer.flush()
+    assert mqtt._MALFORMED.values["acknowledgments/+"] == malformed + 1
+    record = await _acknowledgment(connection, sensor_identifier, 2)
+    assert record["acknowledgment_timestamp"] == 0
+    assert record["success"] is True
+
+
+########################################################################################
+# Configuration publication
+########################################################################################
+
+
+async def test_outbox(reset, connection, sensor_identifier):
+    """Test publishing the pending configurations in order of their revisions."""
+    await connection.executemany(
+        (
+            "INSERT INTO configuration (sensor_identifier, value, revision,"
+            " creation_timestamp) VALUES ($1, '{}', $2, now());"
+        ),
+        [(sensor_identifier, 3), (sensor_identifier, 4)],
+    )
+    async with (
+        database.pool(name="test", min_size=1, max_size=1) as dbpool,
+        mqtt.client() as client,
+    ):
+        outbox = mqtt.Outbox(client, dbpool)
+        # Only the oldest pending revision of a sensor is published per batch
+        for revision in [3, 4]:
+            assert await outbox.publish() == 1
+            assert await connection.fetchval(
+                (
+                    "SELECT publication_timestamp IS NOT NULL FROM configuration"
+                    " WHERE sensor_identifier = $1 AND revision = $2;"
+                ),
+                sensor_identifier,
+                revision,
+            )
+        assert await outbox.publish() == 0
+
+
+class _Publisher:
+    """Stand-in for the MQTT client that records or fails the publications."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.published = []
+
+    async def publish(self, topic, payload, **kwargs):
+        if self.fail:
+            raise aiomqtt.MqttError("Unreachable")
+        self.published.append(topic)
+
+
+async def _lease(connection, sensor_identifier, revision):
+    """Return the publication state of the given configuration."""
+    return await connection.fetchrow(
+        """
+        SELECT
+            publication_timestamp,
+            extract(EPOCH FROM publication_lease_timestamp - now())::DOUBLE PRECISION AS lease,
+            publication_attempts
+        FROM configuration
+        WHERE sensor_identifier = $1 AND revision = $2;
+        """,
+        sensor_identifier,
+        revision,
+    )
+
+
+async def test_outbox_with_failure(reset, connection, sensor_identifier):
+    """Test that a configuration that fails to be published backs off on its own."""
+    await connection.execute(
+        (
+            "INSERT INTO configuration (sensor_identifier, value, revision,"
+            " creation_timestamp) VALUES ($1, '{}', 3, now());"
+        ),
+        sensor_identifier,
+    )
+    async with database.pool(name="test", min_size=1, max_size=1) as dbpool:
+        outbox = mqtt.Outbox(_Publisher(fail=True), dbpool)
+        assert await outbox.publish() == 1
+        record = await _lease(connection, sensor_identifier, 3)
+        assert record["publication_timestamp"] is None
+        assert record["lease"] > 0
+        assert record["publication_attempts"] == 1
+        # The configuration is not retried before its backoff expires
+        assert await outbox.publish() == 0
+
+
+@pytest.mark.parametrize("expired", [True, False])
+async def test_outbox_with_lease(reset, connection, sensor_identifier, expired):
+    """Test that a leased configuration is only claimed again once the lease expired."""
+    await connection.execute(
+        (
+            "INSERT INTO configuration (sensor_identifier, value, revision,"
+            " creation_timestamp, publication_lease_timestamp)"
+            " VALUES ($1, '{}', 3, now(), now() + make_interval(secs => $2));"
+        ),
+        sensor_identifier,
+        -1.0 if expired else 60.0,
+    )
+    async with database.pool(name="test", min_size=1, max_size=1) as dbpool:
+        client = _Publisher()
+        outbox = mqtt.Outbox(client, dbpool)
+        assert await outbox.publish() == (1 if expired else 0)
+    topics = [f"configurations/{sensor_identifier}"] if expired else []
+    assert client.published == topics
+    record = await _lease(connection, sensor_identifier, 3)
+    assert (record["publication_timestamp"] is not None) == expired
+    assert (record["lease"] is None) == expired
+
+
+@pytest.mark.parametrize("attempts, backoff", [(0, 1), (4, 16), (12, 256)])
+async def test_outbox_with_backoff(
+    reset, connection, sensor_identifier, attempts, backoff
+):
+    """Test that the backoff grows with the failed attempts, up to a maximum."""
+    await connection.execute(
+        (
+            "INSERT INTO configuration (sensor_identifier, value, revision,"
+            " creation_timestamp, publication_lease_timestamp, publication_attempts)"
+            " VALUES ($1, '{}', 3, now(), now() - interval '1 second', $2);"
+        ),
+        sensor_identifier,
+        attempts,
     )
+    async with database.pool(name="test", min_size=1, max_size=1) as dbpool:
+        outbox = mqtt.Outbox(_Publisher(fail=True), dbpool)
+        assert await outbox.publish() == 1
+    record = await _lease(connection, sensor_identifier, 3)
+    assert record["publication_attempts"] == attempts + 1
+    # The jitter is at most half a second in both directions, and some time passed
+    # since the lease was set
+    assert backoff - 1 <= record["lease"] <= backoff + 0.5
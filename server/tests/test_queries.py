@@ -0,0 +1,111 @@
+import json
+
+import pytest
+
+import app.database as database
+
+
+def _find(plan, node_type):
+    """Return the first node of the given type in the query plan."""
+    if plan["Node Type"] == node_type:
+        return plan
+    for child in plan.get("Plans", []):
+        if (node := _find(child, node_type)) is not None:
+            return node
+
+
+def _providers(plan):
+    """Return the providers of all custom scan nodes in the query plan."""
+    providers = [plan["Custom Plan Provider"]] if "Custom Plan Provider" in plan else []
+    for child in plan.get("Plans", []):
+        providers.extend(_providers(child))
+    return providers
+
+
+def _nodes(plan):
+    """Return the types of all nodes in the query plan."""
+    nodes = [plan["Node Type"]]
+    for child in plan.get("Plans", []):
+        nodes.extend(_nodes(child))
+    return nodes
+
+
+async def _explain(connection, identifier, arguments, mode):
+    """Return the query plan in the given plan cache mode without running it.
+
+    The arguments are SQL expressions. We go through a prepared statement on the SQL
+    level, as that's the only way to get a generic plan from EXPLAIN in PostgreSQL 15.
+    """
+    query, arguments = database.parametrize(identifier, arguments)
+    await connection.execute(f"PREPARE explained AS {query}")
+    try:
+        async with connection.transaction():
+            await connection.execute(f"SET LOCAL plan_cache_mode = {mode};")
+            # The test data is small enough that sequential scans would be cheaper
+            await connection.execute("SET LOCAL enable_seqscan = off;")
+            plan = await connection.fetchval(
+                f"EXPLAIN (FORMAT JSON) EXECUTE explained ({', '.join(arguments)});"
+            )
+    finally:
+        await connection.execute("DEALLOCATE explained;")
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+########################################################################################
+# Measurements
+########################################################################################
+
+
+@pytest.mark.parametrize("direction", ["next", "previous"])
+async def test_read_measurements_with_compression(
+    compress, connection, sensor_identifier, offset, direction
+):
+    """Test that paging through compressed measurements only decompresses the
+    segments of the sensor, which are found with an index scan.
+    """
+    plan = await _explain(
+        connection,
+        f"read-{direction}-measurements",
+        {
+            "sensor_identifier": f"'{sensor_identifier}'",
+            "creation_timestamp": f"to_timestamp({offset - 3600})",
+        },
+        "force_generic_plan",
+    )
+    assert "DecompressChunk" in _providers(plan)
+    nodes = _nodes(plan)
+    assert "Seq Scan" not in nodes
+    assert "Index Scan" in nodes or "Bitmap Heap Scan" in nodes
+
+
+########################################################################################
+# Logs
+########################################################################################
+
+
+@pytest.mark.parametrize("direction", ["next", "previous"])
+@pytest.mark.parametrize("mode", ["force_custom_plan", "force_generic_plan"])
+@pytest.mark.parametrize("cursor", [False, True])
+async def test_read_logs_with_index_scan(
+    reset, connection, sensor_identifier, offset, direction, mode, cursor
+):
+    """Test that paging through logs is an index scan in the cursor's order."""
+    plan = await _explain(
+        connection,
+        f"read-{direction}-logs",
+        {
+            "sensor_identifier": f"'{sensor_identifier}'",
+            "creation_timestamp": (
+                f"to_timestamp({offset - 3600})" if cursor else "NULL"
+            ),
+            "sequence": "1" if cursor else "NULL",
+        },
+        mode,
+    )
+    nodes = _nodes(_find(plan, "Limit"))
+    assert "Seq Scan" not in nodes
+    # The index provides the order, so there's nothing to sort before the limit
+    assert "Sort" not in nodes
+    assert "Index Scan" in nodes or "Index Only Scan" in nodes
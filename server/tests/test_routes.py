@@ -1,8 +1,16 @@
+import asyncio
+import io
+import json
+
 import asgi_lifespan
 import httpx
+import pyarrow
+import pyarrow.ipc
+import pyarrow.parquet
 import pytest
 
 import app.errors as errors
+import app.hub as hub
 import app.main as main
 
 
@@ -76,6 +84,30 @@ async def test_read_status(client):
     )
 
 
+########################################################################################
+# Route: GET /metrics
+########################################################################################
+
+
+async def test_read_metrics(monkeypatch, client):
+    """Test reading the server metrics in the Prometheus text format."""
+    monkeypatch.setattr(main.settings, "METRICS", True)
+    await client.get("/status")
+    response = await client.get("/metrics")
+    assert returns(response, 200)
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert "# TYPE http_request_seconds histogram" in lines
+    assert any(line.startswith('database_connections{pool="api"}') for line in lines)
+
+
+async def test_read_metrics_when_disabled(monkeypatch, client):
+    """Test that the metrics are not served unless they are enabled."""
+    monkeypatch.setattr(main.settings, "METRICS", False)
+    response = await client.get("/metrics")
+    assert returns(response, errors.NotFoundError)
+
+
 ########################################################################################
 # Route: POST /users
 ########################################################################################
@@ -226,6 +258,64 @@ async def test_read_networks_with_invalid_authentication(reset, client, token):
     assert returns(response, errors.UnauthorizedError)
 
 
+########################################################################################
+# Route: GET /networks/+
+########################################################################################
+
+
+async def test_read_network(reset, client, network_identifier, access_token, offset):
+    """Test reading the state of all sensors in a network."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert returns(response, 200)
+    body = response.json()
+    assert isinstance(body, list)
+    assert len(body) == 2
+    assert keys(
+        body,
+        {
+            "sensor_identifier",
+            "sensor_name",
+            "measurement_timestamp",
+            "log_severity",
+            "log_timestamp",
+            "revision",
+            "publication_timestamp",
+            "acknowledgment_timestamp",
+            "success",
+        },
+    )
+    # Sensors are sorted by name; The second sensor has no data yet
+    assert body[0]["sensor_name"] == "bulbasaur"
+    assert body[0]["measurement_timestamp"] == offset - 3600
+    assert body[0]["log_severity"] == "error"
+    assert body[0]["revision"] == 2
+    assert body[1]["measurement_timestamp"] is None
+    assert body[1]["revision"] is None
+
+
+async def test_read_network_with_nonexistent_network(
+    reset, client, identifier, access_token
+):
+    """Test reading the state of a network that does not exist."""
+    response = await client.get(
+        url=f"/networks/{identifier}",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert returns(response, errors.NotFoundError)
+
+
+async def test_read_network_with_invalid_authorization(reset, client, access_token):
+    """Test reading the state of a network having unsufficient permissions."""
+    response = await client.get(
+        url="/networks/2f9a5285-4ce1-4ddb-a268-0164c70f4826",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert returns(response, errors.ForbiddenError)
+
+
 ########################################################################################
 # Route: POST /networks/+/sensors
 ########################################################################################
@@ -330,6 +420,37 @@ async def test_read_sensors_with_invalid_authorization(
     assert returns(response, errors.ForbiddenError)
 
 
+########################################################################################
+# Route: GET /networks/+/measurements/latest
+########################################################################################
+
+
+async def test_read_network_latest_measurements(
+    reset, client, network_identifier, sensor_identifier, access_token
+):
+    """Test reading the most recent values of all sensors in a network."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/measurements/latest",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert returns(response, 200)
+    body = response.json()
+    assert isinstance(body, dict)
+    assert set(body.keys()) == {sensor_identifier}
+    assert set(body[sensor_identifier].keys()) == {"temperature", "humidity"}
+
+
+async def test_read_network_latest_measurements_with_invalid_authorization(
+    reset, client, access_token
+):
+    """Test reading the most recent values having unsufficient permissions."""
+    response = await client.get(
+        url="/networks/2f9a5285-4ce1-4ddb-a268-0164c70f4826/measurements/latest",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert returns(response, errors.ForbiddenError)
+
+
 ########################################################################################
 # Route: PUT /networks/+/sensors/+
 ########################################################################################
@@ -373,6 +494,74 @@ async def test_update_sensor_with_existent_sensor_name(
     assert returns(response, errors.ConflictError)
 
 
+########################################################################################
+# Route: POST /networks/+/configurations
+########################################################################################
+
+
+async def test_create_configurations(reset, client, network_identifier, access_token):
+    """Test rolling out a configuration to all sensors of a network."""
+    response = await client.post(
+        url=f"/networks/{network_identifier}/configurations",
+        headers={"Authorization": f"Bearer {access_token}"},
+        json={"configuration": {"measurement_interval": 8.5}},
+    )
+    assert returns(response, 201)
+    body = response.json()
+    assert isinstance(body, list)
+    assert keys(body, {"sensor_identifier", "revision"})
+    assert sorted(x["revision"] for x in body) == [0, 3]
+
+
+async def test_create_configurations_with_selection(
+    reset, client, network_identifier, sensor_identifier, access_token
+):
+    """Test rolling out a configuration to some sensors of a network."""
+    response = await client.post(
+        url=f"/networks/{network_identifier}/configurations",
+        headers={"Authorization": f"Bearer {access_token}"},
+        json={"configuration": {}, "sensor_identifiers": [sensor_identifier] * 2},
+    )
+    assert returns(response, 201)
+    assert response.json() == [{"sensor_identifier": sensor_identifier, "revision": 3}]
+
+
+async def test_create_configurations_with_nonexistent_sensor(
+    reset, client, network_identifier, sensor_identifier, identifier, access_token
+):
+    """Test that no configuration is created if a selected sensor doesn't exist."""
+    url = f"/networks/{network_identifier}/configurations"
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = await client.post(
+        url=url,
+        headers=headers,
+        json={
+            "configuration": {},
+            "sensor_identifiers": [sensor_identifier, identifier],
+        },
+    )
+    assert returns(response, errors.NotFoundError)
+    # The selected sensor that exists doesn't get the configuration either
+    response = await client.post(
+        url=url,
+        headers=headers,
+        json={"configuration": {}, "sensor_identifiers": [sensor_identifier]},
+    )
+    assert response.json()[0]["revision"] == 3
+
+
+async def test_create_configurations_with_invalid_authorization(
+    reset, client, access_token
+):
+    """Test rolling out a configuration having unsufficient permissions."""
+    response = await client.post(
+        url="/networks/2f9a5285-4ce1-4ddb-a268-0164c70f4826/configurations",
+        headers={"Authorization": f"Bearer {access_token}"},
+        json={"configuration": {}},
+    )
+    assert returns(response, errors.ForbiddenError)
+
+
 ########################################################################################
 # Route: POST /networks/+/sensors/+/configurations
 ########################################################################################
@@ -394,6 +583,28 @@ async def test_create_configuration(
     assert keys(body, {"revision"})
 
 
+async def test_create_configuration_with_concurrency(
+    reset, client, network_identifier, sensor_identifier, access_token
+):
+    """Test that concurrently created configurations get consecutive revisions."""
+    responses = await asyncio.gather(
+        *[
+            client.post(
+                url=(
+                    f"/networks/{network_identifier}/sensors/{sensor_identifier}"
+                    "/configurations"
+                ),
+                headers={"Authorization": f"Bearer {access_token}"},
+                json={},
+            )
+            for _ in range(8)
+        ]
+    )
+    assert all(returns(response, 201) for response in responses)
+    revisions = sorted(response.json()["revision"] for response in responses)
+    assert revisions == list(range(3, 11))
+
+
 async def test_create_configuration_with_no_values(
     reset, client, network_identifier, sensor_identifier, access_token
 ):
@@ -505,6 +716,76 @@ async def test_read_measurements(
     assert order(body, lambda x: x["creation_timestamp"])
 
 
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"direction": "next", "creation_timestamp": -7200},
+        {"direction": "previous", "creation_timestamp": -3600},
+    ],
+)
+async def test_read_measurements_with_compression(
+    compress,
+    client,
+    network_identifier,
+    sensor_identifier,
+    access_token,
+    offset,
+    params,
+):
+    """Test reading pages of compressed measurements."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{sensor_identifier}/measurements",
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={**params, "creation_timestamp": offset + params["creation_timestamp"]},
+    )
+    assert returns(response, 200)
+    body = response.json()
+    assert isinstance(body, list)
+    assert len(body) == 3
+    assert keys(body, {"value", "revision", "creation_timestamp"})
+    assert order(body, lambda x: x["creation_timestamp"])
+
+
+async def test_read_measurements_with_compression_and_aggregation(
+    compress, client, network_identifier, sensor_identifier, access_token, offset
+):
+    """Test reading aggregates of compressed measurements."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{sensor_identifier}/measurements",
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={"aggregate": True},
+    )
+    assert returns(response, 200)
+    body = response.json()
+    assert keys(body, {"temperature", "humidity"})
+    assert [(x["bucket_timestamp"], x["average"]) for x in body["temperature"]] == [
+        (offset - 7200, 8000.0),
+        (offset - 3600, 6000.0),
+    ]
+    assert [(x["bucket_timestamp"], x["average"]) for x in body["humidity"]] == [
+        (offset - 7200, -0.2),
+    ]
+
+
+async def test_read_measurements_with_compression_and_downsampling(
+    compress, client, network_identifier, sensor_identifier, access_token, offset
+):
+    """Test reading downsampled compressed measurements."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{sensor_identifier}/measurements",
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={"downsample": True, "points": 2},
+    )
+    assert returns(response, 200)
+    body = response.json()
+    assert keys(body, {"temperature", "humidity"})
+    assert body["temperature"] == [
+        {"creation_timestamp": offset - 7200, "value": 7000.0},
+        {"creation_timestamp": offset - 3600, "value": 6000.0},
+    ]
+    assert len(body["humidity"]) == 2
+
+
 async def test_read_measurements_with_next_page(
     reset, client, network_identifier, sensor_identifier, access_token, offset
 ):
@@ -552,10 +833,189 @@ async def test_read_measurements_with_aggregation(
     body = response.json()
     assert keys(body, {"temperature", "humidity"})
     assert body["temperature"] == [
-        {"bucket_timestamp": offset - 7200, "average": 8000.0},
-        {"bucket_timestamp": offset - 3600, "average": 6000.0},
+        {
+            "bucket_timestamp": offset - 7200,
+            "average": 8000.0,
+            "minimum": 7000.0,
+            "maximum": 9000.0,
+            "count": 2,
+        },
+        {
+            "bucket_timestamp": offset - 3600,
+            "average": 6000.0,
+            "minimum": 6000.0,
+            "maximum": 6000.0,
+            "count": 1,
+        },
+    ]
+    assert body["humidity"] == [
+        {
+            "bucket_timestamp": offset - 7200,
+            "average": -0.2,
+            "minimum": -0.4,
+            "maximum": 0.0,
+            "count": 2,
+        }
+    ]
+
+
+async def test_read_measurements_with_aggregation_and_range(
+    reset, client, network_identifier, sensor_identifier, access_token, offset
+):
+    """Test that the resolution is chosen by the time range and number of points."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{sensor_identifier}/measurements",
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={
+            "aggregate": True,
+            "start_timestamp": offset - 7200,
+            "end_timestamp": offset,
+            "points": 60,
+        },
+    )
+    assert returns(response, 200)
+    body = response.json()
+    assert keys(body, {"temperature", "humidity"})
+    # Two hours with at least 60 points resolve to 1-minute buckets
+    assert [x["bucket_timestamp"] for x in body["temperature"]] == [
+        offset - 7200,
+        offset - 5400,
+        offset - 3600,
+    ]
+    assert [x["average"] for x in body["humidity"]] == [-0.4, 0.0]
+
+
+async def test_read_measurements_with_downsampling(
+    reset, client, network_identifier, sensor_identifier, access_token, offset
+):
+    """Test reading measurements downsampled to a maximum number of points."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{sensor_identifier}/measurements",
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={"downsample": True, "points": 2},
+    )
+    assert returns(response, 200)
+    body = response.json()
+    assert keys(body, {"temperature", "humidity"})
+    assert body["temperature"] == [
+        {"creation_timestamp": offset - 7200, "value": 7000.0},
+        {"creation_timestamp": offset - 3600, "value": 6000.0},
     ]
-    assert body["humidity"] == [{"bucket_timestamp": offset - 7200, "average": -0.2}]
+    assert len(body["humidity"]) == 2
+
+
+########################################################################################
+# Route: GET /networks/+/sensors/+/measurements/export
+########################################################################################
+
+
+async def test_export_measurements(
+    reset, client, network_identifier, sensor_identifier, access_token
+):
+    """Test exporting all measurements as newline-delimited JSON."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{sensor_identifier}/measurements/export",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert returns(response, 200)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    body = [json.loads(line) for line in response.text.splitlines()]
+    assert len(body) == 5
+    assert keys(body, {"creation_timestamp", "revision", "attribute", "value"})
+    assert order(body, lambda x: x["creation_timestamp"])
+
+
+async def test_export_measurements_with_range(
+    reset, client, network_identifier, sensor_identifier, access_token, offset
+):
+    """Test exporting the measurements in a time range as CSV."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{sensor_identifier}/measurements/export",
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={
+            "start_timestamp": offset - 5400,
+            "end_timestamp": offset - 3600,
+            "format": "csv",
+        },
+    )
+    assert returns(response, 200)
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0] == "creation_timestamp,revision,attribute,value"
+    assert len(lines) == 3
+
+
+@pytest.mark.parametrize("format", ["arrow", "parquet"])
+async def test_export_measurements_with_columnar_format(
+    reset, client, network_identifier, sensor_identifier, access_token, offset, format
+):
+    """Test exporting measurements as Arrow IPC stream and Parquet."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{sensor_identifier}/measurements/export",
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={"format": format},
+    )
+    assert returns(response, 200)
+    table = (
+        pyarrow.ipc.open_stream(response.content).read_all()
+        if format == "arrow"
+        else pyarrow.parquet.read_table(io.BytesIO(response.content))
+    )
+    assert table.column_names == [
+        "creation_timestamp",
+        "revision",
+        "humidity",
+        "temperature",
+    ]
+    assert table.num_rows == 4
+    body = table.to_pylist()
+    assert order(body, lambda x: x["creation_timestamp"])
+    assert body[0]["creation_timestamp"].timestamp() == offset - 7200
+    assert body[0]["humidity"] == -0.4
+    assert body[-1]["humidity"] is None
+
+
+########################################################################################
+# Route: GET /networks/+/sensors/+/measurements/latest
+########################################################################################
+
+
+async def test_read_latest_measurements(
+    reset, client, network_identifier, sensor_identifier, access_token, offset
+):
+    """Test reading the most recent value of each of a sensor's attributes."""
+    response = await client.get(
+        url=(
+            f"/networks/{network_identifier}/sensors/{sensor_identifier}"
+            "/measurements/latest"
+        ),
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert returns(response, 200)
+    body = response.json()
+    assert body == {
+        "temperature": {
+            "value": 6000.0,
+            "revision": 1,
+            "creation_timestamp": offset - 3600,
+        },
+        "humidity": {
+            "value": 0.0,
+            "revision": 1,
+            "creation_timestamp": offset - 5400,
+        },
+    }
+
+
+async def test_read_latest_measurements_with_nonexistent_sensor(
+    reset, client, network_identifier, identifier, access_token
+):
+    """Test reading the most recent values of a sensor that does not exist."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{identifier}/measurements/latest",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert returns(response, errors.NotFoundError)
 
 
 ########################################################################################
@@ -575,7 +1035,9 @@ async def test_read_logs(
     body = response.json()
     assert isinstance(body, list)
     assert len(body) == 5
-    assert keys(body, {"message", "severity", "revision", "creation_timestamp"})
+    assert keys(
+        body, {"message", "severity", "revision", "creation_timestamp", "sequence"}
+    )
     assert order(body, lambda x: x["creation_timestamp"])
 
 
@@ -592,7 +1054,9 @@ async def test_read_logs_with_next_page(
     body = response.json()
     assert isinstance(body, list)
     assert len(body) == 2
-    assert keys(body, {"message", "severity", "revision", "creation_timestamp"})
+    assert keys(
+        body, {"message", "severity", "revision", "creation_timestamp", "sequence"}
+    )
     assert order(body, lambda x: x["creation_timestamp"])
 
 
@@ -609,5 +1073,195 @@ async def test_read_logs_with_previous_page(
     body = response.json()
     assert isinstance(body, list)
     assert len(body) == 3
-    assert keys(body, {"message", "severity", "revision", "creation_timestamp"})
+    assert keys(
+        body, {"message", "severity", "revision", "creation_timestamp", "sequence"}
+    )
+    assert order(body, lambda x: x["creation_timestamp"])
+
+
+async def test_read_logs_with_same_timestamp(
+    reset,
+    client,
+    connection,
+    network_identifier,
+    sensor_identifier,
+    access_token,
+    offset,
+):
+    """Test that the cursor doesn't skip logs with the same timestamp."""
+    await connection.executemany(
+        (
+            "INSERT INTO log (sensor_identifier, severity, message, creation_timestamp,"
+            " receipt_timestamp) VALUES ($1, 'info', '', $2, $2);"
+        ),
+        [(sensor_identifier, offset - 3600)] * 2,
+    )
+    url = f"/networks/{network_identifier}/sensors/{sensor_identifier}/logs"
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = await client.get(url=url, headers=headers)
+    ties = [x for x in response.json() if x["creation_timestamp"] == offset - 3600]
+    assert len(ties) == 3
+    assert order(ties, lambda x: x["sequence"])
+    # Continue after the first of the logs with the same timestamp
+    response = await client.get(
+        url=url,
+        headers=headers,
+        params={
+            "direction": "next",
+            "creation_timestamp": offset - 3600,
+            "sequence": ties[0]["sequence"],
+        },
+    )
+    assert returns(response, 200)
+    body = response.json()
+    assert len(body) == 4
+    assert body[:2] == ties[1:]
+    # Continue before the last of the logs with the same timestamp
+    response = await client.get(
+        url=url,
+        headers=headers,
+        params={
+            "direction": "previous",
+            "creation_timestamp": offset - 3600,
+            "sequence": ties[2]["sequence"],
+        },
+    )
+    assert returns(response, 200)
+    body = response.json()
+    assert len(body) == 4
+    assert body[2:] == ties[:2]
+
+
+########################################################################################
+# Route: GET /networks/+/sensors/+/logs/export
+########################################################################################
+
+
+async def test_export_logs(
+    reset, client, network_identifier, sensor_identifier, access_token
+):
+    """Test exporting all logs as newline-delimited JSON."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{sensor_identifier}/logs/export",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert returns(response, 200)
+    body = [json.loads(line) for line in response.text.splitlines()]
+    assert len(body) == 5
+    assert keys(body, {"creation_timestamp", "revision", "severity", "message"})
     assert order(body, lambda x: x["creation_timestamp"])
+
+
+async def test_export_logs_with_csv(
+    reset, client, network_identifier, sensor_identifier, access_token
+):
+    """Test exporting logs as CSV."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{sensor_identifier}/logs/export",
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={"format": "csv"},
+    )
+    assert returns(response, 200)
+    lines = response.text.splitlines()
+    assert lines[0] == "creation_timestamp,revision,severity,message"
+    assert len(lines) == 6
+
+
+async def test_export_logs_with_invalid_format(
+    reset, client, network_identifier, sensor_identifier, access_token
+):
+    """Test exporting logs in an unknown format."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{sensor_identifier}/logs/export",
+        headers={"Authorization": f"Bearer {access_token}"},
+        params={"format": "xml"},
+    )
+    assert returns(response, errors.BadRequestError)
+
+
+########################################################################################
+# Route: GET /networks/+/sensors/+/stream
+########################################################################################
+
+
+async def test_stream_events(
+    reset, connection, network_identifier, sensor_identifier, access_token
+):
+    """Test that the sensor's events are delivered as Server-Sent Events."""
+    path = f"/networks/{network_identifier}/sensors/{sensor_identifier}/stream"
+    messages = asyncio.Queue()
+    disconnected = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    # The HTTPX client waits for the response to end, which an event stream never
+    # does, so we call the application directly
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"authorization", f"Bearer {access_token}".encode())],
+        "client": ("test", 0),
+        "server": ("test", 80),
+        "state": {"dbpool": connection},
+    }
+    task = asyncio.create_task(main.app(scope, receive, messages.put))
+    async with asyncio.timeout(5):
+        message = await messages.get()
+        assert message["status"] == 200
+        assert (b"content-type", b"text/event-stream; charset=utf-8") in message[
+            "headers"
+        ]
+        while not hub.subscribed(sensor_identifier):
+            await asyncio.sleep(0.01)
+        hub.publish(sensor_identifier, "logs", [{"message": ""}])
+        message = await messages.get()
+        disconnected.set()
+        await task
+    assert message["body"] == b'event: logs\ndata: [{"message": ""}]\n\n'
+    assert not hub.subscribed(sensor_identifier)
+
+
+async def test_stream_events_with_invalid_authentication(
+    reset, client, network_identifier, sensor_identifier
+):
+    """Test streaming the events of a sensor without authentication."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{sensor_identifier}/stream"
+    )
+    assert returns(response, errors.UnauthorizedError)
+
+
+async def test_stream_events_with_invalid_authorization(reset, client, access_token):
+    """Test streaming the events of a sensor having unsufficient permissions."""
+    response = await client.get(
+        url=(
+            "/networks/2f9a5285-4ce1-4ddb-a268-0164c70f4826"
+            "/sensors/23825517-4631-4beb-acd4-5545c57a9928/stream"
+        ),
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert returns(response, errors.ForbiddenError)
+
+
+async def test_stream_events_with_nonexistent_sensor(
+    reset, client, network_identifier, identifier, access_token
+):
+    """Test streaming the events of a sensor that does not exist."""
+    response = await client.get(
+        url=f"/networks/{network_identifier}/sensors/{identifier}/stream",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert returns(response, errors.NotFoundError)
@@ -119,6 +119,41 @@ def test_validate_type_key_fail():
         pydantic.TypeAdapter(validation.types.Key).validate_python(".;")
 
 
+def test_validate_type_timestamp_pass():
+    """Test that Timestamp type passes some valid values."""
+    limit = validation.constants.Limit
+    pydantic.TypeAdapter(validation.types.Timestamp).validate_python(0)
+    pydantic.TypeAdapter(validation.types.Timestamp).validate_python(1.5)
+    pydantic.TypeAdapter(validation.types.Timestamp).validate_python(-1.5)
+    pydantic.TypeAdapter(validation.types.Timestamp).validate_python(limit.MINTIMESTAMP)
+    pydantic.TypeAdapter(validation.types.Timestamp).validate_python(
+        limit.MAXTIMESTAMP - 1
+    )
+
+
+def test_validate_type_timestamp_fail():
+    """Test that Timestamp type fails some invalid values."""
+    limit = validation.constants.Limit
+    with pytest.raises(pydantic.ValidationError):
+        pydantic.TypeAdapter(validation.types.Timestamp).validate_python(
+            limit.MINTIMESTAMP - 1
+        )
+    with pytest.raises(pydantic.ValidationError):
+        pydantic.TypeAdapter(validation.types.Timestamp).validate_python(
+            limit.MAXTIMESTAMP
+        )
+    with pytest.raises(pydantic.ValidationError):
+        pydantic.TypeAdapter(validation.types.Timestamp).validate_python(1e300)
+    with pytest.raises(pydantic.ValidationError):
+        pydantic.TypeAdapter(validation.types.Timestamp).validate_python(float("nan"))
+    with pytest.raises(pydantic.ValidationError):
+        pydantic.TypeAdapter(validation.types.Timestamp).validate_python(float("inf"))
+    with pytest.raises(pydantic.ValidationError):
+        pydantic.TypeAdapter(validation.types.Timestamp).validate_python(float("-inf"))
+    with pytest.raises(pydantic.ValidationError):
+        pydantic.TypeAdapter(validation.types.Timestamp).validate_json("NaN")
+
+
 ########################################################################################
 # Route models
 ########################################################################################
@@ -192,7 +227,7 @@ def test_validate_mqtt_acknowledgments_pass():
         [
             {
                 "success": False,
-                "timestamp": -9999999999999999.9999999999999999,
+                "timestamp": validation.constants.Limit.MINTIMESTAMP,
                 "revision": validation.constants.Limit.MAXINT4 - 1,
             }
         ]
@@ -203,6 +238,10 @@ def test_validate_mqtt_acknowledgments_fail():
     """Test that AcknowledgmentsValidator fails some invalid values."""
     with pytest.raises(pydantic.ValidationError):
         validation.mqtt.AcknowledgmentsValidator.validate_python([])
+    with pytest.raises(pydantic.ValidationError):
+        validation.mqtt.AcknowledgmentsValidator.validate_python(
+            [{"success": True, "timestamp": float("nan"), "revision": 0}]
+        )
     with pytest.raises(pydantic.ValidationError):
         validation.mqtt.AcknowledgmentsValidator.validate_python(
             {"success": True, "timestamp": 0, "revision": 0}
@@ -248,7 +287,7 @@ def test_validate_mqtt_measurements_pass():
         [
             {
                 "value": {"temperature": -9999999999999999.9999999999999999},
-                "timestamp": 9999999999999999.9999999999999999,
+                "timestamp": validation.constants.Limit.MAXTIMESTAMP - 1,
                 "revision": validation.constants.Limit.MAXINT4 - 1,
             }
         ]
@@ -259,6 +298,10 @@ def test_validate_mqtt_measurements_fail():
     """Test that MeasurementsValidator fails some invalid values."""
     with pytest.raises(pydantic.ValidationError):
         validation.mqtt.MeasurementsValidator.validate_python([])
+    with pytest.raises(pydantic.ValidationError):
+        validation.mqtt.MeasurementsValidator.validate_python(
+            [{"value": {"temperature": 0}, "timestamp": 1e300}]
+        )
     with pytest.raises(pydantic.ValidationError):
         validation.mqtt.MeasurementsValidator.validate_python(
             {"value": {"temperature": 0}, "timestamp": 0}
@@ -327,7 +370,7 @@ def test_validate_mqtt_logs_pass():
             {
                 "message": "x" * validation.constants.Limit.LARGE + "x",
                 "severity": "info",
-                "timestamp": 9999999999999999.9999999999999999,
+                "timestamp": validation.constants.Limit.MAXTIMESTAMP - 1,
                 "revision": validation.constants.Limit.MAXINT4 - 1,
             }
         ]